@@ -1,14 +1,140 @@
-from flask import Flask, request, jsonify
+import hashlib
+import io
+import json
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
 import pandas as pd
-# import io
 from flask_cors import CORS
 import process
+from job_queue import JobQueue, WorkerPool, JOB_WORKERS
+from transaction_store import DEFAULT_USER, TransactionStore, check_month
+from viz_stream import STREAM_CONTENT_TYPES, NodeStreamBuilder, format_record, negotiate_stream_mode
 
 app = Flask(__name__)
 CORS(app)  # This will enable CORS for all routes
 
-nodes = {}
-parentChildMap = {}
+# CSV rows classified per streamed chunk (?stream=ndjson|sse) and per job progress update
+STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', '50'))
+
+PARENT_TAGS_PATH = os.getenv(
+    'PARENT_TAGS_PATH',
+    r'C:\Users\harsh\OneDrive - Georgia Institute of Technology\Documents\Projects\expenses-visualizer\my-expenses-app\scripts\parenttags.txt'
+)
+
+
+def load_parent_tags():
+    # Configured path first, then the parenttags.txt shipped next to this file
+    path = PARENT_TAGS_PATH
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parenttags.txt")
+    with open(path, "r") as file:
+        return [line.strip() for line in file.readlines()]
+
+
+def classify_csv_chunks(df, allparenttags):
+    """
+    Classify the CSV STREAM_CHUNK_ROWS rows at a time, yielding
+    (first row, chunk, Document or None, error message or None) per chunk.
+    """
+    for start in range(0, len(df), STREAM_CHUNK_ROWS):
+        chunk = df.iloc[start:start + STREAM_CHUNK_ROWS]
+        try:
+            doc = process.Document(chunk, allparenttags=allparenttags)
+            doc.convert_doc_to_items()
+        except Exception as e:
+            yield start, chunk, None, f"Rows {start + 1}-{start + len(chunk)} failed: {e}"
+            continue
+        yield start, chunk, doc, None
+
+
+def upload_params(form):
+    # Who the upload belongs to, and the month for rows without a date of their own
+    return {"user": form.get('user') or DEFAULT_USER, "month": form.get('month') or None}
+
+
+def stream_csv_records(df, allparenttags, mode, params):
+    """
+    Classify the CSV chunk by chunk and yield each chunk's category and
+    transaction records (final indices) as soon as it is done, then a summary.
+    The result is stored for the uploading user before the summary goes out.
+    """
+    builder = NodeStreamBuilder()
+    totals = {"rows": 0, "items": 0, "failed": 0, "chunks": 0}
+    errors = []
+
+    for start, chunk, doc, error in classify_csv_chunks(df, allparenttags):
+        if doc is None:
+            errors.append(error)
+            yield format_record({"type": "error", "source": start, "message": error}, mode)
+            continue
+
+        totals["chunks"] += 1
+        for key in ("rows", "items", "failed"):
+            totals[key] += doc.stats.get(key, 0)
+        for record in builder.add_items(doc.items):
+            yield format_record(record, mode)
+
+    summary = builder.summary(stats=totals, errors=errors)
+    summary["upload"] = store.add_viz(params["user"], builder.nodes, builder.parent_child_map,
+                                      month=params["month"], source=params.get("filename"))
+    yield format_record(summary, mode)
+
+
+def run_csv_job(job, report_progress):
+    """Worker side of a queued upload: classify the stored CSV, reporting progress per chunk."""
+    df = pd.read_csv(io.BytesIO(job["payload"]))
+    params = json.loads(job["params"])
+    allparenttags = params.get("allparenttags") or load_parent_tags()
+
+    builder = NodeStreamBuilder()
+    totals = {"rows": 0, "items": 0, "failed": 0, "chunks": 0}
+    errors = []
+    report_progress({"rowsDone": 0, "rowsTotal": len(df), **totals})
+
+    for start, chunk, doc, error in classify_csv_chunks(df, allparenttags):
+        if doc is None:
+            errors.append(error)
+        else:
+            totals["chunks"] += 1
+            for key in ("rows", "items", "failed"):
+                totals[key] += doc.stats.get(key, 0)
+            builder.add_items(doc.items)
+        report_progress({"rowsDone": start + len(chunk), "rowsTotal": len(df), **totals})
+
+    if errors and not totals["chunks"]:
+        raise RuntimeError("; ".join(errors))
+    summary = builder.summary(stats=totals, errors=errors)
+    # Keyed by job id: if the lease ran out and another worker re-runs the job, the rows are stored once
+    upload = store.add_viz(params.get("user") or DEFAULT_USER, builder.nodes, builder.parent_child_map,
+                           month=params.get("month"), source=params.get("filename"), upload_key=job["id"])
+    return {"nodes": builder.nodes, "parentChildMap": builder.parent_child_map, "stats": summary["stats"],
+            "errors": errors, "upload": upload}
+
+
+# Every processed upload, indexed by user / month / category / date; /data reads from here
+store = TransactionStore()
+
+# Durable upload queue shared by every app process; each serving process runs its own workers
+jobs = JobQueue()
+workers = None
+
+
+def start_workers():
+    """
+    Start this process's job workers (once). Called from the serving entry points
+    rather than at import, so importing the module (tests, the debug reloader's
+    watcher process) doesn't start a second pool.
+    """
+    global workers
+    if workers is None and JOB_WORKERS > 0:
+        workers = WorkerPool(jobs, {"csv": run_csv_job}, workers=JOB_WORKERS).start()
+    return workers
+
+
+def create_app():
+    """App factory for WSGI servers (e.g. gunicorn 'app:create_app()'): starts the workers too."""
+    start_workers()
+    return app
 
 
 @app.route('/upload', methods=['POST'])
@@ -18,38 +144,147 @@ def upload_csv():
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
 
-    # If it's a CSV, we can read it directly with pandas
-    df = pd.read_csv(file)
-    print("Got the file")
+    allparenttags = load_parent_tags()
+    params = {**upload_params(request.form), "filename": file.filename}
+    try:
+        check_month(params["month"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream_mode = negotiate_stream_mode(request.args.get('stream'), request.headers.get('Accept'))
+    if stream_mode:
+        # If it's a CSV, we can read it directly with pandas
+        df = pd.read_csv(file)
+        print("Got the file")
+        return Response(stream_with_context(stream_csv_records(df, allparenttags, stream_mode, params)),
+                        mimetype=STREAM_CONTENT_TYPES[stream_mode])
+
+    # Default: store the upload and return right away; a worker classifies it
+    job_id = jobs.enqueue("csv", file.read(), {**params, "allparenttags": allparenttags})
+    print(f"Queued upload {file.filename} as job {job_id}")
+    response = jsonify({
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/jobs/{job_id}",
+        "resultUrl": f"/jobs/{job_id}/result",
+    })
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
 
-    # with open(r"C:\Users\harsh\OneDrive - Georgia Institute of Technology\Documents\Projects\expenses-visualizer\my-expense-app\scripts\tags.txt", "r") as file:
-    #     alltags = [line.strip() for line in file.readlines()]
-    parentTag_Path = r'C:\Users\harsh\OneDrive - Georgia Institute of Technology\Documents\Projects\expenses-visualizer\my-expenses-app\scripts\parenttags.txt'
 
-    with open(parentTag_Path, "r") as file:
-        allparenttags = [line.strip() for line in file.readlines()]
+def job_message(job):
+    progress = job["progress"] or {}
+    if job["status"] == "running" and progress:
+        return f"Classified {progress.get('rowsDone', 0)}/{progress.get('rowsTotal', 0)} rows"
+    return {"queued": "Waiting for a worker", "running": "Processing", "done": "Done",
+            "failed": "Failed"}.get(job["status"], job["status"])
 
-    print(allparenttags)
 
-    doc = process.Document(df, allparenttags=allparenttags)
-    doc.convert_doc_to_items()
-    doc.show_items()
-    # global nodes, parentChildMap = doc.convert_data()
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Same shape as pages/api/processing-status.ts, plus progress
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "processingId": job["jobId"],
+        "status": job["status"],
+        "message": job_message(job),
+        "progress": job["progress"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "timestamp": job["createdAt"],
+        "updatedAt": job["updatedAt"],
+    }), 200
 
-    return jsonify({"nodes": nodes, "parentChildMap": parentChildMap}), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id, with_result=True)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "failed":
+        return jsonify({"processingId": job_id, "status": "failed", "error": job["error"]}), 500
+    if job["status"] != "done":
+        return jsonify({"processingId": job_id, "status": job["status"], "message": job_message(job)}), 202
+    return jsonify({"processingId": job_id, "status": "done", **job["result"]}), 200
+
+
+def cached_json(user, build):
+    """
+    JSON response from build() with an ETag for (user's store version, query);
+    a matching If-None-Match gets a 304 without running build().
+    """
+    version = store.version(user)
+    etag = hashlib.sha1(f"{version}|{request.full_path}".encode("utf-8")).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            response = jsonify(build())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @app.route('/data', methods=['GET'])
 def get_data():
+    """
+    Stored transactions of ?user= (default user if omitted), optionally limited to
+    ?month=YYYY-MM or ?from=YYYY-MM&to=YYYY-MM, ?category= and ?dateFrom= / ?dateTo=.
+    """
+    args = request.args
+    user = args.get('user') or DEFAULT_USER
+    month_from = args.get('from') or args.get('month')
+    month_to = args.get('to') or args.get('month')
+
+    def build():
+        output, parent_child_map = store.query_viz(user, month_from=month_from, month_to=month_to,
+                                                   category=args.get('category'), date_from=args.get('dateFrom'),
+                                                   date_to=args.get('dateTo'))
+        return {"nodes": output["nodes"], "parentChildMap": parent_child_map, "user": user,
+                "months": {"from": month_from, "to": month_to}}
+
+    return cached_json(user, build)
+
+
+@app.route('/rollups', methods=['GET'])
+def get_rollups():
+    """
+    Pre-aggregated totals of ?user= per month x category (total, count, min,
+    max) plus per-category / per-month sums, for the same month / category
+    filters as /data. Read from the rollup table, so the cost doesn't grow
+    with the number of stored transactions.
+    """
+    args = request.args
+    user = args.get('user') or DEFAULT_USER
+    month_from = args.get('from') or args.get('month')
+    month_to = args.get('to') or args.get('month')
+
+    def build():
+        rollups = store.rollups(user, month_from=month_from, month_to=month_to, category=args.get('category'))
+        category_totals, month_totals = {}, {}
+        for rollup in rollups:
+            category_totals[rollup["category"]] = category_totals.get(rollup["category"], 0) + rollup["total"]
+            month_totals[rollup["month"]] = month_totals.get(rollup["month"], 0) + rollup["total"]
+        return {
+            "user": user,
+            "months": {"from": month_from, "to": month_to},
+            "rollups": rollups,
+            "categoryTotals": {category: round(total, 2) for category, total in category_totals.items()},
+            "monthTotals": {month: round(total, 2) for month, total in month_totals.items()},
+            "total": round(sum(month_totals.values()), 2),
+            "count": sum(rollup["count"] for rollup in rollups),
+        }
 
-    print("The nodes are:", nodes)
-    print("The parentChildMap is:", parentChildMap)
-    # Assuming you have a way to store or retrieve the processed data
-    # For example, you might store it in a global variable or a database
-    # Here, we'll assume you have a function to get the latest processed data
-    # nodes, parent_child_map = get_latest_processed_data()
-    return jsonify({"nodes": nodes, "parentChildMap": parentChildMap}), 200
+    return cached_json(user, build)
 
 
 if __name__ == "__main__":
+    # With debug=True the reloader re-runs this file in a child process that does the
+    # serving; only that one (WERKZEUG_RUN_MAIN set) should run workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_workers()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark: batch merge of per-PDF results.
+Compares the previous lambda_handler merge loop (offset from max() over all
+nodes after every PDF, set-rebuilt child lists) with batch_merge.BatchMerger
+on synthetic results.
+
+    python benchmarks/bench_batch_merge.py --pdfs 100 250 500 --transactions 80
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda_code"))
+
+from batch_merge import BatchMerger  # noqa: E402
+
+CATEGORIES = [
+    "Food & Dining", "Travel", "Shopping", "Entertainment & Recreation", "Healthcare & Medical",
+    "Transportation", "Education", "Insurance", "Personal Care", "Home & Utilities",
+    "Technology & Electronics", "Subscriptions", "Gifts & Donations", "Miscellaneous",
+]
+
+
+def synthetic_result(rng, transactions):
+    """One PDF's (nodes, parent_child_map) in convert_data_to_viz layout."""
+    nodes = [{"name": "Expenses", "index": 0}]
+    parent_child_map = {}
+    categories = {}
+    for i in range(transactions):
+        category = rng.choice(CATEGORIES)
+        if category not in categories:
+            categories[category] = len(nodes)
+            nodes.append({"name": category, "index": len(nodes)})
+            parent_child_map[categories[category]] = []
+        parent_child_map[categories[category]].append(len(nodes))
+        nodes.append({"name": f"Merchant {i}", "cost": round(rng.uniform(1, 200), 2), "index": len(nodes),
+                      "date": "01/15", "location": "Unknown", "file_source": "bench"})
+    return nodes, parent_child_map
+
+
+def legacy_merge(results):
+    """The merge loop lambda_handler used before BatchMerger."""
+    all_nodes = []
+    combined_parent_child_map = {}
+    node_offset = 1
+    for nodes, parent_child_map in results:
+        for node in nodes:
+            if node['index'] != 0:
+                node['index'] += node_offset
+        adjusted_map = {}
+        for parent_idx, children in parent_child_map.items():
+            adjusted_parent = int(parent_idx) + node_offset if int(parent_idx) != 0 else 0
+            adjusted_map[adjusted_parent] = [child + node_offset if child != 0 else 0 for child in children]
+        all_nodes.extend([n for n in nodes if n['index'] != 0])
+        for p_idx, children in adjusted_map.items():
+            if p_idx in combined_parent_child_map:
+                combined_parent_child_map[p_idx] = list({*combined_parent_child_map[p_idx], *children})
+            else:
+                combined_parent_child_map[p_idx] = list(children)
+        node_offset = max(n['index'] for n in all_nodes) + 1
+    all_nodes.insert(0, {"name": "Expenses", "index": 0, "cost": sum(n.get('cost', 0) for n in all_nodes)})
+    return all_nodes, combined_parent_child_map
+
+
+def merger_merge(results):
+    merger = BatchMerger()
+    for nodes, parent_child_map in results:
+        merger.add(nodes, parent_child_map)
+    return merger.result()
+
+
+def best_of(fn, results, repeat):
+    """Best wall time over repeat runs (fresh copies, both merges mutate their input)."""
+    best = float("inf")
+    output = None
+    for _ in range(repeat):
+        data = copy.deepcopy(results)
+        started = time.perf_counter()
+        output = fn(data)
+        best = min(best, time.perf_counter() - started)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch merge micro-benchmark")
+    parser.add_argument("--pdfs", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--transactions", type=int, default=80, help="transactions per PDF")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'pdfs':>6} {'nodes':>8} {'legacy ms':>10} {'merger ms':>10} {'speedup':>8} "
+          f"{'legacy cats':>12} {'merged cats':>12}")
+    for pdf_count in args.pdfs:
+        rng = random.Random(args.seed)
+        results = [synthetic_result(rng, args.transactions) for _ in range(pdf_count)]
+
+        legacy_time, (legacy_nodes, legacy_map) = best_of(legacy_merge, results, args.repeat)
+        merger_time, (nodes, parent_child_map) = best_of(merger_merge, results, args.repeat)
+
+        expected = round(sum(n.get("cost", 0) for nodes_, _ in results for n in nodes_), 2)
+        assert round(nodes[0]["cost"], 2) == expected, "root total mismatch"
+        assert all(node["index"] == position for position, node in enumerate(nodes)), "indices not positional"
+
+        print(f"{pdf_count:>6} {len(nodes):>8} {legacy_time * 1000:>10.1f} {merger_time * 1000:>10.1f} "
+              f"{legacy_time / merger_time:>7.1f}x {len(legacy_map):>12} {len(parent_child_map):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+End-to-end benchmark of the Python pipeline against a local OpenAI stand-in.
+
+Stages:
+    read_pdf        readPdf.extract_text_from_pdf_bytes
+    process_amz     process_amz.Document: text -> items -> nodes
+    process_csv     process.Document: CSV -> items
+    lambda_single   lambda_function.lambda_handler, one PDF
+    lambda_batch    lambda_function.lambda_handler, --pdfs PDFs
+
+Reports per-stage latency percentiles, throughput (transactions/s), peak
+traced memory and LLM requests/tokens per run. Stages whose imports fail
+are reported as skipped; a stage with any failed run (an error status, a
+PDF or CSV row that errored) is reported as failed, with no timings, and
+the script exits non-zero.
+
+    python benchmarks/bench_pipeline.py --transactions 300 --latency-ms 400 --iterations 5
+    python benchmarks/bench_pipeline.py --layout generic --record replies.json
+    python benchmarks/bench_pipeline.py --layout generic --replay replies.json --json results.json
+
+Memo, classifier model and result cache are disabled so every iteration
+does the full work; use --warm to keep them.
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_code"))
+
+import synthetic  # noqa: E402
+from mock_openai import MockOpenAIServer  # noqa: E402
+
+STAGES = ["read_pdf", "process_amz", "process_csv", "lambda_single", "lambda_batch"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_tags():
+    with open(os.path.join(HERE, "..", "lambda_code", "parenttags.txt"), "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def check_response(response):
+    """Raise unless a lambda_handler response is a 200 with no failed PDFs."""
+    if response["statusCode"] != 200:
+        raise RuntimeError(f"lambda_handler returned {response['statusCode']}: {response['body'][:200]}")
+    # A batch answers 200 even when some (or all) of its PDFs failed
+    errors = json.loads(response["body"]).get("stats", {}).get("errors")
+    if errors:
+        raise RuntimeError(f"{len(errors)} PDF(s) failed: {json.dumps(errors[0])[:200]}")
+    return response
+
+
+def build_stages(args, tags):
+    """stage name -> (callable, transactions per run) or (None, skip reason)."""
+    pdf = synthetic.statement_pdf(args.transactions, args.layout, seed=args.seed)
+    text = synthetic.statement_text(args.transactions, args.layout, seed=args.seed)
+    csv_text = synthetic.statement_csv(args.transactions, args.layout, seed=args.seed)
+    batch = [base64.b64encode(synthetic.statement_pdf(args.transactions, args.layout, seed=args.seed + i)).decode()
+             for i in range(args.pdfs)]
+    stages = {}
+
+    try:
+        from readPdf import extract_text_from_pdf_bytes
+        stages["read_pdf"] = (lambda: extract_text_from_pdf_bytes(pdf), args.transactions)
+    except ImportError as e:
+        stages["read_pdf"] = (None, f"import failed: {e}")
+
+    try:
+        import process_amz
+
+        def run_amz():
+            doc = process_amz.Document(text, allparenttags=tags)
+            doc.convert_text_to_items()
+            return doc.convert_data_to_viz()
+        stages["process_amz"] = (run_amz, args.transactions)
+    except ImportError as e:
+        stages["process_amz"] = (None, f"import failed: {e}")
+
+    try:
+        import pandas as pd
+        import process
+
+        def run_csv():
+            doc = process.Document(pd.read_csv(io.StringIO(csv_text)), allparenttags=tags)
+            doc.convert_doc_to_items()
+            if doc.stats.get("failed"):
+                raise RuntimeError(f"{doc.stats['failed']} of {doc.stats['rows']} CSV rows failed")
+            return doc.items
+        stages["process_csv"] = (run_csv, args.transactions)
+    except ImportError as e:
+        stages["process_csv"] = (None, f"import failed: {e}")
+
+    try:
+        import lambda_function
+
+        def run_lambda(event):
+            return check_response(lambda_function.lambda_handler(event, None))
+        stages["lambda_single"] = (lambda: run_lambda({"body": batch[0], "isBase64Encoded": True}), args.transactions)
+        stages["lambda_batch"] = (lambda: run_lambda({"pdfs": batch}), args.transactions * args.pdfs)
+    except ImportError as e:
+        stages["lambda_single"] = stages["lambda_batch"] = (None, f"import failed: {e}")
+
+    return stages
+
+
+def run_stage(fn, iterations, server, quiet=True, warmup=1):
+    """Untimed warm-up runs, timed iterations, then one traced run for peak memory."""
+    sink = io.StringIO()
+    redirect = contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext()
+    timings = []
+    with redirect:
+        for _ in range(warmup):
+            fn()
+        server.reset_counters()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        usage = server.reset_counters()
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        server.reset_counters()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p90_ms": percentile(timings, 90) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "peak_mb": peak / (1024 * 1024),
+        "requests": usage["requests"] / iterations,
+        "prompt_tokens": usage["prompt_tokens"] / iterations,
+        "completion_tokens": usage["completion_tokens"] / iterations,
+        "replay_misses": usage["replay_misses"],
+        "rate_limited": usage["rate_limited"] / iterations,
+    }
+
+
+def print_report(report):
+    print(f"{'stage':<14} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'tx/s':>9} {'peak MB':>8} "
+          f"{'llm req':>8} {'prompt tok':>11} {'compl tok':>10}")
+    for stage, result in report["stages"].items():
+        if "skipped" in result:
+            print(f"{stage:<14} skipped: {result['skipped']}")
+            continue
+        if "error" in result:
+            print(f"{stage:<14} failed: {result['error']}")
+            continue
+        print(f"{stage:<14} {result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+              f"{result['throughput_tps']:>9.1f} {result['peak_mb']:>8.2f} {result['requests']:>8.1f} "
+              f"{result['prompt_tokens']:>11.0f} {result['completion_tokens']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with a mock OpenAI server")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--transactions", type=int, default=200, help="transactions per statement")
+    parser.add_argument("--pdfs", type=int, default=4, help="PDFs per lambda_batch run")
+    parser.add_argument("--layout", choices=["amex", "generic"], default="amex",
+                        help="amex hits the fast paths, generic forces LLM extraction")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per stage (imports, client setup)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mock latency per completion")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rpm-limit", type=int, default=0, help="mock answers 429 above this many requests/minute")
+    parser.add_argument("--record", help="store mock replies to this file")
+    parser.add_argument("--replay", help="serve mock replies from this file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="keep memo, classifier model and result cache enabled")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="don't silence pipeline output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    with MockOpenAIServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          record_path=args.record, replay_path=args.replay, rpm_limit=args.rpm_limit) as server:
+        # The SDK reads these when the pipeline modules create their client
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        if not args.warm:
+            os.environ["MERCHANT_MEMO_DISABLED"] = "1"
+            os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+            os.environ["CATEGORY_MODEL_PATH"] = os.path.join(tempfile.mkdtemp(), "no_model.npz")
+
+        tags = load_tags()
+        stages = build_stages(args, tags)
+
+        report = {"config": vars(args), "stages": {}}
+        for stage in args.stages:
+            fn, extra = stages[stage]
+            if fn is None:
+                report["stages"][stage] = {"skipped": extra}
+                continue
+            try:
+                result = run_stage(fn, args.iterations, server, quiet=not args.verbose, warmup=args.warmup)
+            except Exception as e:
+                report["stages"][stage] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            result["transactions"] = extra
+            result["throughput_tps"] = extra / (result["mean_ms"] / 1000) if result["mean_ms"] else 0.0
+            report["stages"][stage] = result
+
+    print(f"{args.transactions} transactions/statement, layout {args.layout}, "
+          f"mock latency {args.latency_ms:.0f}ms, {args.iterations} iterations")
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if any("error" in result for result in report["stages"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Local OpenAI-compatible stand-in for benchmarks.
+Serves POST /v1/chat/completions with configurable latency and produces
+plausible replies for every prompt shape the pipeline sends:
+
+    transactions_list     (process_amz extraction)      - parsed from the dated lines in the prompt
+    categorized_rows      (process CSV batches)         - one record per {"id", "row"} line
+    merchant_categories   (fast-path categorization)    - one record per {"id", "merchant"} line
+    no response_format    (process.Item.setdetails)     - "name: / cost: / index: / parenttag:" text
+
+Quota: with --rpm-limit N the server answers 429 with a Retry-After
+header once more than N requests arrive within a minute, like the real API.
+
+Record/replay: with --record FILE every reply is stored under a hash of
+the request body; with --replay FILE stored replies are served instead
+(unknown requests fall back to generated replies and are counted as misses).
+
+Run standalone:
+    python benchmarks/mock_openai.py --port 8765 --latency-ms 300
+and point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_TAGS = ["Food & Dining", "Travel", "Shopping", "Entertainment & Recreation", "Transportation"]
+
+_LINE_RE = re.compile(
+    r"(?P<date>\d{1,2}/\d{1,2}(?:/\d{2,4})?)\*?[\s|]+(?P<description>.+?)[\s|]+\(?-?\$?(?P<amount>\d{1,3}(?:,\d{3})*\.\d{2})\)?-?\s*$"
+)
+_ID_LINE_RE = re.compile(r"^\{.*\"id\":\s*\d+.*\}$")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _pick(tags: List[str], text: str) -> str:
+    # Stable per text, independent of PYTHONHASHSEED
+    return tags[zlib.crc32(text.encode("utf-8")) % len(tags)]
+
+
+def _tags(prompt: str, response_format: Optional[dict]) -> List[str]:
+    try:
+        enum = response_format["json_schema"]["schema"]["properties"]["records"]["items"]["properties"]["parenttag"]["enum"]
+        if enum:
+            return enum
+    except (KeyError, TypeError):
+        pass
+    match = re.search(r"from this list: (\[.*?\])", prompt)
+    if match:
+        try:
+            tags = [tag for tag in ast.literal_eval(match.group(1)) if tag]
+            if tags:
+                return tags
+        except (ValueError, SyntaxError):
+            pass
+    return DEFAULT_TAGS
+
+
+def generate_reply(body: dict) -> str:
+    """Deterministic reply content for one chat.completions request."""
+    prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+    response_format = body.get("response_format")
+    name = (response_format or {}).get("json_schema", {}).get("name")
+    tags = _tags(prompt, response_format)
+
+    if name == "transactions_list":
+        transactions = []
+        for line in prompt.splitlines():
+            match = _LINE_RE.search(line.strip())
+            if not match:
+                continue
+            description = match.group("description").strip()
+            transactions.append({
+                "name": description.title()[:40],
+                "price": float(match.group("amount").replace(",", "")),
+                "date": match.group("date"),
+                "parenttag": _pick(tags, description),
+                "index": len(transactions),
+                "raw_str": line.strip(),
+                "location": "Unknown",
+                "file_source": "mock",
+            })
+        return json.dumps({"transactions": transactions})
+
+    if name in ("categorized_rows", "merchant_categories"):
+        records = []
+        for line in prompt.splitlines():
+            line = line.strip()
+            if not _ID_LINE_RE.match(line):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if name == "merchant_categories":
+                merchant = str(entry.get("merchant", ""))
+                records.append({"id": entry["id"], "name": merchant.title()[:40], "parenttag": _pick(tags, merchant)})
+            else:
+                row = entry.get("row", {})
+                description = str(row.get("Description") or row.get("Merchant") or next(iter(row.values()), ""))
+                try:
+                    cost = abs(float(str(row.get("Amount", row.get("Debit", "0"))).replace("$", "").replace(",", "")))
+                except ValueError:
+                    cost = 0.0
+                records.append({"id": entry["id"], "name": description.title()[:40], "cost": cost,
+                                "parenttag": _pick(tags, description)})
+        return json.dumps({"records": records})
+
+    # Free-text single-row prompt
+    match = re.search(r"Description\s+(.+)", prompt)
+    description = match.group(1).strip() if match else "Unknown"
+    amount = re.search(r"Amount\s+(-?[\d.,]+)", prompt)
+    return (f"name: {description.title()[:40]}\n"
+            f"cost: {amount.group(1).replace(',', '') if amount else '0'}\n"
+            f"index: 0\n"
+            f"parenttag: {_pick(tags, description)}\n")
+
+
+class MockOpenAIServer:
+    """
+    Threaded mock server; usable as a context manager from the benchmark runner.
+
+    Args:
+        latency_ms: Fixed delay added to every completion
+        jitter_ms: Extra uniform-ish delay (deterministic per request)
+        record_path: Write every reply keyed by request hash here on stop()
+        replay_path: Serve stored replies from this file when available
+        rpm_limit: Answer 429 + Retry-After above this many requests per minute (0 = no limit)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 record_path: Optional[str] = None, replay_path: Optional[str] = None, rpm_limit: int = 0):
+        self.latency_ms = latency_ms
+        self.rpm_limit = rpm_limit
+        self.window = deque()
+        self.jitter_ms = jitter_ms
+        self.record_path = record_path
+        self.recorded = {}
+        self.replay = {}
+        if replay_path:
+            with open(replay_path, "r") as f:
+                self.replay = json.load(f)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "replay_hits": 0, "replay_misses": 0,
+                         "rate_limited": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reset_counters(self) -> dict:
+        """Return and zero the counters (per-stage token accounting)."""
+        with self.lock:
+            counters = dict(self.counters)
+            for key in self.counters:
+                self.counters[key] = 0
+        return counters
+
+    def admit(self) -> Optional[float]:
+        """None if the request fits the RPM window, else seconds until it would."""
+        if not self.rpm_limit:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] >= 60:
+                self.window.popleft()
+            if len(self.window) >= self.rpm_limit:
+                self.counters["rate_limited"] += 1
+                return 60 - (now - self.window[0])
+            self.window.append(now)
+        return None
+
+    def complete(self, raw_body: bytes) -> dict:
+        body = json.loads(raw_body or b"{}")
+        key = hashlib.sha256(raw_body).hexdigest()
+        content = self.replay.get(key)
+        with self.lock:
+            if self.replay:
+                self.counters["replay_hits" if content is not None else "replay_misses"] += 1
+        if content is None:
+            content = generate_reply(body)
+        if self.record_path is not None:
+            with self.lock:
+                self.recorded[key] = content
+
+        delay = self.latency_ms + (zlib.crc32(raw_body) % 1000) / 1000 * self.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in body.get("messages", []))
+        completion_tokens = estimate_tokens(content)
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["completion_tokens"] += completion_tokens
+        return {
+            "id": f"chatcmpl-mock-{key[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                raw_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"unsupported path {self.path}"}})
+                    return
+                wait = server.admit()
+                if wait is not None:
+                    self._send(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                               "code": "rate_limit_exceeded"}},
+                               {"retry-after-ms": str(int(wait * 1000))})
+                    return
+                self._send(200, server.complete(raw_body))
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockOpenAIServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.record_path is not None:
+            with open(self.record_path, "w") as f:
+                json.dump(self.recorded, f)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat.completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--record", help="store replies to this JSON file on exit")
+    parser.add_argument("--replay", help="serve stored replies from this JSON file")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="answer 429 above this many requests per minute")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.record, args.replay,
+                              args.rpm_limit)
+    print(f"Mock OpenAI listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        if args.record:
+            with open(args.record, "w") as f:
+                json.dump(server.recorded, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Synthetic statements for benchmarks: PDF (minimal writer, no extra
+dependencies) and CSV exports of configurable size.
+
+Layouts:
+    amex     - matches the statement_formats fast path (issuer marker + MM/DD/YY lines)
+    generic  - no issuer marker, so the LLM extraction path is exercised
+"""
+
+import csv
+import io
+import random
+from typing import List, Tuple
+
+MERCHANTS = [
+    ("UBER TRIP HELP.UBER.COM CA", "Transportation"),
+    ("STARBUCKS STORE 01234 ATLANTA GA", "Food & Dining"),
+    ("WHOLEFDS MKT 10234 ATLANTA GA", "Food & Dining"),
+    ("AMAZON MKTPLACE PMTS AMZN.COM/BILL WA", "Shopping"),
+    ("NETFLIX.COM LOS GATOS CA", "Entertainment & Recreation"),
+    ("DELTA AIR LINES ATLANTA GA", "Travel"),
+    ("CVS/PHARMACY #1234 DECATUR GA", "Healthcare & Medical"),
+    ("GEORGIA POWER ATLANTA GA", "Home & Utilities"),
+    ("APPLE.COM/BILL CUPERTINO CA", "Technology & Electronics"),
+    ("GEICO AUTO INSURANCE", "Insurance"),
+    ("GREAT CLIPS #4411 ATLANTA GA", "Personal Care"),
+    ("COURSERA.ORG MOUNTAIN VIEW CA", "Education"),
+    ("SQ *JOES COFFEE DECATUR GA", "Food & Dining"),
+    ("SHELL OIL 57444 ATLANTA GA", "Transportation"),
+]
+
+HEADER_LINES = [
+    "Customer Service 1-800-555-0100",
+    "Account Ending 1-23456",
+    "Page {page} of {pages}",
+]
+
+FOOTER_LINES = [
+    "Please see reverse side for important information",
+]
+
+
+def transactions(count: int, seed: int = 0) -> List[Tuple[str, str, float]]:
+    """(date MM/DD/YY, description, amount) tuples, reproducible per seed."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        merchant, _ = MERCHANTS[rng.randrange(len(MERCHANTS))]
+        month = 1 + (i * 12 // max(count, 1)) % 12
+        day = 1 + rng.randrange(28)
+        rows.append((f"{month:02d}/{day:02d}/24", merchant, round(rng.uniform(2, 400), 2)))
+    return rows
+
+
+def statement_pages(count: int, layout: str = "amex", lines_per_page: int = 40, seed: int = 0) -> List[List[str]]:
+    """Statement text as pages of lines, with repeated header/footer boilerplate."""
+    body = [f"{date} {description} ${amount:,.2f}" for date, description, amount in transactions(count, seed)]
+    per_page = max(1, lines_per_page - len(HEADER_LINES) - len(FOOTER_LINES))
+    chunks = [body[start:start + per_page] for start in range(0, len(body), per_page)] or [[]]
+
+    pages = []
+    for number, chunk in enumerate(chunks, start=1):
+        header = [line.format(page=number, pages=len(chunks)) for line in HEADER_LINES]
+        if layout == "amex":
+            header.insert(0, "American Express  americanexpress.com")
+        else:
+            header.insert(0, "Monthly Card Statement")
+        pages.append(header + chunk + FOOTER_LINES)
+    return pages
+
+
+def statement_text(count: int, layout: str = "amex", seed: int = 0) -> str:
+    return "\f".join("\n".join(page) for page in statement_pages(count, layout, seed=seed))
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """Minimal valid PDF (Helvetica text, one content stream per page) that pypdf can extract."""
+    objects = []
+    page_count = len(pages)
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count))
+    font_id = 3 + 2 * page_count
+    objects.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>")
+    for i, lines in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        body = "BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = io.StringIO()
+    out.write("%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{obj}\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n")
+    out.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+    return out.getvalue().encode("latin-1")
+
+
+def statement_pdf(count: int, layout: str = "amex", seed: int = 0) -> bytes:
+    return make_pdf(statement_pages(count, layout, seed=seed))
+
+
+def statement_csv(count: int, layout: str = "amex", seed: int = 0) -> str:
+    """
+    CSV export. "amex" has the Date/Description/Amount/Reference headers the
+    fast path recognizes; "generic" only Date/Description/Amount.
+    """
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if layout == "amex":
+        writer.writerow(["Date", "Description", "Amount", "Reference"])
+        for i, (date, description, amount) in enumerate(transactions(count, seed)):
+            writer.writerow([date, description, f"{amount:.2f}", f"'3201{i:08d}'"])
+    else:
+        writer.writerow(["Date", "Description", "Amount"])
+        for date, description, amount in transactions(count, seed):
+            writer.writerow([date, description, f"{amount:.2f}"])
+    return out.getvalue()
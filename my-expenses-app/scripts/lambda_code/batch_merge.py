@@ -0,0 +1,97 @@
+"""
+Linear-time merge of per-PDF results into one expense graph.
+Each PDF's (nodes, parent_child_map) is folded in with a running offset -
+new nodes simply go to the end of the combined list, so a node's index is
+its position - and categories with the same name across PDFs become one
+node whose cost is the sum of all its transactions.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+class BatchMerger:
+    """
+    Accumulates per-PDF results in the order they are added.
+
+    Child order is stable: a category's children are its transactions from
+    earlier PDFs first, each PDF's in that PDF's own order.
+    """
+
+    def __init__(self, root_name: str = "Expenses"):
+        self.nodes: List[dict] = [{"name": root_name, "index": 0, "cost": 0.0}]
+        self.parent_child_map: Dict[int, List[int]] = {}
+        self.categories: Dict[str, dict] = {}
+        self.pdfs_merged = 0
+
+    @property
+    def root(self) -> dict:
+        return self.nodes[0]
+
+    def _append(self, node: dict) -> int:
+        node["index"] = len(self.nodes)
+        self.nodes.append(node)
+        return node["index"]
+
+    def add(self, nodes: List[dict], parent_child_map: Dict) -> Tuple[List[dict], Dict[int, List[int]]]:
+        """
+        Merge one PDF's result (its nodes are re-indexed in place).
+
+        Returns:
+            Tuple of (nodes added by this PDF, {category index: children added by this PDF});
+            category nodes appear in the first list only when newly created
+        """
+        by_index = {int(node["index"]): node for node in nodes}
+        added: List[dict] = []
+        added_map: Dict[int, List[int]] = {}
+        # Tracked by identity: placed nodes get new indices as they go
+        placed = {id(by_index[0])} if 0 in by_index else set()
+
+        for parent_idx, children in parent_child_map.items():
+            parent_idx = int(parent_idx)
+            if parent_idx == 0:
+                continue
+            source = by_index[parent_idx]
+            placed.add(id(source))
+            category = self.categories.get(source["name"])
+            if category is None:
+                category = {"name": source["name"], "cost": 0.0}
+                self._append(category)
+                self.categories[category["name"]] = category
+                self.parent_child_map[category["index"]] = []
+                added.append(category)
+
+            new_children = added_map.setdefault(category["index"], [])
+            for child in children:
+                node = by_index[int(child)]
+                placed.add(id(node))
+                self.parent_child_map[category["index"]].append(self._append(node))
+                new_children.append(node["index"])
+                cost = node.get("cost", 0) or 0
+                category["cost"] += cost
+                self.root["cost"] += cost
+                added.append(node)
+
+        # Nodes outside the category tree are kept (re-indexed) rather than dropped
+        for node in nodes:
+            if id(node) not in placed:
+                placed.add(id(node))
+                self._append(node)
+                added.append(node)
+
+        self.pdfs_merged += 1
+        return added, added_map
+
+    def result(self) -> Tuple[List[dict], Dict[int, List[int]]]:
+        return self.nodes, self.parent_child_map
+
+    def category_totals(self) -> Dict[int, float]:
+        return {category["index"]: category["cost"] for category in self.categories.values()}
+
+
+def merge_results(results: List[Optional[Tuple[list, dict]]], root_name: str = "Expenses") -> Tuple[List[dict], Dict[int, List[int]]]:
+    """Merge per-PDF (nodes, parent_child_map) results in list order, skipping None (failed PDFs)."""
+    merger = BatchMerger(root_name)
+    for result in results:
+        if result is not None:
+            merger.add(*result)
+    return merger.result()
@@ -0,0 +1,311 @@
+"""
+PDF inputs for lambda_handler without extra copies. A PDF can be an inline
+base64 string (as before) or a reference to an object in a blob store:
+
+    {"pdfs": ["JVBERi0...", {"ref": "s3://bucket/statements/2024-03.pdf"}, {"ref": "local://march.pdf"}]}
+
+Referenced objects never pass through the event (no size limit, no base64)
+and are memory-mapped, so pypdf reads them straight from the page cache;
+S3 objects are streamed to a temp file first. Base64 strings are decoded
+chunk by chunk into pooled buffers that are reused across PDFs and warm
+invocations. Either way, close() releases a PDF's bytes as soon as it is
+processed.
+
+Configuration (environment):
+    BLOB_STORE              store for refs without a scheme: "local" (default) or "s3"
+    BLOB_LOCAL_DIR          root of the local-directory store (local://key)
+    BLOB_S3_BUCKET          bucket for scheme-less refs when BLOB_STORE=s3
+    BLOB_S3_ALLOWED_BUCKETS comma-separated buckets s3:// refs may name besides BLOB_S3_BUCKET
+                            (any other bucket is rejected: refs come from the caller, reads use
+                            the function's credentials)
+    BLOB_TMP_DIR            where S3 objects are spooled before mapping (default: system temp)
+    DECODE_POOL_MAX_BYTES   decode buffers kept for reuse (default 64 MB)
+"""
+
+import base64
+import binascii
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+from lazy_imports import lazy_import
+
+logger = logging.getLogger(__name__)
+
+boto3 = lazy_import("boto3")
+
+BLOB_STORE = os.getenv('BLOB_STORE', 'local')
+BLOB_LOCAL_DIR = os.getenv('BLOB_LOCAL_DIR', os.path.join(tempfile.gettempdir(), "expenses-blobs"))
+BLOB_S3_BUCKET = os.getenv('BLOB_S3_BUCKET', '')
+BLOB_S3_ALLOWED_BUCKETS = frozenset(bucket.strip() for bucket in os.getenv('BLOB_S3_ALLOWED_BUCKETS', '').split(',')
+                                    if bucket.strip())
+BLOB_TMP_DIR = os.getenv('BLOB_TMP_DIR') or None
+DECODE_POOL_MAX_BYTES = int(os.getenv('DECODE_POOL_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Base64 characters decoded per step (a multiple of 4, so chunks decode independently)
+DECODE_CHUNK_CHARS = 256 * 1024
+# Buffer sizes are rounded up to this, so similar-sized PDFs share buffers
+DECODE_BUFFER_ALIGN = 256 * 1024
+
+
+class PdfInput:
+    """
+    One PDF's bytes: `data` is bytes, a memoryview into a pooled buffer or
+    an mmap - all accepted by hashlib, len() and readPdf. close() returns
+    the buffer to its pool / unmaps the file.
+    """
+
+    def __init__(self, data: Any, release=None, source: str = "inline"):
+        self.data = data
+        self.size = len(data)
+        self.source = source
+        self._release = release
+
+    def close(self) -> None:
+        release, self._release = self._release, None
+        data, self.data = self.data, b""
+        if isinstance(data, memoryview):
+            data.release()
+        if release is not None:
+            release()
+
+    def __enter__(self) -> "PdfInput":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def map_file(path: str, delete: bool = False, source: str = "file") -> PdfInput:
+    """Memory-map a file read-only; with delete, the file is unlinked once mapped (the mapping keeps it)."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            raise ValueError(f"Blob {source} is empty")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if delete:
+        os.unlink(path)
+
+    def unmap():
+        try:
+            mapped.close()
+        except BufferError:
+            # Something still holds a view; the mapping goes when that is collected
+            logger.warning(f"Blob {source} still referenced at close")
+
+    return PdfInput(mapped, unmap, source)
+
+
+class LocalBlobStore:
+    """Directory stand-in for a blob store: key = path relative to root."""
+
+    def __init__(self, root: str = BLOB_LOCAL_DIR):
+        self.root = os.path.realpath(root)
+
+    def path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"Blob key {key!r} is outside the store")
+        return path
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def open(self, key: str) -> PdfInput:
+        path = self.path(key)
+        if not os.path.isfile(path):
+            raise ValueError(f"Blob local://{key} not found")
+        return map_file(path, source=f"local://{key}")
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+        return f"local://{key}"
+
+
+class S3BlobStore:
+    """S3 bucket (boto3, imported on first use); objects are streamed to a temp file and mapped."""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                self._client = boto3.client("s3")
+            except ImportError as e:
+                raise ValueError(f"s3:// refs need boto3: {e}")
+        return self._client
+
+    def size(self, key: str) -> Optional[int]:
+        # Unknown without a HEAD request per object; only used to order work
+        return None
+
+    def open(self, key: str) -> PdfInput:
+        fd, path = tempfile.mkstemp(prefix="blob-", suffix=".pdf", dir=BLOB_TMP_DIR)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                self.client.download_fileobj(self.bucket, key, file)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return map_file(path, delete=True, source=f"s3://{self.bucket}/{key}")
+
+    def put(self, key: str, data: bytes) -> str:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+        return f"s3://{self.bucket}/{key}"
+
+
+_STORES: Dict[str, Union[LocalBlobStore, S3BlobStore]] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def parse_ref(ref: str):
+    """
+    (store name, bucket, key) for "s3://bucket/key", "local://key" or a bare
+    key (BLOB_STORE). s3:// refs must name BLOB_S3_BUCKET or one of
+    BLOB_S3_ALLOWED_BUCKETS; raises ValueError otherwise.
+    """
+    bucket = None
+    if ref.startswith("s3://"):
+        bucket, _, key = ref[len("s3://"):].partition("/")
+        if not bucket or (bucket != BLOB_S3_BUCKET and bucket not in BLOB_S3_ALLOWED_BUCKETS):
+            raise ValueError(f"Blob ref {ref!r} names a bucket that is not allowed "
+                             f"(set BLOB_S3_BUCKET or BLOB_S3_ALLOWED_BUCKETS)")
+        name = f"s3:{bucket}"
+    elif ref.startswith("local://"):
+        key, name = ref[len("local://"):], "local"
+    elif "://" in ref:
+        raise ValueError(f"Unsupported blob ref {ref!r} (expected s3:// or local://)")
+    elif BLOB_STORE == "s3":
+        if not BLOB_S3_BUCKET:
+            raise ValueError("BLOB_STORE=s3 needs BLOB_S3_BUCKET for refs without a bucket")
+        bucket, key, name = BLOB_S3_BUCKET, ref, f"s3:{BLOB_S3_BUCKET}"
+    else:
+        key, name = ref, "local"
+    if not key:
+        raise ValueError(f"Blob ref {ref!r} has no key")
+    return name, bucket, key
+
+
+def store_for(ref: str):
+    """(store, key) for a blob ref (see parse_ref)."""
+    name, bucket, key = parse_ref(ref)
+    with _STORES_LOCK:
+        store = _STORES.get(name)
+        if store is None:
+            store = _STORES[name] = S3BlobStore(bucket) if name.startswith("s3:") else LocalBlobStore()
+    return store, key
+
+
+class DecodeBufferPool:
+    """
+    Reusable bytearrays for base64 decoding. acquire() hands out the
+    smallest free buffer that fits (or a new one); release() keeps it for
+    the next PDF, up to max_bytes in total.
+    """
+
+    def __init__(self, max_bytes: int = DECODE_POOL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+        self._counters = {"reused": 0, "allocated": 0}
+
+    def acquire(self, size: int) -> bytearray:
+        with self._lock:
+            fits = [buffer for buffer in self._free if len(buffer) >= size]
+            if fits:
+                buffer = min(fits, key=len)
+                self._free.remove(buffer)
+                self._counters["reused"] += 1
+                return buffer
+            self._counters["allocated"] += 1
+        return bytearray(-(-max(size, 1) // DECODE_BUFFER_ALIGN) * DECODE_BUFFER_ALIGN)
+
+    def release(self, buffer: bytearray) -> None:
+        with self._lock:
+            self._free.append(buffer)
+            total = sum(len(free) for free in self._free)
+            while self._free and total > self.max_bytes:
+                largest = max(self._free, key=len)
+                self._free.remove(largest)
+                total -= len(largest)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "pooled_bytes": sum(len(buffer) for buffer in self._free)}
+
+
+_DECODE_BUFFERS = DecodeBufferPool()
+
+
+def b64decode_pooled(text: str, pool: Optional[DecodeBufferPool] = None) -> PdfInput:
+    """
+    Decode base64 into a pooled buffer, one chunk at a time (no full-size
+    intermediate bytes). Input with whitespace or other stray characters
+    falls back to base64.b64decode; invalid base64 raises like it does.
+    """
+    pool = pool or _DECODE_BUFFERS
+    buffer = pool.acquire(len(text) * 3 // 4)
+    try:
+        size = 0
+        try:
+            for start in range(0, len(text), DECODE_CHUNK_CHARS):
+                chunk = binascii.a2b_base64(text[start:start + DECODE_CHUNK_CHARS])
+                buffer[size:size + len(chunk)] = chunk
+                size += len(chunk)
+        except (binascii.Error, ValueError):
+            data = base64.b64decode(text)
+            size = len(data)
+            buffer[:size] = data
+    except BaseException:
+        pool.release(buffer)
+        raise
+    return PdfInput(memoryview(buffer)[:size], lambda: pool.release(buffer), "base64")
+
+
+def validate_inputs(items: List[Any]) -> None:
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            continue
+        if isinstance(item, dict) and isinstance(item.get("ref"), str) and item["ref"]:
+            parse_ref(item["ref"])
+            continue
+        raise ValueError(f"'pdfs'[{position}] must be a base64 string or {{\"ref\": \"<blob ref>\"}}")
+
+
+def input_key(item: Any) -> str:
+    """String identifying an input (continuation tokens are digests of these)."""
+    return item if isinstance(item, str) else f"ref:{item['ref']}"
+
+
+def input_size(item: Any) -> Optional[int]:
+    """Approximate PDF size without decoding or fetching it (None if unknown)."""
+    if isinstance(item, str):
+        return len(item) * 3 // 4
+    store, key = store_for(item["ref"])
+    return store.size(key)
+
+
+def open_input(item: Any, base64_encoded: bool = True) -> PdfInput:
+    """Open one PDF input: {"ref": ...}, a base64 string, or (base64_encoded=False) raw text."""
+    if isinstance(item, dict):
+        store, key = store_for(item["ref"])
+        return store.open(key)
+    if not base64_encoded:
+        return PdfInput(item.encode("utf-8"), source="text")
+    return b64decode_pooled(item)
+
+
+def decode_buffer_stats() -> Dict[str, int]:
+    return _DECODE_BUFFERS.stats()
@@ -0,0 +1,361 @@
+"""
+Offline category classifier trained from past LLM results.
+Hashed character n-gram features + nearest-centroid (cosine) in NumPy, so
+confident transactions are categorized locally and skip the LLM entirely.
+
+Training data comes from what Document.convert_data_to_viz already produced
+(transaction nodes under their parent-tag nodes). Only labels from the
+parenttags.txt taxonomy are ever learned or predicted.
+
+CLI:
+    python category_classifier.py --model /tmp/category_model.npz \\
+        --taxonomy parenttags.txt --viz output.json parent_child_map.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from lazy_imports import lazy_import
+from merchant_memo import normalize_merchant
+
+# Loaded when a model is trained or used, not when this module is imported
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = "/tmp/category_model.npz"
+DEFAULT_MIN_CONFIDENCE = 0.85
+# Softmax confidence is relative to the other categories, so on its own it calls an
+# unrelated merchant confident whenever one category is merely less dissimilar. A
+# prediction also needs this cosine similarity to its centroid and this lead over
+# the runner-up (seen merchants score ~0.35+, unrelated ones < 0.1).
+DEFAULT_MIN_SIMILARITY = 0.2
+DEFAULT_MIN_MARGIN = 0.1
+# No predictions until this many categories have at least MIN_CATEGORY_SAMPLES examples;
+# categories with fewer examples are never predicted
+MIN_TRAINED_CATEGORIES = 3
+MIN_CATEGORY_SAMPLES = 5
+
+
+class CategoryClassifier:
+    """
+    Nearest-centroid classifier over hashed character n-grams.
+
+    Centroids are kept as running sums + counts, so refreshing with new
+    transactions is a cheap incremental update rather than a retrain.
+    """
+
+    def __init__(self, taxonomy: Sequence[str], n_features: int = 2 ** 14, ngram_range: Tuple[int, int] = (3, 5),
+                 temperature: float = 0.05):
+        self.taxonomy = [tag.strip() for tag in taxonomy if tag and tag.strip()]
+        self.label_ids = {tag: i for i, tag in enumerate(self.taxonomy)}
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.temperature = temperature
+        self.sums = np.zeros((len(self.taxonomy), n_features), dtype=np.float32)
+        self.counts = np.zeros(len(self.taxonomy), dtype=np.int64)
+        self._centroids: "Optional[np.ndarray]" = None
+
+    @property
+    def n_samples(self) -> int:
+        return int(self.counts.sum())
+
+    def trained_categories(self) -> "np.ndarray":
+        """Mask of the categories with enough examples to be predicted."""
+        return self.counts >= MIN_CATEGORY_SAMPLES
+
+    def is_ready(self) -> bool:
+        return int(self.trained_categories().sum()) >= MIN_TRAINED_CATEGORIES
+
+    # ---- features ----
+
+    def _features(self, texts: Sequence[str]) -> "Tuple[np.ndarray, np.ndarray, np.ndarray]":
+        """
+        Sparse rows as (row ids, column ids, values), each row L2-normalized.
+
+        N-grams of all texts are hashed in one vectorized pass over the
+        concatenated UTF-8 bytes (polynomial rolling hash; windows that cross
+        a text boundary are masked out).
+        """
+        encoded = [f" {normalize_merchant(text) or str(text).upper()} ".encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(key) for key in encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        row_of_byte = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths)
+        text_end = np.cumsum(lengths)[row_of_byte]
+
+        row_parts, col_parts = [], []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            windows = data.size - n + 1
+            if windows <= 0:
+                continue
+            hashes = np.zeros(windows, dtype=np.uint64)
+            for k in range(n):
+                hashes = hashes * np.uint64(1000003) + data[k:k + windows]
+            valid = np.arange(windows) + n <= text_end[:windows]
+            hashes = hashes[valid]
+            hashes ^= hashes >> np.uint64(29)
+            row_parts.append(row_of_byte[:windows][valid])
+            col_parts.append((hashes % np.uint64(self.n_features)).astype(np.int64))
+
+        if not row_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows_arr = np.concatenate(row_parts)
+        cols_arr = np.concatenate(col_parts)
+        if rows_arr.size == 0:
+            return rows_arr, cols_arr, np.zeros(0, dtype=np.float32)
+
+        # Merge repeated (row, col) pairs so norms are exact; also sorts by row
+        flat = rows_arr * self.n_features + cols_arr
+        flat, values = np.unique(flat, return_counts=True)
+        rows_arr, cols_arr = np.divmod(flat, self.n_features)
+        values = values.astype(np.float32)
+        norms = np.sqrt(np.bincount(rows_arr, weights=values ** 2, minlength=len(texts)))
+        values /= norms[rows_arr].astype(np.float32)
+        return rows_arr, cols_arr, values
+
+    # ---- training ----
+
+    def partial_fit(self, texts: Sequence[str], labels: Sequence[str]) -> int:
+        """
+        Add labelled examples; labels outside the taxonomy are ignored.
+
+        Returns:
+            Number of examples used
+        """
+        pairs = [(text, self.label_ids[label]) for text, label in zip(texts, labels)
+                 if text and label in self.label_ids]
+        if not pairs:
+            return 0
+        rows, cols, values = self._features([text for text, _ in pairs])
+        label_of_row = np.asarray([label for _, label in pairs], dtype=np.int64)
+        np.add.at(self.sums, (label_of_row[rows], cols), values)
+        self.counts += np.bincount(label_of_row, minlength=len(self.taxonomy))
+        self._centroids = None
+        return len(pairs)
+
+    def train_from_viz(self, output: dict, parent_child_map: dict) -> int:
+        """
+        Learn from a convert_data_to_viz result: every transaction node is an
+        example labelled with its parent-tag node's name. The example text is
+        the node's raw "description" (what predict() is given for new
+        transactions), falling back to the LLM-cleaned name for older results.
+        """
+        nodes = output.get("nodes", output) if isinstance(output, dict) else output
+        by_index = {int(node["index"]): node for node in nodes}
+        texts, labels = [], []
+        for parent_idx, children in parent_child_map.items():
+            parent = by_index.get(int(parent_idx))
+            if parent is None:
+                continue
+            for child in children:
+                node = by_index.get(int(child))
+                text = (node.get("description") or node.get("name")) if node is not None else None
+                if text:
+                    texts.append(text)
+                    labels.append(parent["name"])
+        return self.partial_fit(texts, labels)
+
+    # ---- inference ----
+
+    def _centroid_matrix(self) -> "np.ndarray":
+        if self._centroids is None:
+            norms = np.linalg.norm(self.sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._centroids = (self.sums / norms).astype(np.float32)
+        return self._centroids
+
+    def predict(self, texts: Sequence[str]) -> "Tuple[List[Optional[str]], np.ndarray, np.ndarray, np.ndarray]":
+        """
+        Batch prediction over the trained categories.
+
+        Returns:
+            (labels, confidences, similarities, margins): label per text (all
+            None until is_ready()), softmax confidence in [0, 1], cosine
+            similarity to the predicted centroid and its lead over the
+            runner-up category
+        """
+        empty = np.zeros(len(texts), dtype=np.float32)
+        if not texts or not self.is_ready():
+            return [None] * len(texts), empty, empty, empty
+
+        rows, cols, values = self._features(texts)
+        centroids = self._centroid_matrix()
+        # Sparse x dense: rows come back sorted from _features, so sum each row's segment
+        scores = np.zeros((len(texts), len(self.taxonomy)), dtype=np.float32)
+        if rows.size:
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            scores[rows[starts]] = np.add.reduceat(centroids[:, cols].T * values[:, None], starts, axis=0)
+        scores[:, ~self.trained_categories()] = -np.inf
+
+        # Best and runner-up similarity per text (at least MIN_TRAINED_CATEGORIES are finite)
+        top_two = -np.partition(-scores, 1, axis=1)[:, :2]
+        similarities, margins = top_two[:, 0], top_two[:, 0] - top_two[:, 1]
+
+        logits = scores / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        best = probs.argmax(axis=1)
+        confidences = probs[np.arange(len(texts)), best]
+        return [self.taxonomy[i] for i in best], confidences, similarities, margins
+
+    def predict_confident(self, texts: Sequence[str], min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                          min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                          min_margin: float = DEFAULT_MIN_MARGIN,
+                          allowed_tags: Optional[Iterable[str]] = None) -> List[Optional[str]]:
+        """
+        Labels for predictions that clear the confidence, similarity and margin gates, None elsewhere.
+        With allowed_tags (the caller's current taxonomy), labels outside it are None too: the
+        model may have been trained on a tag list that has changed since.
+        """
+        labels, confidences, similarities, margins = self.predict(texts)
+        allowed = set(allowed_tags) if allowed_tags is not None else None
+        return [label if confidence >= min_confidence and similarity >= min_similarity and margin >= min_margin
+                and (allowed is None or label in allowed) else None
+                for label, confidence, similarity, margin in zip(labels, confidences, similarities, margins)]
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            sums=self.sums,
+            counts=self.counts,
+            taxonomy=np.asarray(self.taxonomy),
+            config=np.asarray([self.n_features, self.ngram_range[0], self.ngram_range[1]]),
+            temperature=np.asarray(self.temperature),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            n_features, low, high = (int(v) for v in data["config"])
+            model = cls([str(tag) for tag in data["taxonomy"]], n_features=n_features, ngram_range=(low, high),
+                        temperature=float(data["temperature"]))
+            model.sums = data["sums"].astype(np.float32)
+            model.counts = data["counts"].astype(np.int64)
+        return model
+
+
+_DEFAULT_CLASSIFIER = None
+_DEFAULT_CLASSIFIER_LOADED = False
+_DEFAULT_CLASSIFIER_VERSION = None
+_DEFAULT_CLASSIFIER_LOCK = threading.Lock()
+
+
+def get_default_classifier() -> Optional[CategoryClassifier]:
+    """
+    Shared classifier for the process, or None if no model has been trained.
+    - CATEGORY_MODEL_PATH: model file (default /tmp/category_model.npz)
+    """
+    global _DEFAULT_CLASSIFIER, _DEFAULT_CLASSIFIER_LOADED, _DEFAULT_CLASSIFIER_VERSION
+
+    with _DEFAULT_CLASSIFIER_LOCK:
+        if not _DEFAULT_CLASSIFIER_LOADED:
+            _DEFAULT_CLASSIFIER_LOADED = True
+            path = os.getenv("CATEGORY_MODEL_PATH", DEFAULT_MODEL_PATH)
+            _DEFAULT_CLASSIFIER_VERSION = _file_version(path)
+            try:
+                _DEFAULT_CLASSIFIER = CategoryClassifier.load(path)
+                logger.info(f"Loaded category classifier from {path} ({_DEFAULT_CLASSIFIER.n_samples} examples)")
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable category model {path}: {e}")
+        return _DEFAULT_CLASSIFIER
+
+
+def _file_version(path: str) -> Optional[str]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def model_version() -> Optional[str]:
+    """
+    Version (mtime:size) of the model the shared classifier uses, None without
+    one; read from the file until it is loaded, so numpy isn't imported for it.
+    """
+    with _DEFAULT_CLASSIFIER_LOCK:
+        if _DEFAULT_CLASSIFIER_LOADED:
+            return _DEFAULT_CLASSIFIER_VERSION if _DEFAULT_CLASSIFIER is not None else None
+    return _file_version(os.getenv("CATEGORY_MODEL_PATH", DEFAULT_MODEL_PATH))
+
+
+def min_confidence() -> float:
+    """CLASSIFIER_MIN_CONFIDENCE: predictions below this still go to the LLM."""
+    return float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", str(DEFAULT_MIN_CONFIDENCE)))
+
+
+def min_similarity() -> float:
+    """CLASSIFIER_MIN_SIMILARITY: predictions less similar than this to their centroid go to the LLM."""
+    return float(os.getenv("CLASSIFIER_MIN_SIMILARITY", str(DEFAULT_MIN_SIMILARITY)))
+
+
+def min_margin() -> float:
+    """CLASSIFIER_MIN_MARGIN: predictions closer than this to the runner-up category go to the LLM."""
+    return float(os.getenv("CLASSIFIER_MIN_MARGIN", str(DEFAULT_MIN_MARGIN)))
+
+
+def refresh_model(model_path: str, taxonomy: Iterable[str], viz_results: Iterable[Tuple[dict, dict]]) -> CategoryClassifier:
+    """
+    Training / refresh entry point: load the existing model (or start a new
+    one), add every (output, parent_child_map) pair and save it back.
+    """
+    taxonomy = list(taxonomy)
+    try:
+        model = CategoryClassifier.load(model_path)
+        if model.taxonomy != [tag.strip() for tag in taxonomy if tag and tag.strip()]:
+            logger.info("Taxonomy changed, retraining from scratch")
+            model = CategoryClassifier(taxonomy)
+    except FileNotFoundError:
+        model = CategoryClassifier(taxonomy)
+
+    added = 0
+    for output, parent_child_map in viz_results:
+        added += model.train_from_viz(output, parent_child_map)
+
+    model.save(model_path)
+    logger.info(f"Saved category classifier to {model_path}: +{added} examples, {model.n_samples} total")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train/refresh the local category classifier")
+    parser.add_argument("--model", default=os.getenv("CATEGORY_MODEL_PATH", DEFAULT_MODEL_PATH))
+    parser.add_argument("--taxonomy", default="parenttags.txt", help="parent tags file, one per line")
+    parser.add_argument("--viz", nargs=2, action="append", metavar=("OUTPUT_JSON", "MAP_JSON"), default=[],
+                        help="convert_data_to_viz output + parent_child_map files (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.taxonomy, "r") as f:
+        taxonomy = [line.strip() for line in f if line.strip()]
+
+    def load_pairs():
+        for output_path, map_path in args.viz:
+            with open(output_path, "r") as f:
+                output = json.load(f)
+            with open(map_path, "r") as f:
+                parent_child_map = json.load(f)
+            yield output, parent_child_map
+
+    model = refresh_model(args.model, taxonomy, load_pairs())
+    print(f"Model at {args.model}: {model.n_samples} examples, "
+          f"{int((model.counts > 0).sum())}/{len(model.taxonomy)} categories seen, "
+          f"{int(model.trained_categories().sum())} with enough examples to predict"
+          f"{'' if model.is_ready() else f' (needs {MIN_TRAINED_CATEGORIES} before predicting)'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,86 @@
+"""
+Token-bounded chunking of statement text for parallel LLM extraction.
+Splits on page/line boundaries so a transaction line is never cut in half,
+and repeats a few lines between neighbouring windows so transactions that
+straddle a boundary are seen whole by at least one request.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List
+
+# Rough OpenAI tokenizer ratio for English statement text
+CHARS_PER_TOKEN = 4
+
+_PAGE_BREAK_RE = re.compile(r"\f|\n\s*\n")
+
+
+@dataclass
+class Chunk:
+    """One extraction window."""
+    index: int
+    text: str
+    overlap_text: str = ""  # leading lines shared with the previous chunk
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (no tokenizer dependency)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_into_chunks(text: str, max_tokens: int = 1200, overlap_lines: int = 2) -> List[Chunk]:
+    """
+    Split text into windows of at most ~max_tokens.
+
+    Page breaks (form feeds / blank lines) are preferred cut points; inside a
+    page the text is cut between lines. A single line longer than the budget
+    becomes its own chunk.
+
+    Args:
+        text: Full statement text
+        max_tokens: Token budget per chunk (prompt instructions not included)
+        overlap_lines: Lines repeated at the start of the next chunk
+
+    Returns:
+        List of Chunk objects in document order
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [Chunk(index=0, text=text)]
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    # Pages first, then lines within pages ("" marks a page boundary)
+    lines: List[str] = []
+    for block in _PAGE_BREAK_RE.split(text):
+        block_lines = [line for line in block.splitlines() if line.strip()]
+        if block_lines:
+            lines.extend(block_lines)
+            lines.append("")
+
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    overlap: List[str] = []
+    current_chars = 0
+
+    def cut():
+        nonlocal current, overlap, current_chars
+        if len(current) > len(overlap):
+            chunks.append(Chunk(index=len(chunks), text="\n".join(current), overlap_text="\n".join(overlap)))
+            overlap = current[-overlap_lines:] if overlap_lines > 0 else []
+            current = list(overlap)
+            current_chars = sum(len(line) + 1 for line in current)
+
+    for line in lines:
+        if not line:
+            # Page boundary: preferred cut point once the window is mostly full
+            if current_chars >= max_chars * 0.8:
+                cut()
+            continue
+        if current_chars + len(line) + 1 > max_chars:
+            cut()
+        current.append(line)
+        current_chars += len(line) + 1
+
+    cut()
+
+    return chunks
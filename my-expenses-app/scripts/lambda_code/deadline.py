@@ -0,0 +1,151 @@
+"""
+Deadline-aware scheduling for Lambda invocations. A Deadline is derived
+from the Lambda context (minus a reserve for merging and serializing the
+response); work is only started when the remaining budget covers its
+estimated cost, and whatever could not be started is returned to the
+client as a continuation token listing the unprocessed inputs.
+
+Configuration (environment):
+    DEADLINE_RESERVE_FRACTION  share of the invocation's time kept back for merge + response (default 0.1)
+    DEADLINE_RESERVE_MS        cap on that reserve (default 5000)
+    DEADLINE_PDF_BASE_MS       estimated fixed cost of one uncached PDF (default 4000)
+    DEADLINE_PDF_MS_PER_KB     estimated cost per KB of PDF until real timings are seen (default 60)
+"""
+
+import base64
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, List, Optional, Sequence
+
+DEADLINE_RESERVE_FRACTION = float(os.getenv('DEADLINE_RESERVE_FRACTION', '0.1'))
+DEADLINE_RESERVE_MS = float(os.getenv('DEADLINE_RESERVE_MS', '5000'))
+DEADLINE_PDF_BASE_MS = float(os.getenv('DEADLINE_PDF_BASE_MS', '4000'))
+DEADLINE_PDF_MS_PER_KB = float(os.getenv('DEADLINE_PDF_MS_PER_KB', '60'))
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting work the remaining budget can't cover."""
+
+
+class Deadline:
+    """
+    Remaining time budget for one invocation.
+
+    Args:
+        context: Lambda context (no context = no deadline)
+        reserve_ms: Time kept back for merging and returning the response
+            (default: DEADLINE_RESERVE_FRACTION of the remaining time, at most
+            DEADLINE_RESERVE_MS, so short timeouts keep most of their budget)
+    """
+
+    def __init__(self, context: Any = None, reserve_ms: Optional[float] = None):
+        self.ends_at = None
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            remaining_ms = context.get_remaining_time_in_millis()
+            if reserve_ms is None:
+                reserve_ms = min(DEADLINE_RESERVE_MS, DEADLINE_RESERVE_FRACTION * remaining_ms)
+            self.ends_at = time.monotonic() + (remaining_ms - reserve_ms) / 1000
+
+    def remaining_ms(self) -> float:
+        if self.ends_at is None:
+            return float("inf")
+        return (self.ends_at - time.monotonic()) * 1000
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def can_start(self, estimated_ms: float) -> bool:
+        return self.remaining_ms() >= estimated_ms
+
+    def check(self, estimated_ms: float, what: str = "work") -> None:
+        if not self.can_start(estimated_ms):
+            raise DeadlineExceeded(f"{self.remaining_ms():.0f}ms left, {what} needs ~{estimated_ms:.0f}ms")
+
+
+class PdfCostModel:
+    """
+    Estimated processing time of an uncached PDF from its size. Starts from
+    the configured defaults and follows observed ms/KB on this container
+    (exponentially weighted), so later batches schedule on real timings.
+    """
+
+    def __init__(self, base_ms: float = DEADLINE_PDF_BASE_MS, ms_per_kb: float = DEADLINE_PDF_MS_PER_KB,
+                 alpha: float = 0.3):
+        self.base_ms = base_ms
+        self.ms_per_kb = ms_per_kb
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def estimate_ms(self, size_bytes: int) -> float:
+        return self.base_ms + self.ms_per_kb * size_bytes / 1024
+
+    def observe(self, size_bytes: int, elapsed_ms: float) -> None:
+        if size_bytes <= 0:
+            return
+        observed = max(0.0, elapsed_ms - self.base_ms) / (size_bytes / 1024)
+        with self._lock:
+            self.ms_per_kb += self.alpha * (observed - self.ms_per_kb)
+
+
+_CURRENT = contextvars.ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]):
+    """Make deadline the default for Documents / LLM calls created in this thread/context."""
+    token = _CURRENT.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _CURRENT.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _CURRENT.get()
+
+
+def _digest(items: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(hashlib.sha256(item.encode("utf-8")).digest())
+    return digest.hexdigest()[:32]
+
+
+def make_continuation(inputs: Sequence[str], pending: List[int]) -> dict:
+    """
+    Continuation block for a partial response: the unprocessed input
+    positions plus a token that lets the client resubmit either the full
+    input list or just the pending inputs (in the same order).
+    """
+    payload = {"v": 1, "total": len(inputs), "pending": pending, "digest": _digest([inputs[i] for i in pending])}
+    token = base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8")).decode("ascii")
+    return {"token": token, "pending": pending}
+
+
+def read_continuation(token: str, inputs: Sequence[str]) -> List[int]:
+    """
+    Positions in `inputs` still to process for a continuation token.
+    Raises ValueError if the token is malformed or doesn't match the inputs.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        total, pending, digest = payload["total"], [int(i) for i in payload["pending"]], payload["digest"]
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"Invalid continuation token: {e}")
+
+    if len(inputs) == total and all(0 <= i < total for i in pending):
+        selected = pending
+    elif len(inputs) == len(pending):
+        # Only the pending inputs were resubmitted
+        selected = list(range(len(inputs)))
+    else:
+        raise ValueError(f"Continuation token is for {total} PDFs ({len(pending)} pending), got {len(inputs)}")
+
+    if _digest([inputs[i] for i in selected]) != digest:
+        raise ValueError("Continuation token doesn't match the submitted PDFs")
+    return selected
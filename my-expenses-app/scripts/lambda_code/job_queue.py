@@ -0,0 +1,267 @@
+"""
+Durable background jobs for the Flask upload service: an SQLite-backed
+queue (no external broker) plus a local worker pool. Any number of app
+processes can share one queue file; claims are atomic, and a job whose
+worker died is picked up again once its lease runs out.
+
+Job states: queued -> running -> done | failed (a failed attempt, or one
+whose lease ran out, is retried until max_attempts is reached).
+
+Configuration (environment):
+    JOB_QUEUE_PATH     SQLite file (default jobs.sqlite3 next to the app)
+    JOB_WORKERS        worker threads per process
+    JOB_LEASE_S        seconds a running job stays claimed without a heartbeat
+    JOB_MAX_ATTEMPTS   attempts before a job is marked failed
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                          "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_LEASE_S = float(os.getenv('JOB_LEASE_S', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    payload     BLOB,
+    params      TEXT,
+    progress    TEXT,
+    result      TEXT,
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    SQLite job table. Each thread gets its own connection; writes that must
+    be atomic across processes (claiming) run in BEGIN IMMEDIATE transactions.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_s: float = JOB_LEASE_S,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        # Wakes idle workers in this process as soon as something is enqueued
+        self.enqueued = threading.Event()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: bytes = b"", params: Optional[dict] = None) -> str:
+        """Add a job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, status, payload, params, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, kind, payload, json.dumps(params or {}), now, now),
+        )
+        self.enqueued.set()
+        return job_id
+
+    def claim(self, worker: str) -> Optional[sqlite3.Row]:
+        """
+        Atomically take the oldest queued job (or one whose lease expired).
+        Expired jobs that are out of attempts (their worker keeps dying) are
+        marked failed instead of being handed out again.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, ?), lease_until = NULL, "
+                "finished_at = ?, updated_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f"Lease expired after {self.max_attempts} attempts", now, now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_until < ? AND attempts < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                (worker, now + self.lease_s, now, now, row["id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def progress(self, job_id: str, worker: str, progress: dict) -> None:
+        """Record progress and extend `worker`'s lease (doubles as a heartbeat)."""
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET progress = ?, lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND worker = ?",
+            (json.dumps(progress), now + self.lease_s, now, job_id, worker),
+        )
+
+    def complete(self, job_id: str, worker: str, result: Any) -> bool:
+        """
+        Mark the job done. Only the worker still holding an unexpired lease may;
+        returns False (and changes nothing) if the job was reclaimed meanwhile.
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, payload = NULL, lease_until = NULL, "
+            "finished_at = ?, updated_at = ? WHERE id = ? AND status = 'running' AND worker = ? AND lease_until > ?",
+            (json.dumps(result), now, now, job_id, worker, now),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker: str, error: str) -> Optional[str]:
+        """
+        Re-queue the job, or mark it failed once it is out of attempts. Returns the
+        new status, or None if `worker` no longer holds the lease (nothing changes).
+        """
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, error = ?, "
+            "lease_until = NULL, updated_at = ?, finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END "
+            "WHERE id = ? AND status = 'running' AND worker = ? AND lease_until > ?",
+            (self.max_attempts, error, now, self.max_attempts, now, job_id, worker, now),
+        )
+        if cursor.rowcount != 1:
+            return None
+        status = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()["status"]
+        if status == "queued":
+            self.enqueued.set()
+        return status
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[dict]:
+        """Job status (and result, when asked) as a JSON-ready dict; None if unknown."""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "jobId": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+        }
+        if with_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class WorkerPool:
+    """
+    Local worker threads that run jobs from a JobQueue.
+
+    Args:
+        queue: The queue to work on
+        handlers: Job kind -> handler(job row, report_progress(dict)) returning a JSON-ready result
+        workers: Number of threads
+        poll_s: Idle poll interval (picks up jobs enqueued by other processes)
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable], workers: int = JOB_WORKERS,
+                 poll_s: float = 1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.poll_s = poll_s
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._name = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def start(self) -> "WorkerPool":
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{self._name}-{n}",), daemon=True,
+                                      name=f"job-worker-{n}")
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self.queue.enqueued.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_one(self, worker: str) -> bool:
+        """Claim and run one job; False if the queue was empty."""
+        job = self.queue.claim(worker)
+        if job is None:
+            return False
+        handler = self.handlers.get(job["kind"])
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind {job['kind']!r}")
+            result = handler(job, lambda progress: self.queue.progress(job["id"], worker, progress))
+        except Exception as e:
+            status = self.queue.fail(job["id"], worker, f"{type(e).__name__}: {e}")
+            if status is None:
+                logger.warning(f"Job {job['id']} ({job['kind']}) failed after its lease was taken over: {e}")
+            else:
+                logger.error(f"Job {job['id']} ({job['kind']}) failed, now {status}: {e}", exc_info=True)
+            return True
+        if not self.queue.complete(job["id"], worker, result):
+            logger.warning(f"Job {job['id']} ({job['kind']}) finished after its lease was taken over; "
+                           f"result dropped")
+            return True
+        logger.info(f"Job {job['id']} ({job['kind']}) done in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def _run(self, worker: str) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.run_one(worker):
+                    continue
+            except sqlite3.Error as e:
+                logger.error(f"Job queue error: {e}")
+            self.queue.enqueued.wait(self.poll_s)
+            self.queue.enqueued.clear()
@@ -9,21 +9,91 @@ Key improvements:
 - Timeout awareness
 """
 
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import json
 import base64
 import os
 import logging
-from typing import Dict, Any, Tuple
-from readPdf import extract_text_from_pdf_bytes
-from process_optimized import DocumentProcessor
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from readPdf import extract_text_from_pdf_bytes, transaction_section_ended
+from batch_merge import BatchMerger
+from category_classifier import min_confidence, min_margin, min_similarity, model_version
+from blob_store import decode_buffer_stats, input_key, input_size, open_input, validate_inputs
+from deadline import Deadline, DeadlineExceeded, PdfCostModel, make_continuation, read_continuation, use_deadline
+from lazy_imports import lazy_import, log_startup
+from llm_gateway import get_gateway
+from merchant_memo import memo_version
+from metrics import Metrics, use_metrics
+from result_cache import ResultCache, cache_from_env
+from statement_formats import MIN_PARSE_COVERAGE, fast_path_enabled
+from viz_builder import append_viz, columns_from_viz
+from viz_stream import STREAM_CONTENT_TYPES, format_record, negotiate_stream_mode, node_records
+from wire_format import COLUMNAR_CONTENT_TYPE, columnar_body, negotiate_compression, negotiate_wire_format
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# The processor pulls in the OpenAI SDK; import it only when a PDF actually needs processing
+process_amz = lazy_import("process_amz")
+
+# First invocation on this container also logs which deferred imports it paid for
+_COLD_START = True
+
 # Cache parent tags (loaded once per Lambda container lifecycle)
 _PARENT_TAGS_CACHE = None
 
+# Cache processed results by PDF content + parent tags (lives with the warm container)
+_RESULT_CACHE = cache_from_env()
+
+# Estimated processing time per uncached PDF, refined from this container's timings
+_PDF_COST = PdfCostModel()
+
+# Batch concurrency (LLM calls are I/O bound, so threads are enough)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+# Optional process pool for pypdf parsing (0 = parse inside the worker threads).
+# Note: plain AWS Lambda has no /dev/shm, so leave this at 0 there.
+PDF_PARSE_PROCESSES = int(os.getenv('PDF_PARSE_PROCESSES', '0'))
+# Page extraction: page cap (0 = all), page-range processes for long single PDFs,
+# and early stop once the transaction section has ended
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '0'))
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', '0'))
+PDF_STOP_AT_SECTION_END = os.getenv('PDF_STOP_AT_SECTION_END') == '1'
+# Strip header/footer lines repeated on most pages before the text reaches the LLM (opt-in)
+PDF_STRIP_REPEATED = os.getenv('PDF_STRIP_REPEATED', '0') == '1'
+# Everything besides the PDF and parent tags that changes its result; part of
+# every result cache key. Prestructure / model read the same variables (and
+# defaults) as process_amz, which isn't imported until a PDF misses the cache.
+RESULT_CACHE_OPTIONS = {
+    "max_pages": PDF_MAX_PAGES,
+    "stop_at_section_end": PDF_STOP_AT_SECTION_END,
+    "strip_repeated": PDF_STRIP_REPEATED,
+    "prestructure": os.getenv('LLM_PRESTRUCTURE', '1') == '1',
+    "model": os.getenv('LLM_MODEL', 'gpt-4o-mini'),
+    "fast_path_min_coverage": MIN_PARSE_COVERAGE,
+}
+
+
+def result_cache_options() -> Dict[str, Any]:
+    """
+    RESULT_CACHE_OPTIONS plus what can change while the container is warm: the
+    merchant memo and classifier model the categories come from (a memo update
+    or retrain means new keys, not stale categories) and the fast-path switches.
+    """
+    return {
+        **RESULT_CACHE_OPTIONS,
+        "fast_path": fast_path_enabled(),
+        "memo": memo_version(),
+        "classifier": model_version(),
+        "classifier_thresholds": [min_confidence(), min_similarity(), min_margin()],
+    }
+
+
 def get_parent_tags() -> str:
     """
     Get parent tags from environment or file (cached).
@@ -76,32 +146,48 @@ def get_parent_tags() -> str:
 
 def validate_event(event: Dict[str, Any]) -> None:
     """Validate Lambda event structure."""
+    if event.get("ref"):
+        validate_inputs([{"ref": event["ref"]}])
+        return
+
     if "body" not in event:
         raise ValueError("Missing 'body' in event")
 
     if not event["body"]:
         raise ValueError("Empty body in event")
 
-def process_single_pdf(pdf_bytes: bytes, parent_tags: str, context: Any) -> Tuple[list, dict]:
+def extract_pdf_text(pdf_bytes: bytes) -> str:
     """
-    Process a single PDF and return its nodes and parent_child_map.
+    Extract text from PDF bytes, falling back to plain UTF-8 text.
+
+    Module-level (picklable) so it can also run in a process pool.
 
     Args:
-        pdf_bytes: PDF content as bytes
-        parent_tags: Category tags string
-        context: Lambda context for timeout awareness
+        pdf_bytes: PDF content (bytes, or a pooled-buffer memoryview / mmap)
 
     Returns:
-        Tuple of (nodes list, parent_child_map dict)
+        Extracted text content
     """
     # Extract text from PDF (in-memory, no /tmp writes)
+    extraction_stats: Dict[str, int] = {}
     try:
-        text = extract_text_from_pdf_bytes(pdf_bytes)
+        text = extract_text_from_pdf_bytes(
+            pdf_bytes,
+            max_pages=PDF_MAX_PAGES or None,
+            stop_when=transaction_section_ended if PDF_STOP_AT_SECTION_END else None,
+            workers=PDF_PAGE_WORKERS,
+            strip_repeated=PDF_STRIP_REPEATED,
+            stats=extraction_stats,
+        )
+        if extraction_stats.get("chars_removed"):
+            logger.info(f"Boilerplate removal: {extraction_stats}")
     except ValueError as e:
-        # If PDF extraction fails, try as plain text
+        # If PDF extraction fails, try as plain text (a real PDF is binary, so not those)
+        if bytes(pdf_bytes[:5]) == b"%PDF-":
+            raise
         logger.warning(f"PDF extraction failed, trying as plain text: {e}")
         try:
-            text = pdf_bytes.decode('utf-8')
+            text = str(pdf_bytes, 'utf-8')
             logger.info(f"Successfully decoded as plain text: {len(text)} characters")
         except UnicodeDecodeError:
             raise ValueError(f"Content is neither valid PDF nor text: {e}")
@@ -109,24 +195,302 @@ def process_single_pdf(pdf_bytes: bytes, parent_tags: str, context: Any) -> Tupl
     if not text.strip():
         raise ValueError("No text extracted from PDF")
 
-    logger.info(f"Extracted {len(text)} characters from PDF")
+    return text
+
+def process_single_pdf(pdf_bytes: bytes, parent_tags: str, context: Any, text: Optional[str] = None,
+                       cache_key: Optional[str] = None, metrics: Optional[Metrics] = None,
+                       deadline: Optional[Deadline] = None) -> Tuple[list, dict]:
+    """
+    Process a single PDF and return its nodes and parent_child_map.
+
+    Args:
+        pdf_bytes: PDF content (bytes, or a pooled-buffer memoryview / mmap)
+        parent_tags: Category tags string
+        context: Lambda context for timeout awareness
+        text: Already extracted text (skips pypdf parsing when given)
+        cache_key: Precomputed ResultCache key (computed here when omitted)
+        metrics: Stage timings / LLM usage for this PDF (a fresh one when omitted)
+        deadline: Invocation deadline (from context when omitted); LLM calls
+                  that can't finish before it raise DeadlineExceeded
+
+    Returns:
+        Tuple of (nodes list, parent_child_map dict)
+    """
+    metrics = metrics or Metrics()
+    deadline = deadline or Deadline(context)
 
-    # Process document with optimized processor
-    processor = DocumentProcessor(
-        text=text,
-        parent_tags=parent_tags,
-        max_retries=2,
-        timeout_ms=context.get_remaining_time_in_millis() - 5000 if context else None
-    )
+    with metrics.stage("cache_lookup"):
+        if cache_key is None:
+            cache_key = ResultCache.make_key(pdf_bytes, parent_tags, result_cache_options())
+        cached = _RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info(f"Result cache hit for {cache_key[:12]}: {len(cached[0])} nodes")
+        return cached
+
+    if text is None:
+        with metrics.stage("pdf_extract"):
+            text = extract_pdf_text(pdf_bytes)
+
+    logger.info(f"Extracted {len(text)} characters from PDF")
 
-    output, parent_child_map = processor.process()
+    # Statement text -> items -> nodes; the Document records into these metrics
+    # and doesn't start LLM calls past the deadline
+    started = time.perf_counter()
+    with use_metrics(metrics), use_deadline(deadline), metrics.stage("process"):
+        doc = process_amz.Document(text, allparenttags=parent_tags, metrics=metrics, deadline=deadline)
+        doc.convert_text_to_items()
+        output, parent_child_map = doc.convert_data_to_viz()
+    _PDF_COST.observe(len(pdf_bytes), (time.perf_counter() - started) * 1000)
 
     # Ensure nodes is a list
     if not isinstance(output.get("nodes"), list):
         output["nodes"] = [output["nodes"]]
 
+    if doc.failed_windows:
+        # Incomplete (a window's reply never parsed); a retry may well succeed, so don't pin this result
+        logger.warning(f"{doc.failed_windows} extraction window(s) failed for {cache_key[:12]}, not caching")
+    else:
+        with metrics.stage("cache_store"):
+            _RESULT_CACHE.put(cache_key, output["nodes"], parent_child_map)
+
     return output["nodes"], parent_child_map
 
+def _process_batch_pdf(idx: int, source: Any, total: int, parent_tags: str, context: Any,
+                       parse_pool: Optional[ProcessPoolExecutor] = None, metrics: Optional[Metrics] = None,
+                       deadline: Optional[Deadline] = None) -> Tuple[list, dict]:
+    """
+    Worker for one batch entry: decode / fetch the PDF only now (so just the
+    PDFs in flight are held in memory), check it still fits the deadline
+    (raises DeadlineExceeded if not), process it and release its bytes.
+    """
+    metrics = metrics or Metrics()
+    deadline = deadline or Deadline(context)
+    if deadline.expired():
+        raise DeadlineExceeded(f"PDF {idx + 1} not started")
+    with metrics.stage("decode"):
+        pdf = open_input(source)
+    try:
+        pdf_bytes = pdf.data
+        cache_key = ResultCache.make_key(pdf_bytes, parent_tags, result_cache_options())
+        cached = _RESULT_CACHE.contains(cache_key)
+        if not cached:
+            deadline.check(_PDF_COST.estimate_ms(pdf.size), f"PDF {idx + 1}")
+        logger.info(f"Processing PDF {idx + 1}/{total}: {pdf.size} bytes ({pdf.source})")
+        text = None
+        if parse_pool is not None and not cached:
+            with metrics.stage("pdf_extract"):
+                # Worker processes need a picklable copy
+                text = parse_pool.submit(extract_pdf_text, bytes(pdf_bytes)).result()
+        nodes, parent_child_map = process_single_pdf(pdf_bytes, parent_tags, context, text=text,
+                                                     cache_key=cache_key, metrics=metrics, deadline=deadline)
+    finally:
+        pdf.close()
+        metrics.emit(logger, "pdf", pdf=idx + 1, bytes=pdf.size)
+    logger.info(f"PDF {idx + 1} processed: {len(nodes)} nodes")
+    return nodes, parent_child_map
+
+def iter_batch(pdfs: List[Any], parent_tags: str, context: Any,
+               pdf_metrics: Optional[Dict[int, Metrics]] = None, deadline: Optional[Deadline] = None,
+               indices: Optional[List[int]] = None) -> Iterator[Tuple[int, Optional[Tuple[list, dict]], Optional[str]]]:
+    """
+    Process a batch of PDFs concurrently with bounded parallelism, yielding
+    (idx, (nodes, parent_child_map) or None, error message or None) per PDF.
+    A PDF with neither result nor error was not processed before the
+    deadline and belongs in the continuation.
+
+    Work is launched smallest PDF first, and a PDF is only started when the
+    remaining budget covers its estimated cost, so a tight deadline still
+    finishes as many PDFs as possible. Results are yielded in input order
+    regardless of completion order (each one as soon as it and every earlier
+    PDF are done), so the merge that follows assigns the same node indices
+    on every run.
+
+    Args:
+        pdfs: Base64-encoded PDFs and/or {"ref": blob ref} entries
+        parent_tags: Category tags string
+        context: Lambda context for timeout awareness
+        pdf_metrics: Filled with each PDF's Metrics, keyed by idx (optional)
+        deadline: Invocation deadline (from context when omitted)
+        indices: Positions in pdfs to process (default: all)
+    """
+    total = len(pdfs)
+    if pdf_metrics is None:
+        pdf_metrics = {}
+    deadline = deadline or Deadline(context)
+    indices = list(range(total)) if indices is None else indices
+    futures: Dict[int, Future] = {}
+    sizes: Dict[int, Optional[int]] = {}
+    size_errors: Dict[int, str] = {}
+
+    for idx in indices:
+        pdf_metrics[idx] = Metrics()
+        try:
+            sizes[idx] = input_size(pdfs[idx])
+        except Exception as e:
+            size_errors[idx] = str(e)
+
+    parse_pool = ProcessPoolExecutor(max_workers=PDF_PARSE_PROCESSES) if PDF_PARSE_PROCESSES > 0 else None
+    pool = ThreadPoolExecutor(max_workers=max(1, min(BATCH_MAX_WORKERS, len(sizes) or 1)))
+
+    try:
+        # Unknown sizes (e.g. S3 refs) go last
+        for idx in sorted(sizes, key=lambda idx: (sizes[idx] is None, sizes[idx] or 0)):
+            futures[idx] = pool.submit(
+                _process_batch_pdf, idx, pdfs[idx], total, parent_tags, context, parse_pool, pdf_metrics[idx],
+                deadline
+            )
+
+        for idx in indices:
+            if idx in size_errors:
+                error = size_errors[idx]
+            else:
+                remaining = deadline.remaining_ms()
+                try:
+                    result = futures[idx].result(timeout=max(0.0, remaining / 1000) if remaining != float("inf") else None)
+                    yield idx, result, None
+                    continue
+                except (DeadlineExceeded, FutureTimeoutError) as e:
+                    futures[idx].cancel()
+                    logger.warning(f"PDF {idx + 1} left for the continuation: {str(e) or 'deadline reached'}")
+                    yield idx, None, None
+                    continue
+                except Exception as e:
+                    error = str(e)
+            error_msg = f"PDF {idx + 1} failed: {error}"
+            logger.error(error_msg)
+            yield idx, None, error_msg
+    finally:
+        # Never leave work running behind the response (a frozen container would resume it on
+        # the next invocation): drop what hasn't started and wait for what has. In-flight PDFs
+        # end soon after the deadline - their LLM calls time out at it and no new ones start.
+        pool.shutdown(wait=True, cancel_futures=True)
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=True, cancel_futures=True)
+
+def run_batch(pdfs: List[Any], parent_tags: str, context: Any,
+              pdf_metrics: Optional[Dict[int, Metrics]] = None, deadline: Optional[Deadline] = None,
+              indices: Optional[List[int]] = None) -> Tuple[List[Optional[Tuple[list, dict]]], List[str], List[int]]:
+    """
+    Process a batch of PDFs (see iter_batch) and collect the results.
+
+    Returns:
+        Tuple of (per-PDF (nodes, parent_child_map) or None, errors list,
+        positions left unprocessed at the deadline)
+    """
+    results: List[Optional[Tuple[list, dict]]] = [None] * len(pdfs)
+    errors = []
+    pending = []
+    for idx, result, error in iter_batch(pdfs, parent_tags, context, pdf_metrics, deadline, indices):
+        results[idx] = result
+        if error:
+            errors.append(error)
+        elif result is None:
+            pending.append(idx)
+    return results, errors, pending
+
+def iter_batch_records(pdfs: List[Any], parent_tags: str, context: Any,
+                       cache_snapshot: Optional[dict] = None,
+                       indices: Optional[List[int]] = None) -> Iterator[dict]:
+    """
+    Streaming form of batch mode: category/transaction records with their
+    final indices as each PDF finishes (in input order), an error record per
+    failed PDF, then one summary record with the root node, stats, errors
+    and (if the deadline cut the batch short) a continuation.
+    """
+    merger = BatchMerger()
+    errors = []
+    pending = []
+    batch_metrics = Metrics()
+    pdf_metrics: Dict[int, Metrics] = {}
+    indices = list(range(len(pdfs))) if indices is None else indices
+
+    for idx, result, error in iter_batch(pdfs, parent_tags, context, pdf_metrics, indices=indices):
+        if result is None:
+            if error is None:
+                pending.append(idx)
+                continue
+            errors.append(error)
+            yield {"type": "error", "source": idx, "message": error}
+            continue
+        with batch_metrics.stage("merge"):
+            records = node_records(*merger.add(*result))
+        yield from records
+
+    nodes, parent_child_map = merger.result()
+    batch_metrics.merge(pdf_metrics[idx] for idx in sorted(pdf_metrics))
+    summary = {
+        "type": "summary",
+        "root": merger.root,
+        "parent_child_map": parent_child_map,
+        "category_totals": merger.category_totals(),
+        "stats": {
+            "total_nodes": len(nodes),
+            "total_categories": len(parent_child_map),
+            "pdfs_processed": len(indices) - len(pending),
+            "pdfs_pending": len(pending),
+            "cache": _RESULT_CACHE.stats(since=cache_snapshot),
+            "pdfs": [pdf_metrics[idx].summary() for idx in sorted(pdf_metrics)],
+            "metrics": batch_metrics.emit(logger, "batch", pdfs=len(indices), streamed=True),
+        },
+        "errors": errors,
+    }
+    if pending:
+        summary["continuation"] = make_continuation([input_key(item) for item in pdfs], pending)
+    yield summary
+
+def append_to_existing(existing: Any, nodes: list, parent_child_map: dict) -> Tuple[list, dict, dict]:
+    """
+    Incremental mode: add freshly processed transactions to a previously
+    returned graph instead of returning a new one. Existing indices stay
+    valid, categories are reused by name and totals are updated.
+
+    Returns:
+        Tuple of (existing nodes, existing parent_child_map, append stats)
+    """
+    if (not isinstance(existing, dict) or not isinstance(existing.get("output"), list)
+            or not isinstance(existing.get("parent_child_map"), dict)):
+        raise ValueError("'existing' must contain 'output' (array) and 'parent_child_map' (object)")
+    base_nodes, base_map = existing["output"], existing["parent_child_map"]
+    stats = append_viz(base_nodes, base_map, columns_from_viz(nodes, parent_child_map))
+    logger.info(f"Appended to existing graph: {stats}")
+    return base_nodes, base_map, stats
+
+def stream_response(records: Iterable[dict], mode: str) -> Dict[str, Any]:
+    """
+    Response with an NDJSON / SSE body.
+
+    The Python Lambda runtime can't flush a response incrementally, so the
+    records are joined here; clients still parse them line by line, and the
+    Flask app streams the same records as they are produced.
+    """
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": STREAM_CONTENT_TYPES[mode],
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": "".join(format_record(record, mode) for record in records),
+    }
+
+def json_response(body: dict, wire_format: Optional[str] = None, compression: Optional[str] = None) -> Dict[str, Any]:
+    """
+    200 response with the default JSON body, or the columnar one
+    (base64-encoded for API Gateway when gzipped).
+    """
+    headers = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+    if wire_format != "columnar":
+        return {"statusCode": 200, "headers": headers, "body": json.dumps(body)}
+
+    payload, wire = columnar_body(body, compression)
+    logger.info(f"Columnar response: {wire}")
+    headers["Content-Type"] = COLUMNAR_CONTENT_TYPE
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if compression == "gzip":
+        headers["Content-Encoding"] = "gzip"
+        return {"statusCode": 200, "headers": headers, "isBase64Encoded": True,
+                "body": base64.b64encode(payload).decode("ascii")}
+    return {"statusCode": 200, "headers": headers, "body": payload.decode("utf-8")}
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Main Lambda handler for PDF transaction processing.
@@ -135,15 +499,47 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Args:
         event: Lambda event with base64-encoded PDF(s) in body
                - Single PDF: { "body": "base64_pdf_data", "isBase64Encoded": true }
-               - Batch PDFs: { "pdfs": ["base64_pdf_1", "base64_pdf_2", ...] }
+                 or { "ref": "s3://bucket/key" | "local://key" }
+               - Batch PDFs: { "pdfs": ["base64_pdf_1", {"ref": "s3://bucket/key"}, ...] }
+                 (blob refs are memory-mapped instead of travelling in the event)
+               - Optional "stream": "ndjson" | "sse" (or an Accept header) for a
+                 record-per-line body instead of one JSON document
+               - Optional "existing": {"output": [...], "parent_child_map": {...}}
+                 to append the new transactions to a previous result
+               - Optional "continuation": token from a partial batch response;
+                 "pdfs" is then the original list or just its pending PDFs
+               - Optional "format": "columnar" (or an Accept header with
+                 application/vnd.expenses.columnar+json) for parallel arrays
+                 instead of "output" / "parent_child_map", plus "compress":
+                 "gzip" (or Accept-Encoding: gzip) to gzip it
         context: Lambda context (for timeout awareness)
 
     Returns:
-        API Gateway response with processed transactions
+        API Gateway response with processed transactions. A batch that runs
+        into the deadline returns what finished, "partial": true and a
+        "continuation" (token + pending positions) for the rest.
     """
+    global _COLD_START
+    cold_start, _COLD_START = _COLD_START, False
+
     try:
         logger.info(f"Processing request - Remaining time: {context.get_remaining_time_in_millis() if context else 'N/A'}ms")
 
+        cache_snapshot = _RESULT_CACHE.snapshot()
+        deadline = Deadline(context)
+
+        # Optional NDJSON / SSE body: {"stream": "ndjson"|"sse"} or an Accept header
+        headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+        stream_mode = negotiate_stream_mode(event.get("stream"), headers.get("accept"))
+        if stream_mode and "existing" in event:
+            raise ValueError("'existing' can't be combined with a streaming response")
+
+        # Optional columnar body: {"format": "columnar"} or an Accept header, gzipped on request
+        wire_format = negotiate_wire_format(event.get("format"), headers.get("accept"))
+        compression = negotiate_compression(event.get("compress"), headers.get("accept-encoding"))
+        if stream_mode and wire_format:
+            raise ValueError("'format': 'columnar' can't be combined with a streaming response")
+
         # Get parent tags (cached)
         parent_tags = get_parent_tags()
         logger.info(f"Using parent tags: {parent_tags[:200]}...")
@@ -151,127 +547,147 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Check if this is a batch request
         if "pdfs" in event:
             # Batch processing mode
-            pdfs_base64 = event["pdfs"]
-            if not isinstance(pdfs_base64, list) or len(pdfs_base64) == 0:
+            pdfs = event["pdfs"]
+            if not isinstance(pdfs, list) or len(pdfs) == 0:
                 raise ValueError("'pdfs' must be a non-empty array")
-
-            logger.info(f"Batch mode: Processing {len(pdfs_base64)} PDFs")
-
-            all_nodes = []
-            combined_parent_child_map = {}
-            node_offset = 1  # Start after root node (index 0)
-            errors = []
-
-            for idx, pdf_base64 in enumerate(pdfs_base64):
-                try:
-                    pdf_bytes = base64.b64decode(pdf_base64)
-                    logger.info(f"Processing PDF {idx + 1}/{len(pdfs_base64)}: {len(pdf_bytes)} bytes")
-
-                    nodes, parent_child_map = process_single_pdf(pdf_bytes, parent_tags, context)
-
-                    # Adjust node indices to avoid conflicts
-                    for node in nodes:
-                        if node['index'] != 0:  # Don't adjust root node
-                            node['index'] += node_offset
-
-                    # Adjust parent_child_map indices
-                    adjusted_map = {}
-                    for parent_idx, children in parent_child_map.items():
-                        adjusted_parent = int(parent_idx) + node_offset if int(parent_idx) != 0 else 0
-                        adjusted_children = [
-                            child + node_offset if child != 0 else 0
-                            for child in children
-                        ]
-                        adjusted_map[adjusted_parent] = adjusted_children
-
-                    # Add to combined results (skip root node duplicates)
-                    all_nodes.extend([n for n in nodes if n['index'] != 0])
-                    # Merge adjusted maps without overwriting existing entries
-                    for p_idx, children in adjusted_map.items():
-                        if p_idx in combined_parent_child_map:
-                            # Extend and deduplicate
-                            existing = combined_parent_child_map[p_idx]
-                            combined_parent_child_map[p_idx] = list({*existing, *children})
-                        else:
-                            combined_parent_child_map[p_idx] = list(children)
-
-                    # Update offset for next PDF cumulatively based on all_nodes
-                    if all_nodes:
-                        node_offset = max(n['index'] for n in all_nodes) + 1
-                    else:
-                        node_offset += max([n['index'] for n in nodes]) + 1
-
-                    logger.info(f"PDF {idx + 1} processed: {len(nodes)} nodes")
-
-                except Exception as e:
-                    error_msg = f"PDF {idx + 1} failed: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    continue
-
-            # Add root node at the beginning
-            root_node = {
-                "name": "Expenses",
-                "index": 0,
-                "cost": sum(n.get('cost', 0) for n in all_nodes)
-            }
-            all_nodes.insert(0, root_node)
-
-            logger.info(f"Batch processing complete: {len(all_nodes)} total nodes from {len(pdfs_base64)} PDFs")
-
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "message": f"Batch processed {len(pdfs_base64)} PDFs successfully!",
-                    "output": all_nodes,
-                    "parent_child_map": combined_parent_child_map,
-                    "stats": {
-                        "total_nodes": len(all_nodes),
-                        "total_categories": len(combined_parent_child_map),
-                        "pdfs_processed": len(pdfs_base64),
-                        "errors": errors
-                    }
-                }),
+            validate_inputs(pdfs)
+
+            indices = None
+            if event.get("continuation"):
+                indices = read_continuation(event["continuation"], [input_key(item) for item in pdfs])
+
+            logger.info(f"Batch mode: Processing {len(indices) if indices is not None else len(pdfs)} PDFs "
+                        f"({min(BATCH_MAX_WORKERS, len(pdfs))} workers, {PDF_PARSE_PROCESSES} parse processes)")
+
+            if stream_mode:
+                return stream_response(iter_batch_records(pdfs, parent_tags, context, cache_snapshot, indices),
+                                       stream_mode)
+
+            batch_metrics = Metrics()
+            pdf_metrics: Dict[int, Metrics] = {}
+            results, errors, pending = run_batch(pdfs, parent_tags, context, pdf_metrics, deadline, indices)
+            attempted = len(indices) if indices is not None else len(pdfs)
+
+            # Merge in input order so indices don't depend on which PDF finished first;
+            # same-named categories from different PDFs become one node
+            with batch_metrics.stage("merge"):
+                merger = BatchMerger()
+                for result in results:
+                    if result is not None:
+                        merger.add(*result)
+                all_nodes, combined_parent_child_map = merger.result()
+
+            append_stats = None
+            if "existing" in event:
+                with batch_metrics.stage("append"):
+                    all_nodes, combined_parent_child_map, append_stats = append_to_existing(
+                        event["existing"], all_nodes, combined_parent_child_map
+                    )
+
+            batch_metrics.merge(pdf_metrics[idx] for idx in sorted(pdf_metrics))
+
+            logger.info(f"Batch processing complete: {len(all_nodes)} total nodes from {attempted - len(pending)} PDFs"
+                        + (f", {len(pending)} left for the continuation" if pending else ""))
+
+            body = {
+                "message": f"Batch processed {attempted} PDFs successfully!" if not pending else
+                f"Batch processed {attempted - len(pending)} of {attempted} PDFs before the deadline; "
+                f"resubmit the rest with the continuation token",
+                "output": all_nodes,
+                "parent_child_map": combined_parent_child_map,
+                "stats": {
+                    "total_nodes": len(all_nodes),
+                    "total_categories": len(combined_parent_child_map),
+                    "pdfs_processed": attempted - len(pending),
+                    "pdfs_pending": len(pending),
+                    "errors": errors,
+                    "decode_buffers": decode_buffer_stats(),
+                    "cache": _RESULT_CACHE.stats(since=cache_snapshot),
+                    "pdfs": [pdf_metrics[idx].summary() for idx in sorted(pdf_metrics)],
+                    "metrics": batch_metrics.emit(logger, "batch", pdfs=attempted, pending=len(pending)),
+                    "llm_gateway": get_gateway().gauge(),
+                    **({"append": append_stats} if append_stats else {})
+                }
             }
+            if pending:
+                body["partial"] = True
+                body["continuation"] = make_continuation([input_key(item) for item in pdfs], pending)
+
+            return json_response(body, wire_format, compression)
 
         else:
             # Single PDF mode (backward compatible)
             validate_event(event)
 
-            # Decode PDF content
-            if event.get("isBase64Encoded", False):
-                pdf_bytes = base64.b64decode(event["body"])
-            else:
-                pdf_bytes = event["body"].encode("utf-8")
+            metrics = Metrics()
+
+            # Decode PDF content (into a pooled buffer) or map the referenced blob
+            with metrics.stage("decode"):
+                if event.get("ref"):
+                    pdf = open_input({"ref": event["ref"]})
+                else:
+                    pdf = open_input(event["body"], base64_encoded=event.get("isBase64Encoded", False))
 
-            logger.info(f"Single mode: Processing PDF of size {len(pdf_bytes)} bytes")
+            logger.info(f"Single mode: Processing PDF of size {pdf.size} bytes ({pdf.source})")
 
-            nodes, parent_child_map = process_single_pdf(pdf_bytes, parent_tags, context)
+            try:
+                nodes, parent_child_map = process_single_pdf(pdf.data, parent_tags, context, metrics=metrics,
+                                                             deadline=deadline)
+            finally:
+                pdf.close()
 
             logger.info(f"Successfully processed {len(nodes)} nodes")
 
+            if stream_mode:
+                root = next((n for n in nodes if n['index'] == 0), {"name": "Expenses", "index": 0})
+                return stream_response([
+                    *node_records(nodes, parent_child_map),
+                    {
+                        "type": "summary",
+                        "root": root,
+                        "parent_child_map": parent_child_map,
+                        "stats": {
+                            "total_nodes": len(nodes),
+                            "total_categories": len(parent_child_map),
+                            "cache": _RESULT_CACHE.stats(since=cache_snapshot),
+                            "metrics": metrics.emit(logger, "request", pdfs=1, streamed=True),
+                        },
+                        "errors": [],
+                    },
+                ], stream_mode)
+
+            append_stats = None
+            if "existing" in event:
+                with metrics.stage("append"):
+                    nodes, parent_child_map, append_stats = append_to_existing(event["existing"], nodes, parent_child_map)
+
             # Return success response
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "message": "PDF processed successfully!",
-                    "output": nodes,
-                    "parent_child_map": parent_child_map,
-                    "stats": {
-                        "total_nodes": len(nodes),
-                        "total_categories": len(parent_child_map)
-                    }
-                }),
-            }
+            return json_response({
+                "message": "PDF processed successfully!",
+                "output": nodes,
+                "parent_child_map": parent_child_map,
+                "stats": {
+                    "total_nodes": len(nodes),
+                    "total_categories": len(parent_child_map),
+                    "cache": _RESULT_CACHE.stats(since=cache_snapshot),
+                    "metrics": metrics.emit(logger, "request", pdfs=1),
+                    "llm_gateway": get_gateway().gauge(),
+                    **({"append": append_stats} if append_stats else {})
+                }
+            }, wire_format, compression)
         
+    except DeadlineExceeded as e:
+        # Single PDF that can't be finished in this invocation (batches return partial results instead)
+        logger.error(f"Deadline exceeded: {str(e)}")
+        return {
+            "statusCode": 504,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({
+                "error": "Deadline exceeded",
+                "details": str(e)
+            }),
+        }
+
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return {
@@ -294,3 +710,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }),
         }
 
+    finally:
+        if cold_start:
+            log_startup(logger, __name__, _IMPORT_MS, cold_start=True)
+
+
+_IMPORT_MS = log_startup(logger, __name__, (time.perf_counter() - _IMPORT_STARTED) * 1000)["import_ms"]
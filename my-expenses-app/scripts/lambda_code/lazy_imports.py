@@ -0,0 +1,71 @@
+"""
+Deferred imports for cold start. Heavy dependencies (openai, pandas, numpy,
+pypdf, process_amz) are bound as module proxies and only imported on first
+attribute access, so requests that fail validation or hit the result cache
+never pay for them. How long each deferred import took is recorded for the
+STARTUP log line:
+
+    STARTUP {"module": "lambda_function", "import_ms": 12.4, "deferred_ms": {"openai": 655.1, "pypdf": 78.9}}
+"""
+
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Dict
+
+_LOCK = threading.Lock()
+_DEFERRED_MS: Dict[str, float] = {}
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _LOCK:
+                if self._module is None:
+                    started = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    _DEFERRED_MS[self._name] = round((time.perf_counter() - started) * 1000, 1)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str):
+    """The module itself if it is already imported, otherwise a LazyModule for it."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def deferred_import_times() -> Dict[str, float]:
+    """ms spent importing each deferred module so far (only the ones actually used)."""
+    with _LOCK:
+        return dict(_DEFERRED_MS)
+
+
+def log_startup(logger: logging.Logger, module: str, import_ms: float, **fields) -> dict:
+    """Log one STARTUP line: the module's own import time plus the deferred imports so far."""
+    report = {
+        "module": module,
+        "import_ms": round(import_ms, 1),
+        "deferred_ms": deferred_import_times(),
+        **fields,
+    }
+    logger.info("STARTUP " + json.dumps(report))
+    return report
+
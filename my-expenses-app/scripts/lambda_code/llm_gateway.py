@@ -0,0 +1,299 @@
+"""
+Shared gateway for every chat.completions call (process.py and
+process_amz.py). One pooled keep-alive OpenAI client per process, client-side
+requests-per-minute and tokens-per-minute buckets, a concurrency cap, and
+retries with exponential backoff that honour the server's Retry-After, so
+parallel statements run at the quota ceiling instead of into 429s.
+
+Configuration (environment):
+    LLM_RPM              requests per minute (0 = no limit)
+    LLM_TPM              tokens per minute, prompt + completion (0 = no limit)
+    LLM_MAX_CONCURRENCY  requests in flight at once
+    LLM_MAX_RETRIES      retries after a 429 / 5xx / connection error
+    LLM_POOL_SIZE        keep-alive HTTP connections
+    LLM_TIMEOUT_S        per-request timeout
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, List, Optional
+
+from deadline import Deadline, DeadlineExceeded, current_deadline
+from lazy_imports import lazy_import
+from metrics import Metrics, current_metrics
+
+logger = logging.getLogger(__name__)
+
+_openai = lazy_import("openai")
+_httpx = lazy_import("httpx")
+
+LLM_RPM = int(os.getenv('LLM_RPM', '500'))
+LLM_TPM = int(os.getenv('LLM_TPM', '200000'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '20'))
+LLM_TIMEOUT_S = float(os.getenv('LLM_TIMEOUT_S', '120'))
+
+# Backoff when the server gives no Retry-After: base * 2^attempt (+ jitter), capped
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30.0
+# Completion budget reserved from the TPM bucket when the request sets no max
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English / statement text
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket of `per_minute` units (burst = one minute's worth).
+    acquire() blocks until the units are available; settle() corrects a reservation
+    once the real cost is known; pause() empties it after a server-side 429.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` units (capped at capacity); returns the seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= amount:
+                    self.tokens -= amount
+                    return now - started
+                wait = max(self.blocked_until - now, (amount - self.tokens) / self.rate if self.rate else 1.0)
+                self._cond.wait(timeout=max(wait, 0.001))
+
+    def settle(self, reserved: float, actual: float) -> None:
+        """Give back (or take) the difference between a reservation and the real cost."""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + reserved - actual)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds` (the server told us the window is spent)."""
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After / retry-after-ms header on an API error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # HTTP-date form; fall back to our own backoff
+        return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429s, timeouts / connection errors and 5xx are worth retrying; other 4xx are not."""
+    if isinstance(error, (_openai.RateLimitError, _openai.APIConnectionError)):
+        return True
+    if isinstance(error, _openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying front for chat.completions.
+
+    Args:
+        rpm: Requests per minute (0 = unlimited)
+        tpm: Tokens per minute (0 = unlimited)
+        max_concurrency: Requests in flight at once
+        max_retries: Retries for 429 / 5xx / connection errors
+        client: OpenAI client to use (a pooled keep-alive one is created on first call)
+    """
+
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, client: Any = None):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._client = client
+        self._lock = threading.Lock()
+        self._gauge = {"in_flight": 0, "peak_in_flight": 0, "waiting": 0, "requests": 0, "retries": 0,
+                       "rate_limited": 0, "failures": 0, "deadline_skipped": 0, "throttled_ms": 0.0}
+        # Exponentially weighted call latency, used to decide whether a call still fits the deadline.
+        # Unknown until the first call is timed; until then a call only needs the deadline not
+        # to have passed (its timeout is capped at what's left either way)
+        self.call_ms: Optional[float] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = _openai.OpenAI(
+                        api_key=os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_KEY"),
+                        # Retries (and their Retry-After handling) live here, not in the SDK
+                        max_retries=0,
+                        timeout=LLM_TIMEOUT_S,
+                        http_client=_openai.DefaultHttpxClient(
+                            limits=_httpx.Limits(max_connections=LLM_POOL_SIZE,
+                                                 max_keepalive_connections=LLM_POOL_SIZE,
+                                                 keepalive_expiry=60.0),
+                        ),
+                    )
+        return self._client
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self._gauge[key] += amount
+
+    def gauge(self) -> dict:
+        """Current in-flight / waiting requests and running totals."""
+        with self._lock:
+            return {**self._gauge, "throttled_ms": round(self._gauge["throttled_ms"], 1),
+                    "max_concurrency": self.max_concurrency,
+                    "call_ms": round(self.call_ms, 1) if self.call_ms is not None else None}
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt) * (0.5 + random.random() / 2)
+        return delay
+
+    def _throttle(self, estimate: int) -> float:
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += self.tokens.acquire(estimate)
+        return waited
+
+    def _call(self, estimate: int, metrics: Optional[Metrics], kwargs: dict):
+        self._count("waiting")
+        try:
+            waited = self._throttle(estimate)
+            self._slots.acquire()
+        finally:
+            self._count("waiting", -1)
+        if waited:
+            self._count("throttled_ms", waited * 1000)
+            if metrics is not None:
+                metrics.add_time("llm_throttle", waited)
+
+        try:
+            with self._lock:
+                self._gauge["in_flight"] += 1
+                self._gauge["peak_in_flight"] = max(self._gauge["peak_in_flight"], self._gauge["in_flight"])
+                self._gauge["requests"] += 1
+            started = time.perf_counter()
+            response = self.client.chat.completions.create(**kwargs)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.call_ms = elapsed_ms if self.call_ms is None else self.call_ms + 0.2 * (elapsed_ms - self.call_ms)
+            return response
+        finally:
+            with self._lock:
+                self._gauge["in_flight"] -= 1
+            self._slots.release()
+
+    def _check_deadline(self, deadline: Optional[Deadline], extra_ms: float, kwargs: dict) -> None:
+        # Don't start a call the invocation can't wait for; cap its timeout at what's left
+        if deadline is None or deadline.ends_at is None:
+            return
+        try:
+            deadline.check((self.call_ms or 0.0) + extra_ms, "LLM call")
+        except DeadlineExceeded:
+            self._count("deadline_skipped")
+            raise
+        kwargs["timeout"] = min(LLM_TIMEOUT_S, (deadline.remaining_ms() - extra_ms) / 1000)
+
+    def complete(self, messages: List[dict], metrics: Optional[Metrics] = None, deadline: Optional[Deadline] = None,
+                 **kwargs):
+        """
+        chat.completions.create(messages=messages, **kwargs) through the buckets,
+        retrying 429 / 5xx / connection errors. Raises the last error once the
+        retries are used up. Retries and throttle time go to `metrics`
+        (default: the one set with use_metrics). Raises DeadlineExceeded
+        instead of starting (or retrying) a call `deadline` can't cover.
+        """
+        metrics = metrics if metrics is not None else current_metrics()
+        deadline = deadline if deadline is not None else current_deadline()
+        reserve = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+        estimate = sum(estimate_tokens(message.get("content") or "") for message in messages) + reserve
+        kwargs["messages"] = messages
+
+        attempt = 0
+        self._check_deadline(deadline, 0, kwargs)
+        while True:
+            try:
+                response = self._call(estimate, metrics, kwargs)
+            except Exception as e:
+                if self.tokens is not None:
+                    # Failed requests still count against the window server-side; keep the prompt share
+                    self.tokens.settle(estimate, estimate - reserve)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt, e)
+                if isinstance(e, _openai.RateLimitError):
+                    self._count("rate_limited")
+                    # Everyone else waits too, instead of piling more 429s on the same window
+                    if self.requests is not None:
+                        self.requests.pause(delay)
+                try:
+                    self._check_deadline(deadline, delay * 1000, kwargs)
+                except DeadlineExceeded as exceeded:
+                    self._count("failures")
+                    raise exceeded from e
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} "
+                               f"in {delay:.2f}s")
+                self._count("retries")
+                if metrics is not None:
+                    metrics.retry()
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            usage = getattr(response, "usage", None)
+            if self.tokens is not None and usage is not None:
+                self.tokens.settle(estimate, getattr(usage, "total_tokens", estimate) or estimate)
+            return response
+
+
+_GATEWAY: Optional[LLMGateway] = None
+_GATEWAY_LOCK = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway, so every Document on this container shares one quota and pool."""
+    global _GATEWAY
+    if _GATEWAY is None:
+        with _GATEWAY_LOCK:
+            if _GATEWAY is None:
+                _GATEWAY = LLMGateway()
+    return _GATEWAY
@@ -0,0 +1,253 @@
+"""
+Persistent merchant -> category memo.
+Repeat merchants (groceries, rideshare, streaming) are categorized locally
+from what the LLM decided before, so only unseen merchants cost a model call.
+
+Merchant strings are normalized into a canonical key first, e.g.
+"UBER *TRIP HELP.UBER.COM", "UBER *TRIP 8YH2K" and "UBER TRIP SAN FRANCISCO CA"
+all map to "UBER TRIP".
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMO_PATH = "/tmp/merchant_memo.json"
+
+US_STATES = {
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL", "IN", "IA",
+    "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ",
+    "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT",
+    "VA", "WA", "WV", "WI", "WY", "DC",
+}
+
+# First words of multi-word city names ("SAN FRANCISCO CA", "NEW YORK NY")
+CITY_PREFIXES = {"SAN", "SANTA", "LOS", "LAS", "NEW", "FORT", "FT", "SAINT", "ST", "EL", "PALO", "SALT", "NORTH", "SOUTH", "EAST", "WEST"}
+
+# Card processors that prefix the real merchant name ("SQ *BLUE BOTTLE")
+PROCESSOR_PREFIXES = {"SQ", "TST", "SP", "PAYPAL", "PP", "GOOGLE", "APPLE.COM/BILL", "IC", "DD", "PY"}
+
+_DATE_RE = re.compile(r"\b\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?\b")
+_AMOUNT_RE = re.compile(r"-?\$?\d{1,3}(?:,\d{3})*\.\d{2}\b")
+_PHONE_RE = re.compile(r"\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b")
+_URL_RE = re.compile(r"\b(?:[A-Z0-9-]+\.)*([A-Z0-9-]+)\.(?:COM|NET|ORG|CO)\b(?:/\S*)?")
+_STORE_NUMBER_RE = re.compile(r"(?:#\s*\d+|\b\d{3,}\b)")
+_REFERENCE_RE = re.compile(r"^(?=[A-Z0-9]*\d)[A-Z0-9]{4,}$")
+_NON_WORD_RE = re.compile(r"[^A-Z0-9&' ]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def normalize_merchant(description: str) -> str:
+    """
+    Reduce a raw merchant/transaction string to a canonical memo key.
+
+    Strips dates, amounts, phone numbers, URLs, `*`-suffixed reference codes,
+    store numbers and trailing city/state tails.
+
+    Args:
+        description: Raw description or statement line
+
+    Returns:
+        Canonical key (empty string if nothing merchant-like remains)
+    """
+    if not description:
+        return ""
+
+    text = str(description).upper()
+    text = _DATE_RE.sub(" ", text)
+    text = _AMOUNT_RE.sub(" ", text)
+    text = _PHONE_RE.sub(" ", text)
+
+    # "PREFIX *REST": drop processor prefixes, drop reference-code suffixes
+    if "*" in text:
+        head, _, tail = text.partition("*")
+        head, tail = head.strip(), tail.strip()
+        tail_tokens = tail.split()
+        if head in PROCESSOR_PREFIXES:
+            text = tail
+        elif tail_tokens and _REFERENCE_RE.match(tail_tokens[0]):
+            text = head
+        else:
+            text = f"{head} {tail}"
+
+    # "HELP.UBER.COM" -> "UBER"
+    text = _URL_RE.sub(lambda m: f" {m.group(1)} ", text)
+
+    # Everything after a store number is usually the city/state tail
+    store_number = _STORE_NUMBER_RE.search(text)
+    if store_number and store_number.start() > 0:
+        text = text[:store_number.start()]
+
+    tokens = _SPACES_RE.sub(" ", _NON_WORD_RE.sub(" ", text)).strip().split(" ")
+    tokens = [t for t in tokens if t and not _REFERENCE_RE.match(t)]
+    # Drop repeats ("UBER TRIP UBER" after URL folding)
+    tokens = list(dict.fromkeys(tokens))
+
+    # "... AUSTIN TX" -> drop state and the city word(s) before it
+    if len(tokens) >= 2 and tokens[-1] in US_STATES:
+        tokens = tokens[:-1]
+        if len(tokens) >= 2:
+            tokens = tokens[:-1]
+            if len(tokens) >= 2 and tokens[-1] in CITY_PREFIXES:
+                tokens = tokens[:-1]
+
+    return " ".join(tokens)
+
+
+class MerchantMemo:
+    """
+    Thread-safe merchant key -> {name, parenttag} table persisted as JSON.
+
+    Each key keeps per-category vote counts so a single odd LLM answer
+    doesn't flip a merchant that has been categorized consistently. Every
+    LLM (or user) categorization of a merchant is a vote, including ones
+    that agree with the memo; memo hits themselves are not.
+    """
+
+    def __init__(self, path: Optional[str] = None, min_votes: int = 1):
+        self.path = path
+        self.min_votes = min_votes
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> None:
+        """Load entries from disk (missing or corrupt files start empty)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with self._lock:
+                self._entries = data.get("merchants", {})
+                self._version = None
+            logger.info(f"Loaded {len(self._entries)} merchants from {self.path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable merchant memo {self.path}: {e}")
+
+    def save(self) -> None:
+        """Write entries to disk if anything changed since the last save."""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            payload = json.dumps({"merchants": self._entries})
+            self._dirty = False
+        try:
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save merchant memo {self.path}: {e}")
+
+    def lookup(self, description: str, allowed_tags: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """
+        Categorize a transaction locally.
+
+        Args:
+            description: Raw merchant description
+            allowed_tags: Current parent-tag taxonomy; learned tags outside it are ignored
+
+        Returns:
+            {"name": ..., "parenttag": ...} on a hit, else None
+        """
+        key = normalize_merchant(description)
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            parenttag, votes = max(entry["tags"].items(), key=lambda kv: kv[1])
+            if votes < self.min_votes or (allowed_tags is not None and parenttag not in set(allowed_tags)):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return {"name": entry["name"], "parenttag": parenttag}
+
+    def learn(self, description: str, name: str, parenttag: str) -> None:
+        """Record an LLM (or user) categorization for the merchant (one vote for parenttag)."""
+        key = normalize_merchant(description)
+        if not key or not name or not parenttag:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"name": name, "tags": {}}
+                self._version = None
+            before = self._winner(entry)
+            entry["tags"][parenttag] = entry["tags"].get(parenttag, 0) + 1
+            if self._winner(entry) != before:
+                self._version = None
+            self._dirty = True
+
+    def _winner(self, entry: dict):
+        # What lookup() answers for the entry (ignoring the taxonomy filter)
+        if not entry["tags"]:
+            return None
+        parenttag, votes = max(entry["tags"].items(), key=lambda kv: kv[1])
+        return parenttag if votes >= self.min_votes else None
+
+    def version(self) -> str:
+        """
+        Digest of what lookup() would answer for every merchant. Changes when a
+        merchant is added or its category flips, not on every extra vote, so
+        results cached under it stay valid while the memo only gains confidence.
+        """
+        with self._lock:
+            if self._version is None:
+                digest = hashlib.sha256()
+                for key in sorted(self._entries):
+                    entry = self._entries[key]
+                    digest.update(f"{key}\0{entry['name']}\0{self._winner(entry)}\n".encode("utf-8"))
+                self._version = digest.hexdigest()[:16]
+            return self._version
+
+    def stats(self) -> dict:
+        """Hit/miss counters and table size."""
+        return {"hits": self.hits, "misses": self.misses, "merchants": len(self._entries)}
+
+
+_DEFAULT_MEMO = None
+_DEFAULT_MEMO_LOCK = threading.Lock()
+
+
+def get_default_memo() -> Optional[MerchantMemo]:
+    """
+    Shared memo for the process (loaded once per container).
+    - MERCHANT_MEMO_PATH: JSON file location (default /tmp/merchant_memo.json)
+    - MERCHANT_MEMO_DISABLED=1: turn the memo off entirely
+    """
+    global _DEFAULT_MEMO
+
+    if os.getenv("MERCHANT_MEMO_DISABLED") == "1":
+        return None
+
+    with _DEFAULT_MEMO_LOCK:
+        if _DEFAULT_MEMO is None:
+            _DEFAULT_MEMO = MerchantMemo(path=os.getenv("MERCHANT_MEMO_PATH", DEFAULT_MEMO_PATH))
+        return _DEFAULT_MEMO
+
+
+def memo_version() -> Optional[str]:
+    """Version of the shared memo (None when it is disabled), for result cache keys."""
+    memo = get_default_memo()
+    return memo.version() if memo is not None else None
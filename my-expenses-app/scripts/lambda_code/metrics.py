@@ -0,0 +1,110 @@
+"""
+Per-stage timings and LLM usage for one unit of work (a PDF, a CSV upload,
+a batch). Thread-safe, so chunk / row workers can record into the same
+object. Summaries go into response stats, and emit() writes one structured
+JSON log line per unit:
+
+    METRIC {"metric": "pdf", "pdf": 2, "stages": {"pdf_extract": {"ms": 41.2, "count": 1}, ...},
+            "llm": {"calls": 3, "prompt_tokens": 2210, "completion_tokens": 1904, ...}, "total_ms": 2875.4}
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+
+class Metrics:
+    """Accumulates stage timers, LLM usage and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.llm = {"calls": 0, "failures": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                    "models": {}}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; repeated stages add up (ms) and count their calls."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float, count: int = 1) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, {"ms": 0.0, "count": 0})
+            stage["ms"] += seconds * 1000
+            stage["count"] += count
+
+    def record_llm(self, response: Any = None, failed: bool = False) -> None:
+        """Count one chat.completions call and its usage block (if the response has one)."""
+        usage = getattr(response, "usage", None)
+        model = getattr(response, "model", None)
+        with self._lock:
+            self.llm["calls"] += 1
+            if failed:
+                self.llm["failures"] += 1
+            if usage is not None:
+                self.llm["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                self.llm["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            if model:
+                self.llm["models"][model] = self.llm["models"].get(model, 0) + 1
+
+    def retry(self, count: int = 1) -> None:
+        with self._lock:
+            self.llm["retries"] += count
+
+    def merge(self, others: Iterable["Metrics"]) -> "Metrics":
+        """Fold other Metrics (e.g. one per PDF) into this one."""
+        for other in others:
+            summary = other.summary()
+            for name, stage in summary["stages"].items():
+                self.add_time(name, stage["ms"] / 1000, int(stage["count"]))
+            with self._lock:
+                for key in ("calls", "failures", "retries", "prompt_tokens", "completion_tokens"):
+                    self.llm[key] += summary["llm"][key]
+                for model, calls in summary["llm"]["models"].items():
+                    self.llm["models"][model] = self.llm["models"].get(model, 0) + calls
+        return self
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {name: {"ms": round(stage["ms"], 1), "count": int(stage["count"])}
+                           for name, stage in self.stages.items()},
+                "llm": {**self.llm, "models": dict(self.llm["models"])},
+                "total_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            }
+
+    def emit(self, logger: logging.Logger, metric: str, **fields) -> dict:
+        """Log one structured METRIC line and return the summary that was logged."""
+        summary = self.summary()
+        logger.info("METRIC " + json.dumps({"metric": metric, **fields, **summary}, default=str))
+        return summary
+
+
+_CURRENT = contextvars.ContextVar("current_metrics", default=None)
+
+
+@contextmanager
+def use_metrics(metrics: Metrics):
+    """
+    Make metrics the default for Documents created in this thread/context,
+    so LLM usage inside a processor we don't construct ourselves is still
+    attributed to the right PDF.
+    """
+    token = _CURRENT.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _CURRENT.reset(token)
+
+
+def current_metrics() -> Optional[Metrics]:
+    return _CURRENT.get()
@@ -1,23 +1,111 @@
 import json
-import pandas as pd
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
 import os
-
-# Set your OpenAI API key
-client = OpenAI()
-OpenAI_Key = os.getenv('OPENAI_KEY')
-OpenAI.api_key = OpenAI_Key
+from category_classifier import CategoryClassifier, get_default_classifier, min_confidence, min_margin, min_similarity
+from lazy_imports import lazy_import
+from deadline import Deadline, DeadlineExceeded, current_deadline
+from llm_gateway import get_gateway
+from merchant_memo import MerchantMemo, get_default_memo, normalize_merchant
+from metrics import Metrics, current_metrics
+from statement_formats import categorize, detect_csv_format, fast_path_enabled, parse_csv, tag_list
+from viz_builder import TransactionColumns, append_viz, build_viz
+
+# pandas (~350ms) loads on first use, not at import (the OpenAI SDK via llm_gateway)
+pd = lazy_import("pandas")
+
+# Rows classified concurrently (each row is one blocking LLM call)
+CSV_MAX_CONCURRENCY = int(os.getenv('CSV_MAX_CONCURRENCY', '8'))
+
+# Rows packed into one structured-output request (1 = one free-text prompt per row)
+CSV_BATCH_SIZE = int(os.getenv('CSV_BATCH_SIZE', '25'))
+
+# CSV columns that carry the merchant description / amount, in priority order
+DESCRIPTION_COLUMNS = ("Description", "Merchant", "Name", "Payee")
+AMOUNT_COLUMNS = ("Amount", "Debit")
+DATE_COLUMNS = ("Date", "Transaction Date", "Trans. Date", "Posted Date", "Post Date")
+# Item fields carried into the transaction nodes
+CSV_DETAIL_FIELDS = ("date", "description")
+
+
+def row_value(row, columns):
+    """Return the first non-empty value among the given columns (case-insensitive)."""
+    lookup = {str(col).strip().lower(): col for col in row.index}
+    for column in columns:
+        key = lookup.get(column.lower())
+        if key is not None and not pd.isna(row[key]) and str(row[key]).strip() != "":
+            return row[key]
+    return None
+
+
+def row_date(row):
+    """The row's transaction date as written in the CSV, or None."""
+    value = row_value(row, DATE_COLUMNS)
+    return str(value).strip() if value is not None else None
+
+
+def compact_row(row):
+    """Serialize a row as compact JSON with empty cells dropped (far fewer tokens than row.to_string())."""
+    return json.dumps({str(k): str(v) for k, v in row.items() if not pd.isna(v) and str(v).strip() != ""},
+                      separators=(",", ":"))
+
+
+def batch_response_format(allparenttags):
+    """JSON schema for one record per row, keyed by the row id we sent."""
+    parenttag = {"type": "string", "description": "Parent tag taken from the given list."}
+    tags = tag_list(allparenttags)
+    if tags:
+        parenttag["enum"] = tags
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "categorized_rows",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "records": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "integer", "description": "The id of the input row."},
+                                "name": {"type": "string", "description": "Concise name of the transaction."},
+                                "cost": {"type": "number", "description": "The amount of the transaction."},
+                                "parenttag": parenttag,
+                            },
+                            "required": ["id", "name", "cost", "parenttag"],
+                            "additionalProperties": False,
+                        },
+                    }
+                },
+                "required": ["records"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def parse_amount(value):
+    """Parse '$1,234.50' / '-12.3' / 12.3 into a float, or None."""
+    try:
+        return float(str(value).replace("$", "").replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
 
 
 class Item:
-    def __init__(self, name=None, price=None, index=None, parenttag=None, raw_str=None, alltags=None, allparenttags=None):
+    # Slots and no per-item taxonomy references: long histories hold one of these per transaction
+    __slots__ = ("name", "cost", "parenttag", "index", "date", "description", "raw_str")
+
+    def __init__(self, name=None, price=None, index=None, parenttag=None, raw_str=None, date=None, description=None):
         self.name = name
         self.cost = price
         self.parenttag = parenttag
         self.index = index
-        self.raw_str = raw_str  # store the entire row as a string
-        self.alltags = alltags
-        self.allparenttags = allparenttags
+        self.date = date  # transaction date from the row; the store files the item under its month
+        self.description = description  # raw merchant text from the row, kept for classifier training
+        self.raw_str = raw_str  # the row as a string, only kept until the item is classified
 
     def __repr__(self):
         return f"Item(name='{self.name}', index={self.index}, cost={self.cost}, parenttag='{self.parenttag}'')"
@@ -31,7 +119,7 @@ class Item:
             isinstance(self.parenttag, str) and self.parenttag.strip() != ""
         )
 
-    def setdetails(self):
+    def setdetails(self, allparenttags=None, metrics=None, deadline=None):
         # Use the entire row string in the prompt.
         # We know the CSV has columns including 'Description' (which we treat as the item name)
         # and 'Amount' (treated as the price).
@@ -41,7 +129,7 @@ class Item:
             f"{self.raw_str}\n\n"
             f"From this record, extract the following details and return them in the exact format shown:\n"
             f"The name should be a concise version of what the transaction should be\n"
-            f"Choose the parent tags from this list: {self.allparenttags}\n"
+            f"Choose the parent tags from this list: {allparenttags}\n"
             f"Choose the best parent tag for this particular transaction\n"
             f"name: <item name>\n"
             f"cost: <item price>\n"
@@ -49,7 +137,7 @@ class Item:
             f"parenttag: <broader category from the parent tag list given>\n"
         )
 
-        completion = self.run_openai(tag_prompt)
+        completion = self.run_openai(tag_prompt, metrics=metrics, deadline=deadline)
         content = completion.choices[0].message.content
 
         lines = content.strip().split('\n')
@@ -72,91 +160,302 @@ class Item:
                 self.parenttag = line.split(':', 1)[1].strip()
 
         # print(self)
+        return completion
 
-    def run_openai(self, prompt=""):
-        completion = client.chat.completions.create(
+    def run_openai(self, prompt="", metrics=None, deadline=None):
+        # Passed explicitly: this runs on pool threads, which don't see the caller's contextvars
+        completion = get_gateway().complete(
+            [{"role": "user", "content": prompt}],
+            metrics=metrics,
+            deadline=deadline,
             model="gpt-4o-mini",
             store=False,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
         )
 
         return completion
 
 
 class Document:
-    def __init__(self, df: pd.DataFrame, alltags=None, allparenttags=None):
+    def __init__(self, df: "pd.DataFrame", alltags=None, allparenttags=None, memo: MerchantMemo = None,
+                 classifier: CategoryClassifier = None, metrics: Metrics = None,
+                 deadline: Deadline = None):
         self.document = df
         self.items = []
         self.alltags = alltags
         self.allparenttags = allparenttags
+        # Memo / classifier labels outside the current tags are dropped (the row goes to the LLM)
+        self.allowed_tags = tag_list(allparenttags)
+        # Merchant -> category memo; repeat merchants skip the LLM
+        self.memo = memo if memo is not None else get_default_memo()
+        # Local classifier; confident predictions skip the LLM too
+        self.classifier = classifier if classifier is not None else get_default_classifier()
+        # Stage timings and LLM usage (the caller's, when passed in or set with use_metrics)
+        self.metrics = metrics or current_metrics() or Metrics()
+        # Invocation deadline: LLM calls that can't finish in time aren't started
+        self.deadline = deadline or current_deadline()
+        self.stats = {}
+
+    def item_from_memo(self, index, row):
+        # Categorize locally when the merchant was seen before
+        if self.memo is None:
+            return None
+        description = row_value(row, DESCRIPTION_COLUMNS)
+        amount = parse_amount(row_value(row, AMOUNT_COLUMNS))
+        if description is None or amount is None:
+            return None
+        hit = self.memo.lookup(str(description), allowed_tags=self.allowed_tags)
+        if hit is None:
+            return None
+        return Item(name=hit["name"], price=abs(amount), index=index, parenttag=hit["parenttag"], date=row_date(row),
+                    description=str(description))
+
+    def classify_locally(self, rows, results):
+        # Memo hits, then one batched classifier pass; returns positions that still need the LLM
+        pending = []
+        for position, (index, row) in enumerate(rows):
+            temp_item = self.item_from_memo(index, row)
+            if temp_item is not None:
+                results[position] = temp_item
+            else:
+                pending.append(position)
+
+        if self.classifier is None or not pending:
+            return pending
+
+        candidates = []
+        for position in pending:
+            row = rows[position][1]
+            description = row_value(row, DESCRIPTION_COLUMNS)
+            amount = parse_amount(row_value(row, AMOUNT_COLUMNS))
+            if description is not None and amount is not None:
+                candidates.append((position, str(description), amount))
+
+        labels = self.classifier.predict_confident([description for _, description, _ in candidates], min_confidence(),
+                                                   min_similarity(), min_margin(), allowed_tags=self.allowed_tags)
+        resolved = set()
+        for (position, description, amount), label in zip(candidates, labels):
+            if label is None:
+                continue
+            index, row = rows[position]
+            results[position] = Item(name=normalize_merchant(description).title() or description, price=abs(amount),
+                                     index=index, parenttag=label, date=row_date(row), description=description)
+            resolved.add(position)
+        print(f"Categorized locally: {len(rows) - len(pending)} from memo, {len(resolved)} from classifier")
+        return [position for position in pending if position not in resolved]
+
+    def classify_row(self, index, row):
+        # Categorize one CSV row with the LLM
+        # Convert the entire row to a string for the prompt
+        raw_str = row.to_string()
+        description = row_value(row, DESCRIPTION_COLUMNS)
+        temp_item = Item(raw_str=raw_str, date=row_date(row),
+                         description=str(description) if description is not None else None)
+        try:
+            with self.metrics.stage("llm"):
+                completion = temp_item.setdetails(self.allparenttags, metrics=self.metrics, deadline=self.deadline)
+        except Exception:
+            self.metrics.record_llm(failed=True)
+            raise
+        self.metrics.record_llm(completion)
+        if self.memo is not None and description is not None and temp_item.is_valid():
+            self.memo.learn(str(description), temp_item.name, temp_item.parenttag)
+        return temp_item
+
+    def run_openai(self, prompt="", response_format=None):
+        kwargs = {"response_format": response_format} if response_format else {}
+        try:
+            with self.metrics.stage("llm"):
+                completion = get_gateway().complete(
+                    [{"role": "user", "content": prompt}],
+                    metrics=self.metrics,
+                    deadline=self.deadline,
+                    model="gpt-4o-mini",
+                    store=False,
+                    **kwargs
+                )
+        except Exception:
+            self.metrics.record_llm(failed=True)
+            raise
+        self.metrics.record_llm(completion)
+
+        return completion
 
-    def convert_doc_to_items(self):
-        for _, row in self.document.iterrows():
-            # Convert the entire row to a string for the prompt
-            raw_str = row.to_string()
-            temp_item = Item(raw_str=raw_str, alltags=self.alltags,
-                             allparenttags=self.allparenttags)
-            temp_item.setdetails()
-            if temp_item.is_valid():
+    def request_batch(self, rows, positions):
+        # One structured-output call for several rows; returns {row id: record}
+        lines = "\n".join(f'{{"id":{position},"row":{compact_row(rows[position][1])}}}' for position in positions)
+        prompt = (
+            f"Here are {len(positions)} transaction records, one JSON object per line:\n\n"
+            f"{lines}\n\n"
+            f"For every record return its id, a concise name for the transaction, "
+            f"its cost and the best parent tag from this list: {self.allparenttags}\n"
+        )
+        completion = self.run_openai(prompt, response_format=batch_response_format(self.allparenttags))
+        with self.metrics.stage("json_parse"):
+            content = json.loads(completion.choices[0].message.content)
+        return {record["id"]: record for record in content.get("records", []) if "id" in record}
+
+    def classify_batch(self, rows, positions):
+        # Returns {row position: Item}; failed or partial batches are split and retried
+        try:
+            records = self.request_batch(rows, positions)
+        except DeadlineExceeded:
+            # Splitting won't help; nothing more can be started in time
+            raise
+        except Exception as e:
+            print(f"Batch of {len(positions)} rows failed: {e}")
+            records = {}
+
+        items = {}
+        for position in positions:
+            record = records.get(position)
+            if record is None:
+                continue
+            index, row = rows[position]
+            cost = parse_amount(record.get("cost"))
+            description = row_value(row, DESCRIPTION_COLUMNS)
+            temp_item = Item(name=record.get("name"), price=abs(cost) if cost is not None else None, index=index,
+                             parenttag=record.get("parenttag"), date=row_date(row),
+                             description=str(description) if description is not None else None)
+            if not temp_item.is_valid():
+                continue
+            items[position] = temp_item
+            if self.memo is not None and description is not None:
+                self.memo.learn(str(description), temp_item.name, temp_item.parenttag)
+
+        missing = [position for position in positions if position not in items]
+        if missing and len(positions) > 1:
+            # Every retry is strictly smaller than this batch, so this terminates
+            if len(missing) == len(positions):
+                middle = len(missing) // 2
+                retries = [missing[:middle], missing[middle:]]
+            else:
+                retries = [missing]
+            self.metrics.retry(len(retries))
+            for retry in retries:
+                items.update(self.classify_batch(rows, retry))
+
+        return items
+
+    def complete(self, prompt, response_format):
+        return self.run_openai(prompt, response_format=response_format).choices[0].message.content
+
+    def classify_known_format(self, fmt, rows, results):
+        # Fast path: columns parsed locally, only categories of unknown merchants go to the LLM
+        records = parse_csv(self.document, fmt)
+        categories = categorize([record["description"] for record in records], self.allparenttags,
+                                self.memo, self.complete, classifier=self.classifier)
+        failed = 0
+        for record, (name, parenttag) in zip(records, categories):
+            if parenttag is None:
+                failed += 1
+                continue
+            position = record["position"]
+            results[position] = Item(name=name or record["description"], price=record["amount"],
+                                     index=rows[position][0], parenttag=parenttag, date=record["date"] or None,
+                                     description=record["description"])
+        return failed
+
+    def classify_batched(self, rows, results, pool, batch_size):
+        # Memo/classifier hits are resolved locally, the rest go out batch_size rows per request
+        pending = self.classify_locally(rows, results)
+
+        batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        futures = [pool.submit(self.classify_batch, rows, batch) for batch in batches]
+
+        failed = 0
+        for batch, future in zip(batches, futures):
+            try:
+                found = future.result()
+            except Exception as e:
+                print(f"Batch of {len(batch)} rows failed: {e}")
+                found = {}
+            for position in batch:
+                if position in found:
+                    results[position] = found[position]
+                else:
+                    failed += 1
+        return failed
+
+    def convert_doc_to_items(self, max_concurrency=None, batch_size=None):
+        max_concurrency = max_concurrency or CSV_MAX_CONCURRENCY
+        batch_size = CSV_BATCH_SIZE if batch_size is None else batch_size
+        rows = list(self.document.iterrows())
+        results = [None] * len(rows)
+        failed = 0
+        started = time.perf_counter()
+        with self.metrics.stage("detect_format"):
+            fmt = detect_csv_format(self.document) if fast_path_enabled() else None
+
+        with self.metrics.stage("classify"), ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(rows) or 1))) as pool:
+            if fmt is not None:
+                print(f"Detected {fmt.name} CSV export, using the fast path")
+                failed = self.classify_known_format(fmt, rows, results)
+            elif batch_size > 1:
+                failed = self.classify_batched(rows, results, pool, batch_size)
+            else:
+                pending = self.classify_locally(rows, results)
+                futures = {position: pool.submit(self.classify_row, *rows[position]) for position in pending}
+                # Collect in row order so self.items matches the CSV order
+                for position, future in futures.items():
+                    try:
+                        results[position] = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"Row {rows[position][0]} failed: {e}")
+
+        for temp_item in results:
+            if temp_item is not None and temp_item.is_valid():
+                temp_item.raw_str = None
                 self.items.append(temp_item)
                 print(temp_item)
 
+        elapsed = time.perf_counter() - started
+        self.stats = {
+            "rows": len(rows),
+            "items": len(self.items),
+            "failed": failed,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(len(rows) / elapsed, 2) if elapsed > 0 else None,
+            "batch_size": batch_size,
+            "format": fmt.name if fmt is not None else None,
+            "metrics": self.metrics.summary(),
+        }
+        print(f"Classified {len(rows)} rows in {elapsed:.2f}s "
+              f"({self.stats['rows_per_second']} rows/s, {failed} failed, "
+              f"concurrency {max_concurrency}, batch size {batch_size})")
+
+        if self.memo is not None:
+            self.memo.save()
+            print("Merchant memo:", self.memo.stats())
+
     def show_items(self):
         for item in self.items:
             print(item)
 
     def convert_data(self):
 
-        # Conversion Logic
-        output = {"nodes": []}
-        parent_tags = {}
-        parent_child_map = {}
-        current_index = 0
+        # Conversion Logic (nodes and parent_child_map built from the columnar store)
+        with self.metrics.stage("build_viz"):
+            output, parent_child_map = build_viz(TransactionColumns.from_items(self.items, detail_fields=CSV_DETAIL_FIELDS))
 
-        # Add root node
-        output["nodes"].append({"name": "Expenses", "index": current_index})
-        current_index += 1
+        # Write JSON output to files
+        with open("output.json", "w") as output_file:
+            json.dump(output, output_file, indent=4)
 
-        for item in self.items:
-            if item.parenttag not in parent_tags:
-                # Add parent tag node
-                parent_tags[item.parenttag] = current_index
-                output["nodes"].append(
-                    {"name": item.parenttag, "index": current_index})
-                parent_child_map[current_index] = []
-                current_index += 1
-
-            # Add transaction node
-            transaction_index = current_index
-            output["nodes"].append({
-                "name": item.name,
-                "cost": item.cost,
-                "index": transaction_index
-            })
-            parent_child_map[parent_tags[item.parenttag]].append(
-                transaction_index)
-            current_index += 1
-
-            # Output Result
-            print(json.dumps(output, indent=4))
-
-            # Output Parent-Child Map
-            print("Parent-Child Map:")
-            print(json.dumps(parent_child_map, indent=4))
-
-            # Write JSON output to files
-            with open("output.json", "w") as output_file:
-                json.dump(output, output_file, indent=4)
-
-            with open("parent_child_map.json", "w") as map_file:
-                json.dump(parent_child_map, map_file, indent=4)
-
-            print(
-                "Data successfully written to 'output.json' and 'parent_child_map.json'")
-            
-            return (output, parent_child_map)
+        with open("parent_child_map.json", "w") as map_file:
+            json.dump(parent_child_map, map_file, indent=4)
+
+        print(
+            "Data successfully written to 'output.json' and 'parent_child_map.json'")
+
+        return (output, parent_child_map)
+
+    def append_to_viz(self, output, parent_child_map):
+        # Add this document's items to an existing convert_data result in place (new month on top of the history)
+        nodes = output["nodes"] if isinstance(output, dict) else output
+        stats = append_viz(nodes, parent_child_map, TransactionColumns.from_items(self.items, detail_fields=CSV_DETAIL_FIELDS))
+        print(f"Appended to existing graph: {stats}")
+        return (output, parent_child_map)
 
 
 def main():
@@ -1,24 +1,116 @@
 import json
-from openai import OpenAI
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import os
-
-client = OpenAI()
-OpenAI_Key = os.getenv('OPENAI_KEY')
-OpenAI.api_key = OpenAI_Key
+from chunking import split_into_chunks
+from category_classifier import CategoryClassifier, get_default_classifier
+from deadline import Deadline, current_deadline
+from llm_gateway import get_gateway
+from merchant_memo import MerchantMemo, get_default_memo
+from metrics import Metrics, current_metrics
+from statement_formats import categorize, parse_statement_text, tag_list
+from statement_lines import prestructure
+from viz_builder import TransactionColumns, append_viz, build_viz
+
+
+# Long statements are split into windows that are extracted concurrently.
+# Output is capped at 4096 tokens and each transaction costs ~60-80 output
+# tokens, so windows stay small enough for their JSON to fit.
+CHUNK_MAX_TOKENS = int(os.getenv('LLM_CHUNK_MAX_TOKENS', '1200'))
+CHUNK_OVERLAP_LINES = int(os.getenv('LLM_CHUNK_OVERLAP_LINES', '2'))
+CHUNK_MAX_WORKERS = int(os.getenv('LLM_CHUNK_MAX_WORKERS', '4'))
+# How many times a window whose reply doesn't parse (truncated output) is halved and retried
+CHUNK_MAX_SPLITS = 2
+# Send only candidate transaction lines (compact table) instead of the raw text
+PRESTRUCTURE_ENABLED = os.getenv('LLM_PRESTRUCTURE', '1') == '1'
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o-mini')
+
+TRANSACTIONS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "transactions_list",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "transactions": {
+                    "type": "array",
+                    "description": "A list of transactions.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "The name of the transaction."
+                            },
+                            "price": {
+                                "type": "number",
+                                "description": "The cost or price of the transaction."
+                            },
+                            "date": {
+                                "type": "string",
+                                "description": "The date of the transaction."
+                            },
+                            "parenttag": {
+                                "type": "string",
+                                "description": "The parent tag taken from the list of the parenttags."
+                            },
+                            "index": {
+                                "type": "number",
+                                "description": "The index of the transaction."
+                            },
+                            "raw_str": {
+                                "type": "string",
+                                "description": "The raw string of the transaction."
+                            },
+                            "location": {
+                                "type": "string",
+                                "description": "The location or merchant address of the transaction."
+                            },
+                            "file_source": {
+                                "type": "string",
+                                "description": "The source of the file (e.g., 'amex', 'capitalone', 'chase', etc.)."
+                            }
+                        },
+                        "required": [
+                            "name",
+                            "price",
+                            "date",
+                            "parenttag",
+                            "index",
+                            "raw_str",
+                            "location",
+                            "file_source"
+                        ],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": [
+                "transactions"
+            ],
+            "additionalProperties": False
+        }
+    }
+}
 
 
 class Item:
-    def __init__(self, name=None, price=None, date=None, index=None, parenttag=None, raw_str=None, alltags=None, allparenttags=None, location=None, file_source=None):
+    # Slots and no per-item taxonomy references: long histories hold one of these per transaction
+    __slots__ = ("name", "cost", "date", "parenttag", "index", "raw_str", "location", "file_source", "description")
+
+    def __init__(self, name=None, price=None, date=None, index=None, parenttag=None, raw_str=None, location=None, file_source=None,
+                 description=None):
         self.name = name
         self.cost = abs(price)
         self.date = date
         self.parenttag = parenttag
         self.index = index
-        self.raw_str = raw_str
-        self.alltags = alltags
-        self.allparenttags = allparenttags
+        self.raw_str = raw_str  # only kept until the memo has seen it
         self.location = location
         self.file_source = file_source
+        self.description = description  # raw merchant text, kept for classifier training
 
     def __repr__(self):
         return f"Item(name='{self.name}', index={self.index}, cost={self.cost}, parenttag='{self.parenttag}', date='{self.date}', location='{self.location}', file_source='{self.file_source}')"
@@ -33,18 +125,79 @@ class Item:
         )
 
 
+def transaction_key(transaction):
+    return (str(transaction.get("date")).strip(), round(abs(transaction.get("price") or 0), 2))
+
+
+def merge_chunk_transactions(chunks, chunk_results):
+    """
+    Concatenate per-chunk transactions in document order, dropping the copies
+    of lines that both neighbouring windows saw (their shared overlap lines).
+    """
+    merged = []
+    previous = []
+    for chunk, transactions in zip(chunks, chunk_results):
+        # Transactions the previous window already returned, by (date, amount)
+        seen = {}
+        for transaction in previous:
+            key = transaction_key(transaction)
+            seen[key] = seen.get(key, 0) + 1
+
+        overlap_text = chunk.overlap_text.replace(",", "") if chunk.overlap_text else ""
+        for transaction in transactions:
+            key = transaction_key(transaction)
+            # Whole amount only: 5.00 must not match inside 15.00 or 105.00
+            in_overlap = overlap_text and re.search(rf"(?<![\d.]){re.escape(f'{key[1]:.2f}')}(?!\d)", overlap_text)
+            if in_overlap and seen.get(key, 0) > 0:
+                seen[key] -= 1
+                continue
+            merged.append(transaction)
+        previous = transactions
+
+    return merged
+
+
 class Document:
-    def __init__(self, text: str, alltags=None, allparenttags=None):
+    def __init__(self, text: str, alltags=None, allparenttags=None, memo: MerchantMemo = None,
+                 classifier: CategoryClassifier = None, metrics: Metrics = None,
+                 deadline: Deadline = None):
         self.document = text
         self.items = []
         self.alltags = alltags
         self.allparenttags = allparenttags
+        # Merchant -> category memo (keeps repeat merchants consistent across statements)
+        self.memo = memo if memo is not None else get_default_memo()
+        # Local classifier (fast path only: the LLM extraction call categorizes as it extracts)
+        self.classifier = classifier if classifier is not None else get_default_classifier()
+        # Stage timings and LLM usage (the caller's, when passed in or set with use_metrics)
+        self.metrics = metrics or current_metrics() or Metrics()
+        # Invocation deadline: LLM calls that can't finish in time aren't started
+        self.deadline = deadline or current_deadline()
+        self.stats = {}
+        # Windows whose reply never parsed, even after splitting; their transactions are missing
+        self.failed_windows = 0
+        self._failed_lock = threading.Lock()
+
+    def apply_memo(self, item):
+        # The LLM's own category is a vote for the merchant; the memo only fills in a
+        # category the LLM left out (or put outside the taxonomy) and keeps the LLM's name
+        if self.memo is None:
+            return
+        description = item.raw_str or item.name
+        allowed_tags = tag_list(self.allparenttags)
+        if isinstance(item.parenttag, str) and item.parenttag.strip() and (
+                allowed_tags is None or item.parenttag in allowed_tags):
+            if item.is_valid():
+                self.memo.learn(description, item.name, item.parenttag)
+            return
+        hit = self.memo.lookup(description, allowed_tags=allowed_tags)
+        if hit is not None:
+            item.parenttag = hit["parenttag"]
 
-    def extractdetails(self):
-        # Use the entire document string in the prompt.
-        tag_prompt = (
+    def build_prompt(self, text):
+        return (
             f"Here is an entire transaction record:\n\n"
-            f"{self.document}\n\n"
+            f"{text}\n\n"
             f"From this record, extract the following details and return them in the exact format shown in a JSON format:\n"
             f"The name should be a concise version of what the transaction should be\n"
             f"Choose the parent tags from this list: {self.allparenttags}\n"
@@ -52,129 +205,140 @@ class Document:
             f"Extract the location/merchant address if available, else set it to 'Unknown'\n"
         )
 
-        content = self.run_openai(prompt=tag_prompt)
+    def extract_chunk(self, text, splits_left=CHUNK_MAX_SPLITS):
+        # Returns the transaction dicts found in one window of text
+        content = self.run_openai(prompt=self.build_prompt(text))
         print("Output from OpenAI \n", content)
         try:
-            content_json = json.loads(content)
-            # print("output", content_json, type(content_json))
-
-        except json.JSONDecodeError as e:
+            with self.metrics.stage("json_parse"):
+                return json.loads(content).get('transactions') or []
+        except (json.JSONDecodeError, TypeError, AttributeError) as e:
+            # TypeError: no content at all (refusal); AttributeError: JSON that isn't an object
             print(f"Failed to decode JSON: {e}")
             print("output", content, type(content))
 
-        for transaction in content_json.get('transactions'):
+        # Most likely the reply hit max_completion_tokens: halve the window and retry
+        lines = text.splitlines()
+        if splits_left <= 0 or len(lines) < 2:
+            with self._failed_lock:
+                self.failed_windows += 1
+            return []
+        middle = len(lines) // 2
+        self.metrics.retry()
+        return (self.extract_chunk("\n".join(lines[:middle]), splits_left - 1) +
+                self.extract_chunk("\n".join(lines[middle:]), splits_left - 1))
+
+    def complete(self, prompt, response_format):
+        return self.run_openai(prompt=prompt, response_format=response_format)
+
+    def items_from_records(self, records):
+        # Fast path: fields came from a known issuer layout, only categories need the LLM
+        with self.metrics.stage("categorize"):
+            categories = categorize([record["description"] for record in records], tag_list(self.allparenttags),
+                                    self.memo, self.complete, classifier=self.classifier)
+        for position, (record, (name, parenttag)) in enumerate(zip(records, categories)):
+            item = Item(
+                name=name or record["description"],
+                price=record["amount"],
+                date=record["date"],
+                index=position,
+                parenttag=parenttag,
+                location="Unknown",
+                file_source=record["file_source"],
+                description=record["description"]
+            )
+            if item.is_valid():
+                self.items.append(item)
+
+        if self.memo is not None:
+            self.memo.save()
+
+    def extractdetails(self):
+        with self.metrics.stage("fast_path_parse"):
+            records = parse_statement_text(self.document)
+        if records is not None:
+            self.items_from_records(records)
+            return
+
+        text = self.document
+        if PRESTRUCTURE_ENABLED:
+            with self.metrics.stage("prestructure"):
+                result = prestructure(text)
+            if result is not None:
+                text = result.text
+                self.stats["prestructure"] = result.report()
+                print(f"Pre-structured prompt: {result.report()}")
+
+        chunks = split_into_chunks(text, max_tokens=CHUNK_MAX_TOKENS, overlap_lines=CHUNK_OVERLAP_LINES)
+        print(f"Extracting {len(chunks)} chunk(s)")
+
+        with self.metrics.stage("extract"):
+            if len(chunks) == 1:
+                chunk_results = [self.extract_chunk(chunks[0].text)]
+            else:
+                with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_MAX_WORKERS, len(chunks)))) as pool:
+                    chunk_results = list(pool.map(lambda chunk: self.extract_chunk(chunk.text), chunks))
+
+        with self.metrics.stage("merge_chunks"):
+            transactions = merge_chunk_transactions(chunks, chunk_results)
+        if self.failed_windows:
+            self.stats["failed_windows"] = self.failed_windows
+            print(f"{self.failed_windows} window(s) never returned parseable JSON; their transactions are missing")
+
+        for position, transaction in enumerate(transactions):
             item = Item(
                 name=transaction.get("name"),
                 price=transaction.get("price"),
                 date=transaction.get("date"),
-                index=transaction.get("index"),
+                # Per-chunk indices collide, so number transactions in document order
+                index=position if len(chunks) > 1 else transaction.get("index"),
                 raw_str=transaction.get("raw_str"),
                 parenttag=transaction.get("parenttag"),
-                alltags=self.alltags,
-                allparenttags=self.allparenttags,
                 location=transaction.get("location"),
-                file_source=transaction.get("file_source")
+                file_source=transaction.get("file_source"),
+                description=(transaction.get("raw_str") or "").strip() or None
             )
+            self.apply_memo(item)
+            item.raw_str = None
 
             if item.is_valid():
                 self.items.append(item)
                 # print("Item", item)
 
-    def run_openai(self, prompt=""):
+        if self.memo is not None:
+            self.memo.save()
 
+    def run_openai(self, prompt="", response_format=None):
+
+        # The gateway already retried 429s / 5xx; anything left is a real failure and is
+        # raised, rather than returning "{}" and silently dropping the statement
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    },
-                ],
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "transactions_list",
-                        "strict": True,
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "transactions": {
-                                    "type": "array",
-                                    "description": "A list of transactions.",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "name": {
-                                                "type": "string",
-                                                "description": "The name of the transaction."
-                                            },
-                                            "price": {
-                                                "type": "number",
-                                                "description": "The cost or price of the transaction."
-                                            },
-                                            "date": {
-                                                "type": "string",
-                                                "description": "The date of the transaction."
-                                            },
-                                            "parenttag": {
-                                                "type": "string",
-                                                "description": "The parent tag taken from the list of the parenttags."
-                                            },
-                                            "index": {
-                                                "type": "number",
-                                                "description": "The index of the transaction."
-                                            },
-                                            "raw_str": {
-                                                "type": "string",
-                                                "description": "The raw string of the transaction."
-                                            },
-                                            "location": {
-                                                "type": "string",
-                                                "description": "The location or merchant address of the transaction."
-                                            },
-                                            "file_source": {
-                                                "type": "string",
-                                                "description": "The source of the file (e.g., 'amex', 'capitalone', 'chase', etc.)."
-                                            }
-                                        },
-                                        "required": [
-                                            "name",
-                                            "price",
-                                            "date",
-                                            "parenttag",
-                                            "index",
-                                            "raw_str",
-                                            "location",
-                                            "file_source"
-                                        ],
-                                        "additionalProperties": False
-                                    }
-                                }
-                            },
-                            "required": [
-                                "transactions"
-                            ],
-                            "additionalProperties": False
-                        }
-                    }
-                },
-                temperature=1,
-                max_completion_tokens=4096,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
+            with self.metrics.stage("llm"):
+                response = get_gateway().complete(
+                    [{"role": "user", "content": prompt}],
+                    metrics=self.metrics,
+                    deadline=self.deadline,
+                    model=LLM_MODEL,
+                    response_format=response_format or TRANSACTIONS_RESPONSE_FORMAT,
+                    temperature=1,
+                    max_completion_tokens=4096,
+                    top_p=1,
+                    frequency_penalty=0,
+                    presence_penalty=0
+                )
 
         except Exception as e:
             print(f"OpenAI API call failed: {e}")
-            return "{}"
+            self.metrics.record_llm(failed=True)
+            raise
 
+        self.metrics.record_llm(response)
         return response.choices[0].message.content
 
     def convert_text_to_items(self, show=False):
 
         self.extractdetails()
+        self.stats["metrics"] = self.metrics.summary()
 
         if show:
             self.show_items()
@@ -185,38 +349,9 @@ class Document:
 
     def convert_data_to_viz(self):
 
-        # Conversion Logic
-        output = {"nodes": []}
-        parent_tags = {}
-        parent_child_map = {}
-        current_index = 0
-
-        # Add root node
-        output["nodes"].append({"name": "Expenses", "index": current_index})
-        current_index += 1
-
-        for item in self.items:
-            if item.parenttag not in parent_tags:
-                # Add parent tag node
-                parent_tags[item.parenttag] = current_index
-                output["nodes"].append(
-                    {"name": item.parenttag, "index": current_index})
-                parent_child_map[current_index] = []
-                current_index += 1
-
-            # Add transaction node
-            transaction_index = current_index
-            output["nodes"].append({
-                "name": item.name,
-                "cost": item.cost,
-                "index": transaction_index,
-                "date": item.date,
-                "location": item.location,
-                "file_source": item.file_source,
-            })
-            parent_child_map[parent_tags[item.parenttag]].append(
-                transaction_index)
-            current_index += 1
+        # Conversion Logic (nodes and parent_child_map built from the columnar store)
+        with self.metrics.stage("build_viz"):
+            output, parent_child_map = build_viz(TransactionColumns.from_items(self.items))
 
         # Output Result
         # print(json.dumps(output, indent=4))
@@ -237,6 +372,17 @@ class Document:
 
         return (output, parent_child_map)
 
+    def append_to_viz(self, output, parent_child_map):
+        """
+        Add this document's items to an existing convert_data_to_viz result in
+        place: existing categories are reused, new nodes get the next indices
+        and root/category totals are updated.
+        """
+        nodes = output["nodes"] if isinstance(output, dict) else output
+        stats = append_viz(nodes, parent_child_map, TransactionColumns.from_items(self.items))
+        print(f"Appended to existing graph: {stats}")
+        return (output, parent_child_map)
+
 
 def main():
 
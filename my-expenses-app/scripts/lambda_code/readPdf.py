@@ -5,17 +5,259 @@ Focuses on efficient in-memory text extraction.
 
 import io
 import logging
-from typing import Optional
-from pypdf import PdfReader
+import re
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+
+# Imported on first parse (cache hits and rejected requests never need it)
+pypdf = lazy_import("pypdf")
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
+# Headings that follow the transaction list on common card statements
+END_OF_TRANSACTIONS_RE = re.compile(
+    r"interest charge calculation|interest charges\s*$|fees and interest|important information about your account",
+    re.I | re.M,
+)
+
+# Lines carrying a money amount or a date are never treated as boilerplate (they may be
+# transactions, and a recurring merchant can appear on every page)
+_MONEY_RE = re.compile(r"\d\.\d{2}\b")
+_DATE_RE = re.compile(
+    r"\b(?:\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d{4}-\d{2}-\d{2}|"
+    r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2})\b",
+    re.I,
+)
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"\s+")
+
+def _boilerplate_key(line: str) -> Optional[str]:
+    # "Page 2 of 7" and "Page 3 of 7" hash alike; None for lines that must be kept
+    if not line.strip() or _MONEY_RE.search(line) or _DATE_RE.search(line):
+        return None
+    return _SPACES_RE.sub(" ", _DIGITS_RE.sub("#", line.strip().lower()))
+
+def _band_positions(lines: List[str], band_lines: int) -> List[int]:
+    """Positions of the first and last band_lines non-empty lines of a page (at most a quarter of it each)."""
+    filled = [position for position, line in enumerate(lines) if line.strip()]
+    band_lines = min(band_lines, len(filled) // 4)
+    if not band_lines:
+        return []
+    return filled[:band_lines] + filled[-band_lines:]
+
+def remove_repeated_lines(pages: List[str], min_fraction: float = 0.6, min_pages: int = 3,
+                          band_lines: int = 4) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Strip header/footer lines that repeat across most pages.
+
+    Only each page's header and footer bands (its first and last band_lines
+    non-empty lines, at most a quarter of the page each) are considered. Lines there are hashed (digits folded
+    so page numbers match) and counted once per page; lines present on at
+    least min_fraction of the pages are kept at their first occurrence and
+    removed from the other pages' bands (so issuer markers in a header still
+    reach format detection). Lines with a money amount or a date are always
+    kept, and the body of a page is never touched.
+
+    Args:
+        pages: Page texts in order
+        min_fraction: Share of pages a line must appear on to count as boilerplate
+        min_pages: Documents with fewer pages are returned unchanged
+        band_lines: Lines at the top and at the bottom of each page that may be boilerplate
+
+    Returns:
+        Tuple of (cleaned pages, stats dict)
+    """
+    stats = {"pages": len(pages), "repeated_lines": 0, "lines_removed": 0, "chars_removed": 0}
+    if len(pages) < min_pages:
+        return pages, stats
+
+    page_lines = [page.splitlines() for page in pages]
+    page_bands = [{position: _boilerplate_key(lines[position]) for position in _band_positions(lines, band_lines)}
+                  for lines in page_lines]
+
+    page_counts = Counter()
+    for band in page_bands:
+        page_counts.update({key for key in band.values() if key is not None})
+
+    threshold = max(2, int(len(pages) * min_fraction + 0.999))
+    repeated = {key for key, count in page_counts.items() if count >= threshold}
+    stats["repeated_lines"] = len(repeated)
+    if not repeated:
+        return pages, stats
+
+    cleaned = []
+    seen = set()
+    for lines, band in zip(page_lines, page_bands):
+        kept = []
+        for position, line in enumerate(lines):
+            key = band.get(position)
+            if key in repeated:
+                if key not in seen:
+                    seen.add(key)
+                    kept.append(line)
+                    continue
+                stats["lines_removed"] += 1
+                stats["chars_removed"] += len(line) + 1
+                continue
+            kept.append(line)
+        cleaned.append("\n".join(kept))
+
+    logger.info(f"Removed {stats['lines_removed']} repeated header/footer lines "
+                f"({stats['chars_removed']} characters) across {len(pages)} pages")
+    return cleaned, stats
+
+def transaction_section_ended(page_text: str) -> bool:
+    """Default early-stop predicate: True once a page reaches the post-transaction sections."""
+    return bool(END_OF_TRANSACTIONS_RE.search(page_text))
+
+class BufferStream(io.RawIOBase):
+    """
+    Read-only, seekable stream over a bytes-like object (memoryview, mmap,
+    bytearray) without copying it the way io.BytesIO would.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        data = self._view[self._pos:end].tobytes()
+        self._pos += len(data)
+        return data
+
+    def readinto(self, target) -> int:
+        chunk = self._view[self._pos:self._pos + len(target)]
+        target[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def close(self) -> None:
+        # Drop the export so an mmap / pooled buffer behind it can be closed or reused
+        self._view.release()
+        super().close()
+
+def pdf_stream(pdf_bytes) -> io.RawIOBase:
+    """Seekable stream for pypdf; bytes are wrapped as-is (BytesIO shares them), other buffers via BufferStream."""
+    if isinstance(pdf_bytes, bytes):
+        return io.BytesIO(pdf_bytes)
+    return BufferStream(pdf_bytes)
+
+def _extract_page(page, page_num: int) -> Optional[str]:
+    try:
+        page_text = page.extract_text()
+    except Exception as e:
+        logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+        return None
+    if not page_text.strip():
+        return None
+    logger.info(f"Extracted {len(page_text)} characters from page {page_num + 1}")
+    return page_text
+
+# The page-range worker's parsed PDF (one per worker process, see _init_page_worker)
+_WORKER_READER = None
+
+def _init_page_worker(pdf_bytes: bytes) -> None:
+    """
+    Process-pool initializer: each worker receives the bytes and parses the
+    PDF once; its tasks then only carry page ranges. PdfReader reads just
+    the xref / trailer up front (pages are resolved on access), so this is
+    a small fixed cost per worker rather than a full parse per task.
+    """
+    global _WORKER_READER
+    _WORKER_READER = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+
+def _extract_page_range(start: int, end: int) -> List[Optional[str]]:
+    """Process-pool worker: extract pages [start, end) from the worker's parsed PDF."""
+    reader = _WORKER_READER
+    return [_extract_page(reader.pages[page_num], page_num) for page_num in range(start, min(end, len(reader.pages)))]
+
+def iter_pdf_pages(pdf_bytes: bytes, max_pages: Optional[int] = None,
+                   stop_when: Optional[Callable[[str], bool]] = None, workers: int = 0,
+                   pages_per_task: int = 4) -> Iterator[str]:
+    """
+    Yield the text of each non-empty page as soon as it is extracted.
+
+    Args:
+        pdf_bytes: PDF file content (bytes, or a memoryview / mmap read in place)
+        max_pages: Stop after this many pages (None = all)
+        stop_when: Predicate on page text; iteration ends after the first page it accepts
+        workers: >1 extracts page ranges in a process pool (pages still come out in order)
+        pages_per_task: Pages per process-pool task
+
+    Raises:
+        Exception: Whatever pypdf raises for unreadable PDFs
+    """
+    stream = pdf_stream(pdf_bytes)
+    try:
+        yield from _iter_reader_pages(pypdf.PdfReader(stream), pdf_bytes, max_pages, stop_when, workers,
+                                      pages_per_task)
+    finally:
+        stream.close()
+
+def _iter_reader_pages(reader, pdf_bytes, max_pages: Optional[int], stop_when: Optional[Callable[[str], bool]],
+                       workers: int, pages_per_task: int) -> Iterator[str]:
+    page_count = len(reader.pages) if max_pages is None else min(max_pages, len(reader.pages))
+
+    if workers and workers > 1 and page_count > pages_per_task:
+        # Worker processes need a picklable copy; it is sent once per worker, not per task
+        pdf_bytes = pdf_bytes if isinstance(pdf_bytes, bytes) else bytes(pdf_bytes)
+        workers = min(workers, -(-page_count // pages_per_task))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker, initargs=(pdf_bytes,)) as pool:
+            futures = [pool.submit(_extract_page_range, start, min(start + pages_per_task, page_count))
+                       for start in range(0, page_count, pages_per_task)]
+            try:
+                for future in futures:
+                    for page_text in future.result():
+                        if page_text is None:
+                            continue
+                        yield page_text
+                        if stop_when is not None and stop_when(page_text):
+                            return
+            finally:
+                for future in futures:
+                    future.cancel()
+        return
+
+    for page_num in range(page_count):
+        page_text = _extract_page(reader.pages[page_num], page_num)
+        if page_text is None:
+            continue
+        yield page_text
+        if stop_when is not None and stop_when(page_text):
+            logger.info(f"Stopping after page {page_num + 1}: end of transaction section")
+            return
+
+def extract_text_from_pdf_bytes(pdf_bytes: bytes, max_pages: Optional[int] = None,
+                                stop_when: Optional[Callable[[str], bool]] = None, workers: int = 0,
+                                strip_repeated: bool = False, stats: Optional[dict] = None) -> str:
     """
     Extract text from PDF bytes in-memory (no disk I/O).
     
     Args:
-        pdf_bytes: PDF file content as bytes
+        pdf_bytes: PDF file content (bytes, or a memoryview / mmap read in place)
+        max_pages: Stop after this many pages (None = all)
+        stop_when: Early-stop predicate on page text (e.g. transaction_section_ended)
+        workers: >1 extracts page ranges in parallel processes
+        strip_repeated: Remove header/footer lines repeated across pages
+        stats: Optional dict filled with boilerplate-removal stats
         
     Returns:
         Extracted text content
@@ -24,26 +266,20 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
         ValueError: If PDF cannot be processed
     """
     try:
-        # Create in-memory PDF stream
-        pdf_stream = io.BytesIO(pdf_bytes)
-        
         # Try to read as PDF
         try:
-            reader = PdfReader(pdf_stream)
-            text_content = []
-            
-            for page_num, page in enumerate(reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        text_content.append(page_text)
-                        logger.info(f"Extracted {len(page_text)} characters from page {page_num + 1}")
-                except Exception as e:
-                    logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-                    continue
-            
-            if text_content:
+            pages = iter_pdf_pages(pdf_bytes, max_pages=max_pages, stop_when=stop_when, workers=workers)
+
+            if strip_repeated:
+                # Needs every page before it can tell what repeats
+                text_content, removal_stats = remove_repeated_lines(list(pages))
+                if stats is not None:
+                    stats.update(removal_stats)
                 full_text = "\n".join(text_content)
+            else:
+                full_text = "\n".join(pages)
+
+            if full_text:
                 logger.info(f"Successfully extracted {len(full_text)} characters from PDF")
                 return full_text
             else:
@@ -52,10 +288,14 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
         except Exception as pdf_error:
             logger.warning(f"PDF parsing failed: {pdf_error}")
             
+            # A real (but unreadable) PDF is binary; don't decode all of it looking for text
+            if bytes(pdf_bytes[:5]) == b"%PDF-":
+                raise ValueError(f"Unreadable PDF: {pdf_error}")
+
             # Fallback: Try to extract text from what looks like plain text
             try:
                 # Check if it's actually plain text disguised as base64
-                decoded_text = pdf_bytes.decode('utf-8', errors='ignore')
+                decoded_text = str(pdf_bytes, 'utf-8', errors='ignore')
                 if any(keyword in decoded_text.lower() for keyword in ['receipt', 'order', 'transaction', 'amount', 'total']):
                     logger.info("Detected plain text content, using as-is")
                     return decoded_text
@@ -0,0 +1,220 @@
+"""
+Content-addressed cache for processed PDF results.
+Key is a hash of the PDF bytes, the active parent-tag set and the settings
+that shape the result (page cap, boilerplate stripping, prompt layout, model),
+so re-uploads of the same statement skip both pypdf extraction and the LLM
+call, and changing a setting never serves results made under the old one.
+
+Tiers:
+- In-memory LRU (lives as long as the warm Lambda container)
+- Optional on-disk tier (e.g. /tmp) that survives handler re-imports
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Two-tier (memory LRU + optional disk) cache of (nodes, parent_child_map).
+
+    Entries are stored as JSON so every hit returns fresh objects; callers
+    such as the batch merge mutate node indices in place.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Disabling disk cache tier ({self.disk_dir}): {e}")
+                self.disk_dir = None
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, parent_tags: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Hash of the PDF content, the parent-tag set it was categorized with and the processing options."""
+        digest = hashlib.sha256(pdf_bytes)
+        digest.update(b"\0")
+        digest.update(parent_tags.encode("utf-8"))
+        if options:
+            digest.update(b"\0")
+            digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def contains(self, key: str) -> bool:
+        """Check for an entry without touching counters or LRU order."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self._disk_path(key) is not None and os.path.exists(self._disk_path(key))
+
+    def get(self, key: str) -> Optional[Tuple[list, dict]]:
+        """
+        Look up a cached result.
+
+        Returns:
+            Tuple of (nodes list, parent_child_map dict), or None on a miss
+        """
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+
+        if payload is None:
+            payload = self._read_disk(key)
+            with self._lock:
+                if payload is None:
+                    self._counters["misses"] += 1
+                    return None
+                self._counters["disk_hits"] += 1
+            # Promote to the memory tier
+            self._store_memory(key, payload)
+
+        return self._decode(payload)
+
+    def put(self, key: str, nodes: list, parent_child_map: dict) -> None:
+        """Store a result in both tiers."""
+        payload = json.dumps({"nodes": nodes, "parent_child_map": parent_child_map})
+        self._store_memory(key, payload)
+        self._write_disk(key, payload)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Current counter values (pass to stats() to get per-request deltas)."""
+        with self._lock:
+            return dict(self._counters)
+
+    def stats(self, since: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Hit/miss counters plus tier sizes.
+
+        Args:
+            since: Earlier snapshot(); counters are reported relative to it
+        """
+        with self._lock:
+            counters = {
+                name: value - (since or {}).get(name, 0)
+                for name, value in self._counters.items()
+            }
+            counters["hits"] = counters["memory_hits"] + counters["disk_hits"]
+            counters["entries"] = len(self._entries)
+            counters["bytes"] = self._bytes
+        counters["disk_enabled"] = bool(self.disk_dir)
+        return counters
+
+    def clear(self) -> None:
+        """Drop the memory tier (disk files are left for other containers)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ---- internals ----
+
+    @staticmethod
+    def _decode(payload: str) -> Tuple[list, dict]:
+        data = json.loads(payload)
+        # JSON turns int keys into strings; restore them for the merge code
+        parent_child_map = {int(k): v for k, v in data["parent_child_map"].items()}
+        return data["nodes"], parent_child_map
+
+    def _store_memory(self, key: str, payload: str) -> None:
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = payload
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters["evictions"] += 1
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = f.read()
+            os.utime(path)  # mtime doubles as LRU timestamp
+            return payload
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Disk cache read failed for {key[:12]}: {e}")
+            return None
+
+    def _write_disk(self, key: str, payload: str) -> None:
+        path = self._disk_path(key)
+        if path is None or len(payload) > self.disk_max_bytes:
+            return
+        try:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Disk cache write failed for {key[:12]}: {e}")
+
+    def _evict_disk(self) -> None:
+        """Remove least recently used files until the directory fits the budget."""
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.disk_max_bytes:
+            return
+
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._counters["evictions"] += 1
+            if total <= self.disk_max_bytes:
+                break
+
+
+def cache_from_env() -> ResultCache:
+    """
+    Build a cache from environment configuration.
+    - RESULT_CACHE_MAX_BYTES: memory tier budget (0 disables the memory tier)
+    - RESULT_CACHE_DIR: directory for the disk tier (unset = memory only), e.g. /tmp/pdf-cache
+    - RESULT_CACHE_DISK_MAX_BYTES: disk tier budget
+    """
+    return ResultCache(
+        max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+        disk_max_bytes=int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))),
+    )
@@ -0,0 +1,354 @@
+"""
+Deterministic fast path for known issuer formats.
+When a CSV export or statement text matches a known issuer layout, the
+date/description/amount fields are parsed locally (vectorized pandas for
+CSV, regex for PDF text) and the LLM is only asked for categories of
+merchants the memo doesn't know. Unknown formats return None so callers
+fall back to full LLM extraction.
+"""
+
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from deadline import DeadlineExceeded
+from merchant_memo import MerchantMemo, normalize_merchant
+
+logger = logging.getLogger(__name__)
+
+# Share of the statement's transaction-like lines (leading date, amount on the line
+# or the wrapped next one) the issuer pattern has to match before the parse is
+# trusted over the LLM; lower coverage means rows in a layout the regex misses
+MIN_PARSE_COVERAGE = float(os.getenv('FAST_PATH_MIN_COVERAGE', '0.9'))
+# Unique merchants per category-only LLM request
+CATEGORY_BATCH_SIZE = int(os.getenv('CATEGORY_BATCH_SIZE', '100'))
+CATEGORY_MAX_WORKERS = int(os.getenv('CATEGORY_MAX_WORKERS', '4'))
+
+
+def tag_list(allparenttags) -> Optional[List[str]]:
+    """Parent tags as a list without blank entries, whether given as a list or a newline-separated string."""
+    if allparenttags is None:
+        return None
+    if isinstance(allparenttags, str):
+        allparenttags = allparenttags.splitlines()
+    return [str(tag).strip() for tag in allparenttags if tag is not None and str(tag).strip()]
+
+
+def fast_path_enabled() -> bool:
+    """FAST_PATH_DISABLED=1 forces every upload through the LLM extraction path."""
+    return os.getenv('FAST_PATH_DISABLED') != '1'
+
+
+@dataclass
+class CsvFormat:
+    """Column layout of an issuer's CSV export."""
+    name: str
+    date_column: str
+    description_column: str
+    amount_column: Optional[str] = None
+    debit_column: Optional[str] = None
+    credit_column: Optional[str] = None
+    # +1 if charges are positive in amount_column, -1 if negative
+    charge_sign: int = 1
+    # Extra headers that must be present to tell otherwise similar layouts apart
+    marker_columns: Sequence[str] = field(default_factory=tuple)
+
+    def required_columns(self) -> List[str]:
+        columns = [self.date_column, self.description_column, *self.marker_columns]
+        columns += [c for c in (self.amount_column, self.debit_column, self.credit_column) if c]
+        return columns
+
+
+@dataclass
+class TextFormat:
+    """Line layout of an issuer's PDF statement text."""
+    name: str
+    issuer_pattern: "re.Pattern"
+    line_pattern: "re.Pattern"  # groups: date, description, amount
+
+
+# Most specific layouts first
+CSV_FORMATS: List[CsvFormat] = [
+    CsvFormat("chase", "Transaction Date", "Description", amount_column="Amount", charge_sign=-1,
+              marker_columns=("Post Date", "Type")),
+    CsvFormat("capitalone", "Transaction Date", "Description", debit_column="Debit", credit_column="Credit",
+              marker_columns=("Posted Date", "Card No.")),
+    CsvFormat("discover", "Trans. Date", "Description", amount_column="Amount", charge_sign=1,
+              marker_columns=("Post Date",)),
+    CsvFormat("citi", "Date", "Description", debit_column="Debit", credit_column="Credit",
+              marker_columns=("Status",)),
+    CsvFormat("amex", "Date", "Description", amount_column="Amount", charge_sign=1,
+              marker_columns=("Reference",)),
+    CsvFormat("amex", "Date", "Description", amount_column="Amount", charge_sign=1,
+              marker_columns=("Card Member",)),
+    CsvFormat("amex", "Date", "Description", amount_column="Amount", charge_sign=1,
+              marker_columns=("Extended Details",)),
+]
+
+_AMOUNT = r"(?P<amount>-?\$?\s?\d{1,3}(?:,\d{3})*\.\d{2}-?)"
+
+TEXT_FORMATS: List[TextFormat] = [
+    # 01/05/24* UBER TRIP HELP.UBER.COM CA $12.34
+    TextFormat("amex", re.compile(r"american\s+express|americanexpress\.com", re.I),
+               re.compile(r"^(?P<date>\d{2}/\d{2}/\d{2,4})\*?\s+(?P<description>.+?)\s+" + _AMOUNT + r"$")),
+    # 01/05 UBER TRIP 12.34
+    TextFormat("chase", re.compile(r"chase\.com|jpmorgan\s+chase", re.I),
+               re.compile(r"^(?P<date>\d{2}/\d{2})\s+(?P<description>.+?)\s+" + _AMOUNT + r"$")),
+    # Jan 5 Jan 6 UBER TRIP $12.34
+    TextFormat("capitalone", re.compile(r"capital\s*one", re.I),
+               re.compile(r"^(?P<date>[A-Z][a-z]{2}\s+\d{1,2})\s+(?:[A-Z][a-z]{2}\s+\d{1,2}\s+)?"
+                          r"(?P<description>.+?)\s+" + _AMOUNT + r"$")),
+]
+
+_ROW_DATE_RE = re.compile(
+    r"^(?:\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d{4}-\d{2}-\d{2}|"
+    r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2})\b"
+)
+_ROW_AMOUNT_RE = re.compile(r"\d{1,3}(?:,\d{3})*\.\d{2}\b")
+_PAYMENT_RE = re.compile(r"\b(payment|autopay|thank you|credit balance refund)\b", re.I)
+
+
+def _column_lookup(columns) -> Dict[str, str]:
+    return {str(column).strip().lower(): column for column in columns}
+
+
+def detect_csv_format(df) -> Optional[CsvFormat]:
+    """Match a DataFrame's headers against the known issuer layouts."""
+    lookup = _column_lookup(df.columns)
+    for fmt in CSV_FORMATS:
+        if all(column.lower() in lookup for column in fmt.required_columns()):
+            return fmt
+    return None
+
+
+def parse_csv(df, fmt: CsvFormat) -> List[dict]:
+    """
+    Vectorized parse of a known CSV export.
+
+    Only charges are kept; payments, refunds and other credits are dropped.
+
+    Returns:
+        List of {"position", "date", "description", "amount", "file_source"} dicts in row
+        order, where position is the row's 0-based position in df
+    """
+    import pandas as pd
+
+    lookup = _column_lookup(df.columns)
+
+    def numeric(column):
+        values = df[lookup[column.lower()]].astype(str).str.replace(r"[$,\s]", "", regex=True)
+        return pd.to_numeric(values, errors="coerce")
+
+    if fmt.amount_column:
+        amount = numeric(fmt.amount_column) * fmt.charge_sign
+    else:
+        amount = numeric(fmt.debit_column).fillna(0) - numeric(fmt.credit_column).fillna(0)
+
+    parsed = pd.DataFrame({
+        "position": range(len(df)),
+        "date": df[lookup[fmt.date_column.lower()]].fillna("").astype(str).str.strip(),
+        "description": df[lookup[fmt.description_column.lower()]].fillna("").astype(str).str.strip(),
+        "amount": amount.round(2),
+    }, index=df.index)
+    parsed = parsed[(parsed["amount"] > 0) & (parsed["description"] != "")]
+    parsed["file_source"] = fmt.name
+    return parsed.to_dict("records")
+
+
+def detect_text_format(text: str) -> Optional[TextFormat]:
+    """Identify the issuer of a statement from its text."""
+    head = text[:5000]
+    for fmt in TEXT_FORMATS:
+        if fmt.issuer_pattern.search(head) or fmt.issuer_pattern.search(text[-5000:]):
+            return fmt
+    return None
+
+
+def parse_text(text: str, fmt: TextFormat) -> List[dict]:
+    """
+    Regex parse of transaction lines from a known issuer's statement text.
+    Credits (negative or trailing-minus amounts) and payments are skipped.
+    """
+    records = []
+    for line in text.splitlines():
+        match = fmt.line_pattern.match(line.strip())
+        if not match:
+            continue
+        raw_amount = match.group("amount").replace(" ", "")
+        if raw_amount.startswith("-") or raw_amount.endswith("-"):
+            continue
+        description = match.group("description").strip()
+        if _PAYMENT_RE.search(description):
+            continue
+        records.append({
+            "date": match.group("date"),
+            "description": description,
+            "amount": round(float(raw_amount.strip("-").replace("$", "").replace(",", "")), 2),
+            "file_source": fmt.name,
+            "raw_str": line.strip(),
+        })
+    return records
+
+
+def transaction_like_lines(text: str) -> List[str]:
+    """
+    Lines that look like transactions in any layout: a leading date and an
+    amount on the same line or, for wrapped descriptions, the next one.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return [line for position, line in enumerate(lines)
+            if _ROW_DATE_RE.match(line) and (_ROW_AMOUNT_RE.search(line) or (
+                position + 1 < len(lines) and _ROW_AMOUNT_RE.search(lines[position + 1])))]
+
+
+def parse_coverage(text: str, fmt: TextFormat) -> Tuple[int, int]:
+    """(transaction-like lines, how many of them the issuer's line pattern matches)."""
+    candidates = transaction_like_lines(text)
+    return len(candidates), sum(1 for line in candidates if fmt.line_pattern.match(line))
+
+
+def parse_statement_text(text: str) -> Optional[List[dict]]:
+    """Fast-path parse of PDF text, or None if the layout is unknown or the parse looks incomplete."""
+    if not fast_path_enabled():
+        return None
+    fmt = detect_text_format(text)
+    if fmt is None:
+        return None
+    records = parse_text(text, fmt)
+    candidates, matched = parse_coverage(text, fmt)
+    if not records or matched < MIN_PARSE_COVERAGE * candidates:
+        logger.info(f"Detected {fmt.name} statement but matched only {matched} of {candidates} "
+                    f"transaction-like lines, using LLM")
+        return None
+    logger.info(f"Fast path: parsed {len(records)} {fmt.name} transactions without the LLM")
+    return records
+
+
+def category_response_format(allparenttags: Optional[Sequence[str]]) -> dict:
+    """JSON schema for category-only replies."""
+    parenttag = {"type": "string", "description": "Parent tag taken from the given list."}
+    tags = tag_list(allparenttags)
+    if tags:
+        parenttag["enum"] = tags
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "merchant_categories",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "records": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "integer", "description": "The id of the merchant."},
+                                "name": {"type": "string", "description": "Concise name of the merchant."},
+                                "parenttag": parenttag,
+                            },
+                            "required": ["id", "name", "parenttag"],
+                            "additionalProperties": False,
+                        },
+                    }
+                },
+                "required": ["records"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def categorize(descriptions: Sequence[str], allparenttags: Optional[Sequence[str]], memo: Optional[MerchantMemo],
+               complete: Callable[[str, dict], str], classifier=None,
+               min_confidence: Optional[float] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Resolve (name, parenttag) for each description.
+
+    Memo hits are answered locally, then confident local classifier
+    predictions; the remaining merchants are de-duplicated by their
+    normalized key and sent CATEGORY_BATCH_SIZE at a time.
+
+    Args:
+        descriptions: Raw merchant descriptions
+        allparenttags: Parent-tag taxonomy
+        memo: Merchant memo (optional)
+        complete: Function (prompt, response_format) -> reply content string
+        classifier: CategoryClassifier (optional)
+        min_confidence: Classifier threshold (defaults to CLASSIFIER_MIN_CONFIDENCE)
+
+    Returns:
+        List of (name, parenttag) aligned with descriptions; (None, None) if unresolved
+    """
+    allparenttags = tag_list(allparenttags)
+    results: List[Tuple[Optional[str], Optional[str]]] = [(None, None)] * len(descriptions)
+    unknown: Dict[str, List[int]] = {}
+
+    for position, description in enumerate(descriptions):
+        hit = memo.lookup(description, allowed_tags=allparenttags) if memo is not None else None
+        if hit is not None:
+            results[position] = (hit["name"], hit["parenttag"])
+        else:
+            key = normalize_merchant(description) or description
+            unknown.setdefault(key, []).append(position)
+    from_memo = len(descriptions) - sum(len(positions) for positions in unknown.values())
+
+    from_classifier = 0
+    if classifier is not None and unknown:
+        from category_classifier import min_confidence as default_min_confidence, min_margin, min_similarity
+
+        keys = list(unknown)
+        labels = classifier.predict_confident([descriptions[unknown[key][0]] for key in keys],
+                                              min_confidence if min_confidence is not None else default_min_confidence(),
+                                              min_similarity(), min_margin(), allowed_tags=allparenttags)
+        for key, label in zip(keys, labels):
+            if label is None:
+                continue
+            positions = unknown.pop(key)
+            for position in positions:
+                results[position] = (key.title(), label)
+            from_classifier += len(positions)
+
+    keys = list(unknown)
+    batches = [keys[start:start + CATEGORY_BATCH_SIZE] for start in range(0, len(keys), CATEGORY_BATCH_SIZE)]
+
+    def run(batch):
+        lines = "\n".join(
+            json.dumps({"id": i, "merchant": descriptions[unknown[key][0]]}, separators=(",", ":"))
+            for i, key in enumerate(batch)
+        )
+        prompt = (
+            f"Here are {len(batch)} merchants from bank transactions, one JSON object per line:\n\n"
+            f"{lines}\n\n"
+            f"For every merchant return its id, a concise name and the best parent tag from this list: {allparenttags}\n"
+        )
+        try:
+            reply = json.loads(complete(prompt, category_response_format(allparenttags)))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"Category batch of {len(batch)} merchants failed: {e}")
+            return {}
+        return {record["id"]: record for record in reply.get("records", []) if "id" in record}
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(CATEGORY_MAX_WORKERS, len(batches)))) as pool:
+            replies = list(pool.map(run, batches))
+
+        for batch, reply in zip(batches, replies):
+            for i, key in enumerate(batch):
+                record = reply.get(i)
+                if record is None:
+                    continue
+                for position in unknown[key]:
+                    results[position] = (record.get("name"), record.get("parenttag"))
+                if memo is not None:
+                    memo.learn(descriptions[unknown[key][0]], record.get("name"), record.get("parenttag"))
+
+    logger.info(f"Categorized {len(descriptions)} transactions: {from_memo} from memo, {from_classifier} "
+                f"from classifier, {len(keys)} unique merchants sent to the LLM")
+    return results
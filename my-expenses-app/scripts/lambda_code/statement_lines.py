@@ -0,0 +1,160 @@
+"""
+Statement-line pre-structuring to shrink LLM prompts.
+Raw pypdf text is mostly addresses, marketing, rate tables and legal text;
+only lines carrying a date and an amount matter. This stage keeps those
+lines (joining descriptions that wrapped onto the next line) and emits a
+compact pipe-separated table, which is what goes into the prompt instead
+of the whole document. The statement's header lines (issuer, account,
+address) stay above the table, so the model can still fill in file_source
+and location.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from chunking import estimate_tokens
+from statement_formats import detect_text_format, transaction_like_lines
+
+logger = logging.getLogger(__name__)
+
+# Share of the transaction-like lines (leading date, amount on the line or the next)
+# the candidates must cover; below it the heuristics missed rows and the full text is sent
+MIN_CANDIDATE_COVERAGE = float(os.getenv('PRESTRUCTURE_MIN_COVERAGE', '0.9'))
+# Non-empty lines before the first transaction kept above the table (issuer, account, address)
+HEADER_MAX_LINES = int(os.getenv('PRESTRUCTURE_HEADER_LINES', '12'))
+HEADER_MAX_CHARS = 1000
+
+_DATE_RE = re.compile(
+    r"^\s*(?P<date>\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d{4}-\d{2}-\d{2}|"
+    r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2}(?:,?\s+\d{4})?)\*?\s+"
+)
+# Optional second (posting) date right after the first
+_SECOND_DATE_RE = re.compile(
+    r"^(?:\d{1,2}/\d{1,2}(?:/\d{2,4})?|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2})\s+"
+)
+_AMOUNT_RE = re.compile(r"(?P<amount>\(?-?\$?\s?\d{1,3}(?:,\d{3})*\.\d{2}\)?-?)\s*$")
+
+TABLE_HEADER = "date|description|amount"
+
+
+@dataclass
+class PrestructureResult:
+    """Compact table plus how much it saved."""
+    text: str
+    lines: int
+    original_tokens: int
+    compact_tokens: int
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of input tokens removed (0.0 - 1.0)."""
+        if not self.original_tokens:
+            return 0.0
+        return 1 - self.compact_tokens / self.original_tokens
+
+    def report(self) -> dict:
+        return {
+            "candidate_lines": self.lines,
+            "original_tokens": self.original_tokens,
+            "compact_tokens": self.compact_tokens,
+            "token_reduction": round(self.reduction, 3),
+        }
+
+
+def find_transaction_lines(text: str) -> List[dict]:
+    """
+    Candidate transaction lines as {"date", "description", "amount"} dicts.
+
+    A line qualifies if it starts with a date and ends with an amount. A
+    dated line without an amount is joined with the next line when that
+    line ends with one (wrapped descriptions).
+    """
+    candidates = []
+    pending = None  # (date, partial description) waiting for its amount
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        date_match = _DATE_RE.match(line)
+        amount_match = _AMOUNT_RE.search(line)
+
+        if date_match:
+            rest = _SECOND_DATE_RE.sub("", line[date_match.end():], count=1)
+            if amount_match and amount_match.start() > date_match.end():
+                description = rest[:len(rest) - len(amount_match.group(0))].strip()
+                if description:
+                    candidates.append({"date": date_match.group("date"), "description": description,
+                                       "amount": amount_match.group("amount").replace(" ", "")})
+                    pending = None
+                    continue
+            pending = (date_match.group("date"), rest.strip())
+            continue
+
+        if pending is not None and amount_match:
+            description = f"{pending[1]} {line[:amount_match.start()].strip()}".strip()
+            candidates.append({"date": pending[0], "description": description,
+                               "amount": amount_match.group("amount").replace(" ", "")})
+        pending = None
+
+    return candidates
+
+
+def statement_header(text: str) -> List[str]:
+    """
+    The statement's opening lines up to its first transaction (at most
+    HEADER_MAX_LINES / HEADER_MAX_CHARS), preceded by the issuer when it is
+    one of the known formats.
+    """
+    header = []
+    fmt = detect_text_format(text)
+    if fmt is not None:
+        header.append(f"Issuer: {fmt.name}")
+    size = 0
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if _DATE_RE.match(line) or len(header) >= HEADER_MAX_LINES or size + len(line) > HEADER_MAX_CHARS:
+            break
+        header.append(line)
+        size += len(line)
+    return header
+
+
+def prestructure(text: str) -> Optional[PrestructureResult]:
+    """
+    Build the compact prompt table for a statement.
+
+    Returns:
+        PrestructureResult, or None when the candidates miss too many of the
+        statement's transaction-like lines (callers should then send the full text)
+    """
+    candidates = find_transaction_lines(text)
+    expected = len(transaction_like_lines(text))
+    if not candidates or len(candidates) < MIN_CANDIDATE_COVERAGE * expected:
+        logger.info(f"Pre-structuring found {len(candidates)} candidate lines of {expected} "
+                    f"transaction-like lines, sending full text")
+        return None
+
+    rows = []
+    header = statement_header(text)
+    if header:
+        rows.extend(["Statement header:", *header, ""])
+    rows.append(TABLE_HEADER)
+    rows.extend(f"{c['date']}|{c['description'].replace('|', '/')}|{c['amount']}" for c in candidates)
+    compact = "\n".join(rows)
+
+    result = PrestructureResult(
+        text=compact,
+        lines=len(candidates),
+        original_tokens=estimate_tokens(text),
+        compact_tokens=estimate_tokens(compact),
+    )
+    logger.info(f"Pre-structured {result.lines} lines: ~{result.original_tokens} -> ~{result.compact_tokens} "
+                f"tokens ({result.reduction:.0%} fewer)")
+    return result
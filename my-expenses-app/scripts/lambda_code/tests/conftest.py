@@ -0,0 +1,55 @@
+"""
+Shared setup for the lambda_code tests: module paths, an isolated
+environment (no memo / classifier model / result cache left over from
+real runs) and a mock OpenAI server for tests that reach the LLM.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_CODE = os.path.dirname(HERE)
+SCRIPTS = os.path.dirname(LAMBDA_CODE)
+BENCHMARKS = os.path.join(SCRIPTS, "benchmarks")
+# scripts/ for the Flask app (app.py); its own imports resolve to lambda_code
+sys.path[:0] = [LAMBDA_CODE, BENCHMARKS, SCRIPTS]
+
+# Read at import time by several modules, so set before any of them is imported
+_STATE_DIR = tempfile.mkdtemp(prefix="lambda-code-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ["MERCHANT_MEMO_DISABLED"] = "1"
+os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+os.environ["CATEGORY_MODEL_PATH"] = os.path.join(_STATE_DIR, "no_model.npz")
+os.environ["JOB_WORKERS"] = "0"
+os.environ["JOB_QUEUE_PATH"] = os.path.join(_STATE_DIR, "jobs.sqlite3")
+os.environ["TRANSACTION_DB_PATH"] = os.path.join(_STATE_DIR, "transactions.sqlite3")
+os.environ["BLOB_LOCAL_DIR"] = os.path.join(_STATE_DIR, "blobs")
+
+
+@pytest.fixture(scope="session")
+def mock_llm():
+    """Mock OpenAI server; the shared gateway is rebuilt so its client points at it."""
+    from mock_openai import MockOpenAIServer
+    import llm_gateway
+
+    with MockOpenAIServer() as server:
+        previous = os.environ.get("OPENAI_BASE_URL")
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        llm_gateway._GATEWAY = None
+        try:
+            yield server
+        finally:
+            llm_gateway._GATEWAY = None
+            if previous is None:
+                os.environ.pop("OPENAI_BASE_URL", None)
+            else:
+                os.environ["OPENAI_BASE_URL"] = previous
+
+
+@pytest.fixture
+def parent_tags():
+    with open(os.path.join(LAMBDA_CODE, "parenttags.txt")) as f:
+        return "\n".join(line.strip() for line in f if line.strip())
@@ -0,0 +1,105 @@
+import io
+import time
+
+import pytest
+
+import app
+from job_queue import JobQueue, WorkerPool
+from transaction_store import TransactionStore
+
+AMEX_CSV = b"""Date,Description,Amount,Reference
+01/05/2024,STARBUCKS STORE 123,4.50,'320100000001'
+01/20/2024,DELTA AIR LINES,312.00,'320100000002'
+02/03/2024,STARBUCKS STORE 123,5.25,'320100000003'
+"""
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, mock_llm):
+    monkeypatch.setattr(app, "store", TransactionStore(path=str(tmp_path / "transactions.sqlite3")))
+    monkeypatch.setattr(app, "jobs", JobQueue(path=str(tmp_path / "jobs.sqlite3"), lease_s=60, max_attempts=2))
+    return app.app.test_client()
+
+
+def upload(client, csv=AMEX_CSV, user="u1"):
+    response = client.post("/upload", data={"file": (io.BytesIO(csv), "statement.csv"), "user": user},
+                           content_type="multipart/form-data")
+    assert response.status_code == 202
+    return response
+
+
+def run_jobs(worker="w1"):
+    pool = WorkerPool(app.jobs, {"csv": app.run_csv_job}, workers=1)
+    while pool.run_one(worker):
+        pass
+
+
+def test_upload_is_queued_and_reports_progress(client):
+    response = upload(client)
+    job_id = response.get_json()["jobId"]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == "queued"
+    assert client.get(f"/jobs/{job_id}/result").status_code == 202
+
+    run_jobs()
+
+    status = client.get(f"/jobs/{job_id}").get_json()
+    assert status["status"] == "done" and status["attempts"] == 1
+    assert status["progress"]["rowsDone"] == status["progress"]["rowsTotal"] == 3
+    result = client.get(f"/jobs/{job_id}/result")
+    assert result.status_code == 200
+    body = result.get_json()
+    assert body["upload"]["rows"] == 3
+    children = [child for children in body["parentChildMap"].values() for child in children]
+    assert sorted(body["nodes"][child]["cost"] for child in children) == [4.5, 5.25, 312.0]
+    assert client.get("/jobs/missing").status_code == 404
+
+
+def test_data_is_sliced_from_the_store(client):
+    upload(client)
+    run_jobs()
+
+    def costs(query):
+        body = client.get(f"/data?user=u1&{query}").get_json()
+        children = [child for children in body["parentChildMap"].values() for child in children]
+        return sorted(body["nodes"][child]["cost"] for child in children)
+
+    assert costs("month=2024-01") == [4.5, 312.0]
+    assert costs("month=2024-02") == [5.25]
+    assert costs("dateFrom=2024-01-10&dateTo=2024-02-28") == [5.25, 312.0]
+    assert client.get("/data?user=someone-else").get_json()["nodes"] == [{"name": "Expenses", "index": 0}]
+    assert client.get("/data?user=u1&month=2024-1").status_code == 400
+
+
+def test_rollups_are_revalidated_by_etag(client):
+    upload(client)
+    run_jobs()
+
+    first = client.get("/rollups?user=u1")
+    assert first.status_code == 200 and first.get_json()["total"] == 321.75 and first.get_json()["count"] == 3
+    etag = first.headers["ETag"]
+    assert client.get("/rollups?user=u1", headers={"If-None-Match": etag}).status_code == 304
+
+    # A new upload changes the user's version, so the old ETag no longer matches
+    upload(client)
+    run_jobs()
+    second = client.get("/rollups?user=u1", headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.headers["ETag"] != etag and second.get_json()["count"] == 6
+
+
+def test_reclaimed_job_stores_its_rows_once(client):
+    job_id = upload(client).get_json()["jobId"]
+
+    # w1 claims the job and stores the rows, but its lease runs out before it can complete
+    job = app.jobs.claim("w1")
+    app.run_csv_job(job, lambda progress: None)
+    app.jobs._connect().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+    # w2 takes the job over and runs it again
+    run_jobs("w2")
+    assert not app.jobs.complete(job_id, "w1", {})
+
+    result = client.get(f"/jobs/{job_id}/result").get_json()
+    assert result["status"] == "done" and result["upload"]["duplicate"]
+    assert len(app.store.query("u1")) == 3
+    assert client.get("/rollups?user=u1").get_json()["count"] == 3
@@ -0,0 +1,23 @@
+import base64
+
+import pytest
+
+import bench_pipeline
+import lambda_function
+import synthetic
+
+
+def test_batch_with_failed_pdfs_fails_the_stage(mock_llm):
+    pdfs = [base64.b64encode(synthetic.statement_pdf(5, "amex", seed=8)).decode(),
+            base64.b64encode(b"%PDF-1.4 truncated").decode()]
+    response = lambda_function.lambda_handler({"pdfs": pdfs}, None)
+
+    assert response["statusCode"] == 200
+    with pytest.raises(RuntimeError, match="1 PDF"):
+        bench_pipeline.check_response(response)
+
+
+def test_clean_batch_passes(mock_llm):
+    pdfs = [base64.b64encode(synthetic.statement_pdf(5, "amex", seed=9)).decode()]
+    response = lambda_function.lambda_handler({"pdfs": pdfs}, None)
+    assert bench_pipeline.check_response(response) is response
@@ -0,0 +1,106 @@
+import base64
+import os
+
+import pytest
+
+import blob_store
+from blob_store import (DecodeBufferPool, LocalBlobStore, b64decode_pooled, input_key, input_size, open_input,
+                        parse_ref, store_for, validate_inputs)
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 40 + b"\n%%EOF\n"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path))
+
+
+def test_local_ref_is_memory_mapped(store):
+    store.put("2024/march.pdf", PDF)
+    assert store.size("2024/march.pdf") == len(PDF)
+
+    pdf = store.open("2024/march.pdf")
+    assert pdf.source == "local://2024/march.pdf"
+    assert pdf.size == len(PDF) and bytes(pdf.data) == PDF
+    pdf.close()
+    assert pdf.data == b""
+    pdf.close()  # closing twice is harmless
+
+
+@pytest.mark.parametrize("key", ["../outside.pdf", "a/../../outside.pdf", "/etc/passwd"])
+def test_keys_outside_the_store_are_rejected(store, key):
+    with pytest.raises(ValueError, match="outside the store"):
+        store.open(key)
+
+
+def test_missing_and_empty_blobs(store):
+    with pytest.raises(ValueError, match="not found"):
+        store.open("missing.pdf")
+    store.put("empty.pdf", b"")
+    with pytest.raises(ValueError, match="empty"):
+        store.open("empty.pdf")
+
+
+def test_pooled_decode_reuses_buffers():
+    pool = DecodeBufferPool(max_bytes=4 * blob_store.DECODE_BUFFER_ALIGN)
+    encoded = base64.b64encode(PDF).decode()
+
+    with b64decode_pooled(encoded, pool) as first:
+        assert bytes(first.data) == PDF
+    with b64decode_pooled(encoded, pool) as second:
+        assert bytes(second.data) == PDF
+
+    assert pool.stats()["allocated"] == 1 and pool.stats()["reused"] == 1
+
+
+def test_pooled_decode_falls_back_and_releases_on_error():
+    pool = DecodeBufferPool()
+    wrapped = base64.encodebytes(PDF).decode()  # newlines every 76 characters
+    with b64decode_pooled(wrapped, pool) as pdf:
+        assert bytes(pdf.data) == PDF
+
+    with pytest.raises(ValueError):
+        b64decode_pooled("not base64!", pool)
+    assert pool.stats()["pooled_bytes"] > 0
+
+
+def test_pool_is_capped():
+    pool = DecodeBufferPool(max_bytes=blob_store.DECODE_BUFFER_ALIGN)
+    buffers = [pool.acquire(10), pool.acquire(10)]
+    for buffer in buffers:
+        pool.release(buffer)
+    assert pool.stats()["pooled_bytes"] == blob_store.DECODE_BUFFER_ALIGN
+
+
+def test_refs_and_inputs():
+    local, key = store_for("local://statements/a.pdf")
+    assert isinstance(local, LocalBlobStore) and key == "statements/a.pdf"
+    assert store_for("statements/a.pdf")[0] is local
+    with pytest.raises(ValueError):
+        store_for("ftp://host/a.pdf")
+    with pytest.raises(ValueError):
+        store_for("local://")
+
+    local.put("statements/a.pdf", PDF)
+    ref = {"ref": "local://statements/a.pdf"}
+    validate_inputs([base64.b64encode(PDF).decode(), ref])
+    with pytest.raises(ValueError):
+        validate_inputs([{"ref": ""}])
+    assert input_key(ref) == "ref:local://statements/a.pdf"
+    assert input_size(ref) == len(PDF)
+    with open_input(ref) as pdf:
+        assert bytes(pdf.data) == PDF
+    os.remove(local.path("statements/a.pdf"))
+
+
+def test_s3_refs_are_limited_to_configured_buckets(monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_S3_BUCKET", "statements")
+    monkeypatch.setattr(blob_store, "BLOB_S3_ALLOWED_BUCKETS", frozenset({"archive"}))
+
+    assert parse_ref("s3://statements/2024/a.pdf") == ("s3:statements", "statements", "2024/a.pdf")
+    assert parse_ref("s3://archive/a.pdf")[1] == "archive"
+    for ref in ("s3://someone-elses-bucket/a.pdf", "s3:///a.pdf"):
+        with pytest.raises(ValueError, match="not allowed"):
+            store_for(ref)
+    with pytest.raises(ValueError, match="not allowed"):
+        validate_inputs([{"ref": "s3://someone-elses-bucket/a.pdf"}])
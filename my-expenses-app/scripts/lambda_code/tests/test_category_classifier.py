@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from category_classifier import CategoryClassifier
+
+TRAINING = {
+    "Food & Dining": ["STARBUCKS STORE 01234", "WHOLEFDS MKT 10234", "SQ *JOES COFFEE", "CHIPOTLE 1234",
+                      "KROGER #441", "PANERA BREAD #22"],
+    "Transportation": ["UBER TRIP HELP.UBER.COM", "SHELL OIL 57444", "LYFT RIDE", "CHEVRON 0099",
+                       "EXXONMOBIL 4432", "MARTA BREEZE"],
+    "Shopping": ["AMAZON MKTPLACE PMTS", "TARGET 00012", "WALMART.COM", "BEST BUY 00123", "HOME DEPOT #123",
+                 "COSTCO WHSE #12"],
+    "Travel": ["DELTA AIR LINES", "MARRIOTT HOTEL", "HILTON GARDEN", "AIRBNB HMXYZ", "UNITED AIRLINES",
+               "EXPEDIA 123"],
+}
+TAXONOMY = list(TRAINING) + ["Education", "Insurance"]
+
+
+def trained(categories):
+    model = CategoryClassifier(TAXONOMY)
+    for tag in categories:
+        model.partial_fit(TRAINING[tag], [tag] * len(TRAINING[tag]))
+    return model
+
+
+def test_seen_merchants_are_predicted():
+    model = trained(TRAINING)
+    labels = model.predict_confident(["STARBUCKS STORE 09999 DECATUR GA", "UBER TRIP 8YH2K", "DELTA AIR LINES ATL"])
+    assert labels == ["Food & Dining", "Transportation", "Travel"]
+
+
+def test_unrelated_merchants_are_left_to_the_llm():
+    model = trained(TRAINING)
+    _, _, similarities, _ = model.predict(["COURSERA.ORG", "GEICO AUTO INSURANCE", "NETFLIX.COM"])
+
+    assert model.predict_confident(["COURSERA.ORG", "GEICO AUTO INSURANCE", "NETFLIX.COM"]) == [None] * 3
+    assert np.all(similarities < 0.2)
+
+
+@pytest.mark.parametrize("categories", [["Food & Dining"], ["Food & Dining", "Travel"]])
+def test_no_predictions_until_enough_categories_are_trained(categories):
+    # A single trained category used to give confidence 1.0 for every merchant
+    model = trained(categories)
+    labels, confidences, _, _ = model.predict(["STARBUCKS STORE 01234", "GEICO AUTO INSURANCE"])
+
+    assert not model.is_ready()
+    assert labels == [None, None]
+    assert np.all(confidences == 0)
+
+
+def test_undertrained_categories_are_never_predicted():
+    model = trained(TRAINING)
+    model.partial_fit(["GEICO AUTO INSURANCE"], ["Insurance"])
+
+    labels, _, _, _ = model.predict(["GEICO AUTO INSURANCE"])
+    assert labels != ["Insurance"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    model = trained(TRAINING)
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+
+    loaded = CategoryClassifier.load(path)
+    texts = ["STARBUCKS STORE 09999", "COSTCO WHSE #99"]
+    assert loaded.predict_confident(texts) == model.predict_confident(texts) == ["Food & Dining", "Shopping"]
+
+
+def test_trains_on_raw_descriptions():
+    # Nodes carry the LLM's cleaned-up name and the raw text predict() will see later
+    nodes = [{"name": "Expenses", "index": 0}]
+    parent_child_map = {}
+    for tag, descriptions in TRAINING.items():
+        parent = len(nodes)
+        nodes.append({"name": tag, "index": parent})
+        parent_child_map[parent] = []
+        for description in descriptions:
+            parent_child_map[parent].append(len(nodes))
+            nodes.append({"name": f"Purchase {len(nodes)}", "cost": 1.0, "index": len(nodes),
+                          "description": description})
+
+    model = CategoryClassifier(TAXONOMY)
+    assert model.train_from_viz({"nodes": nodes}, parent_child_map) == 24
+    assert model.predict_confident(["STARBUCKS STORE 09999 DECATUR GA", "DELTA AIR LINES ATL"]) == \
+        ["Food & Dining", "Travel"]
+
+
+def test_csv_nodes_carry_the_raw_description(mock_llm):
+    import io
+
+    import pandas as pd
+
+    import process
+    import synthetic
+    from viz_builder import TransactionColumns, build_viz
+
+    df = pd.read_csv(io.StringIO(synthetic.statement_csv(5, "amex", seed=2)))
+    document = process.Document(df, allparenttags=TAXONOMY)
+    document.convert_doc_to_items()
+    output, _ = build_viz(TransactionColumns.from_items(document.items, process.CSV_DETAIL_FIELDS))
+
+    descriptions = [node.get("description") for node in output["nodes"] if "cost" in node]
+    assert descriptions == [str(value) for value in df["Description"]]
@@ -0,0 +1,52 @@
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+import lambda_function
+import llm_gateway
+import synthetic
+from deadline import Deadline, DeadlineExceeded, PdfCostModel
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.ends = time.monotonic() + remaining_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.ends - time.monotonic()) * 1000)
+
+
+def test_reserve_scales_with_the_timeout():
+    assert Deadline(FakeContext(3000)).remaining_ms() == pytest.approx(2700, abs=50)
+    assert Deadline(FakeContext(600_000)).remaining_ms() == pytest.approx(595_000, abs=50)
+    assert Deadline(FakeContext(3000), reserve_ms=0).remaining_ms() == pytest.approx(3000, abs=50)
+    assert Deadline().remaining_ms() == float("inf")
+
+
+def test_cold_gateway_lets_the_first_call_through(mock_llm):
+    gateway = llm_gateway.LLMGateway()
+    deadline = Deadline(FakeContext(3000))
+
+    gateway.complete([{"role": "user", "content": "hi"}], deadline=deadline, model="gpt-4o-mini")
+
+    assert gateway.call_ms is not None
+    expired = Deadline()
+    expired.ends_at = time.monotonic() - 0.001
+    with pytest.raises(DeadlineExceeded):
+        gateway.complete([{"role": "user", "content": "hi"}], deadline=expired, model="gpt-4o-mini")
+
+
+def test_no_batch_work_runs_after_the_response(mock_llm, monkeypatch):
+    monkeypatch.setattr(lambda_function, "_PDF_COST", PdfCostModel(base_ms=0, ms_per_kb=0))
+    monkeypatch.setattr(mock_llm, "latency_ms", 1500)
+    pdfs = [base64.b64encode(synthetic.statement_pdf(5, "generic", seed=seed)).decode() for seed in range(10, 16)]
+
+    response = lambda_function.lambda_handler({"pdfs": pdfs}, FakeContext(1000))
+
+    body = json.loads(response["body"])
+    assert body["continuation"]["pending"]
+    workers = [thread for thread in threading.enumerate() if thread.name.startswith("ThreadPoolExecutor")]
+    assert [thread for thread in workers if thread.is_alive()] == []
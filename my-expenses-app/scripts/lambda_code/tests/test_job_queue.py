@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from job_queue import JobQueue, WorkerPool
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(path=str(tmp_path / "jobs.sqlite3"), lease_s=60, max_attempts=2)
+
+
+def test_claim_complete(queue):
+    job_id = queue.enqueue("csv", b"a,b\n", {"user": "u"})
+    job = queue.claim("w1")
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert queue.claim("w2") is None
+
+    assert queue.complete(job_id, "w1", {"ok": True})
+    done = queue.get(job_id, with_result=True)
+    assert done["status"] == "done" and done["result"] == {"ok": True}
+
+
+def test_fail_requeues_then_fails(queue):
+    job_id = queue.enqueue("csv")
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") == "queued"
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") == "failed"
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_stale_worker_cannot_finish_reclaimed_job(queue):
+    job_id = queue.enqueue("csv")
+    queue.claim("w1")
+    # w1's lease runs out and w2 takes the job over
+    queue._connect().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+    assert queue.claim("w2")["id"] == job_id
+
+    assert not queue.complete(job_id, "w1", {"stale": True})
+    assert queue.fail(job_id, "w1", "late error") is None
+    queue.progress(job_id, "w1", {"rowsDone": 99})
+    job = queue.get(job_id)
+    assert job["status"] == "running" and job["progress"] is None and job["error"] is None
+
+    assert queue.complete(job_id, "w2", {"fresh": True})
+    assert queue.get(job_id, with_result=True)["result"] == {"fresh": True}
+
+
+def test_expired_lease_cannot_complete(queue):
+    job_id = queue.enqueue("csv")
+    queue.claim("w1")
+    queue._connect().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+    assert not queue.complete(job_id, "w1", {})
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_expired_job_out_of_attempts_is_failed(queue):
+    job_id = queue.enqueue("csv")
+    for worker in ("w1", "w2"):
+        # Each worker dies mid-job: its lease simply runs out
+        assert queue.claim(worker)["id"] == job_id
+        queue._connect().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+    assert queue.claim("w3") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2 and "Lease expired" in job["error"]
+
+
+def test_worker_pool_run_one(queue):
+    seen = []
+
+    def handler(job, report_progress):
+        report_progress({"rowsDone": 1})
+        seen.append(job["kind"])
+        return {"rows": 1}
+
+    pool = WorkerPool(queue, {"csv": handler}, workers=1)
+    job_id = queue.enqueue("csv")
+    assert pool.run_one("w1")
+    assert not pool.run_one("w1")
+    job = queue.get(job_id, with_result=True)
+    assert seen == ["csv"] and job["status"] == "done" and job["progress"] == {"rowsDone": 1}
@@ -0,0 +1,60 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+
+import blob_store
+import lambda_function
+import synthetic
+
+
+def handle(event):
+    response = lambda_function.lambda_handler(event, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def transaction_nodes(body):
+    children = {child for children in body["parent_child_map"].values() for child in children}
+    return [node for node in body["output"] if node["index"] in children]
+
+
+def test_single_pdf_runs_through_process_amz(mock_llm):
+    pdf = synthetic.statement_pdf(12, "amex", seed=1)
+    status, body = handle({"body": base64.b64encode(pdf).decode(), "isBase64Encoded": True})
+
+    assert status == 200
+    assert len(transaction_nodes(body)) == 12
+    assert not body["stats"].get("errors")
+
+
+def test_batch_merges_pdfs_without_errors(mock_llm):
+    pdfs = [base64.b64encode(synthetic.statement_pdf(8, "amex", seed=seed)).decode() for seed in (2, 3)]
+    status, body = handle({"pdfs": pdfs})
+
+    assert status == 200
+    assert body["stats"]["errors"] == []
+    assert body["stats"]["pdfs_processed"] == 2
+    assert len(transaction_nodes(body)) == 16
+
+
+def test_missing_body_is_rejected_before_processing():
+    status, body = handle({})
+    assert status == 400
+    assert "body" in body["details"]
+
+
+def test_refs_to_other_buckets_are_rejected(monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_S3_BUCKET", "statements")
+    for event in ({"ref": "s3://someone-elses-bucket/a.pdf"}, {"pdfs": [{"ref": "s3://someone-elses-bucket/a.pdf"}]}):
+        status, body = handle(event)
+        assert status == 400
+        assert "not allowed" in body["details"]
+
+
+def test_import_defers_heavy_dependencies():
+    # Fresh interpreter: nothing else in the test session has imported them yet there
+    script = "import sys, lambda_function; print(sorted(m for m in ('numpy', 'pandas', 'openai', 'pypdf') if m in sys.modules))"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,76 @@
+import process_amz
+from merchant_memo import MerchantMemo, normalize_merchant
+
+TAGS = "Food & Dining\nTravel\nShopping"
+
+
+def make_item(name, parenttag, raw_str):
+    return process_amz.Item(name=name, price=12.5, date="03/04/24", index=0, raw_str=raw_str,
+                            parenttag=parenttag, location="Unknown", file_source="test")
+
+
+def make_document(memo):
+    return process_amz.Document("", allparenttags=TAGS, memo=memo)
+
+
+def test_normalize_folds_merchant_variants():
+    assert normalize_merchant("UBER *TRIP HELP.UBER.COM") == "UBER TRIP"
+    assert normalize_merchant("UBER *TRIP 8YH2K") == "UBER TRIP"
+    assert normalize_merchant("UBER TRIP SAN FRANCISCO CA") == "UBER TRIP"
+
+
+def test_majority_vote_wins_and_persists(tmp_path):
+    path = str(tmp_path / "memo.json")
+    memo = MerchantMemo(path=path)
+    for parenttag in ("Travel", "Travel", "Shopping"):
+        memo.learn("UBER *TRIP 8YH2K", "Uber", parenttag)
+    memo.save()
+
+    reloaded = MerchantMemo(path=path)
+    assert reloaded.lookup("UBER TRIP SAN FRANCISCO CA") == {"name": "Uber", "parenttag": "Travel"}
+    assert reloaded.lookup("UBER TRIP", allowed_tags=["Food & Dining"]) is None
+
+
+def test_llm_answers_vote_even_when_the_memo_knows_the_merchant():
+    memo = MerchantMemo()
+    document = make_document(memo)
+    for _ in range(3):
+        document.apply_memo(make_item("Uber", "Travel", "UBER *TRIP 8YH2K"))
+
+    assert memo._entries["UBER TRIP"]["tags"] == {"Travel": 3}
+
+
+def test_memo_keeps_the_llm_name_and_category():
+    memo = MerchantMemo()
+    memo.learn("UBER *TRIP 8YH2K", "Uber", "Travel")
+    item = make_item("Uber Eats order", "Food & Dining", "UBER *TRIP 8YH2K")
+
+    make_document(memo).apply_memo(item)
+
+    assert (item.name, item.parenttag) == ("Uber Eats order", "Food & Dining")
+
+
+def test_memo_fills_a_missing_or_unknown_category():
+    memo = MerchantMemo()
+    memo.learn("UBER *TRIP 8YH2K", "Uber", "Travel")
+    document = make_document(memo)
+    for parenttag in ("", "Not A Tag"):
+        item = make_item("Uber ride", parenttag, "UBER *TRIP 8YH2K")
+        document.apply_memo(item)
+        assert (item.name, item.parenttag) == ("Uber ride", "Travel")
+
+
+def test_version_changes_with_answers_not_votes():
+    memo = MerchantMemo()
+    empty = memo.version()
+    memo.learn("UBER *TRIP 8YH2K", "Uber", "Travel")
+    learned = memo.version()
+    assert learned != empty
+
+    memo.learn("UBER TRIP SAN FRANCISCO CA", "Uber", "Travel")
+    assert memo.version() == learned
+
+    for _ in range(3):
+        memo.learn("UBER TRIP", "Uber", "Shopping")
+    assert memo.lookup("UBER TRIP")["parenttag"] == "Shopping"
+    assert memo.version() != learned
@@ -0,0 +1,53 @@
+from chunking import Chunk
+from process_amz import merge_chunk_transactions
+
+
+def transaction(date, price, name="Coffee"):
+    return {"date": date, "price": price, "name": name}
+
+
+def test_overlap_copies_are_dropped_once():
+    chunks = [Chunk(index=0, text="..."), Chunk(index=1, text="...", overlap_text="01/05 STARBUCKS $1,205.00")]
+    merged = merge_chunk_transactions(chunks, [[transaction("01/05", 1205.0)],
+                                               [transaction("01/05", 1205.0), transaction("01/06", 3.0)]])
+    assert merged == [transaction("01/05", 1205.0), transaction("01/06", 3.0)]
+
+
+def test_amount_inside_a_larger_overlap_amount_is_kept():
+    # The overlap holds a 15.00 and a 105.00 charge; a separate 5.00 charge on the same day is real
+    chunks = [Chunk(index=0, text="..."),
+              Chunk(index=1, text="...", overlap_text="01/05 CINEMA 15.00\n01/05 HOTEL 105.00")]
+    merged = merge_chunk_transactions(chunks, [[transaction("01/05", 5.0, "Parking")],
+                                               [transaction("01/05", 5.0, "Parking")]])
+    assert len(merged) == 2
+
+
+def test_unparseable_windows_are_counted(monkeypatch):
+    import process_amz
+
+    document = process_amz.Document("01/05 A 1.00\n01/06 B 2.00\n01/07 C 3.00\n01/08 D 4.00", allparenttags="Travel")
+    monkeypatch.setattr(document, "run_openai", lambda prompt="", response_format=None: None)
+
+    assert document.extract_chunk(document.document, splits_left=1) == []
+    # Split once into two halves, both unparseable
+    assert document.failed_windows == 2
+
+
+def test_incomplete_results_are_not_cached(monkeypatch):
+    import lambda_function
+    import process_amz
+    import synthetic
+    from result_cache import ResultCache
+
+    cache = ResultCache(max_bytes=1024 * 1024)
+    monkeypatch.setattr(lambda_function, "_RESULT_CACHE", cache)
+    monkeypatch.setattr(process_amz.Document, "run_openai", lambda self, prompt="", response_format=None: '{"trans')
+    pdf, text = b"%PDF-1.4 generic", synthetic.statement_text(6, "generic", seed=5)
+
+    lambda_function.process_single_pdf(pdf, "Travel\nShopping", None, text=text)
+    assert cache.stats()["entries"] == 0
+
+    monkeypatch.setattr(process_amz.Document, "run_openai",
+                        lambda self, prompt="", response_format=None: '{"transactions": []}')
+    lambda_function.process_single_pdf(pdf, "Travel\nShopping", None, text=text)
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,63 @@
+import io
+import time
+
+import pandas as pd
+
+import process
+import synthetic
+from deadline import Deadline
+from merchant_memo import MerchantMemo
+from metrics import Metrics
+
+TAGS = ["Food & Dining", "Travel", "Shopping", "Entertainment"]
+
+
+def make_document(layout, count, deadline=None, metrics=None):
+    df = pd.read_csv(io.StringIO(synthetic.statement_csv(count, layout, seed=4)))
+    return process.Document(df, allparenttags=TAGS, memo=MerchantMemo(), metrics=metrics or Metrics(),
+                            deadline=deadline)
+
+
+def test_per_row_calls_use_the_documents_deadline(mock_llm):
+    # Row calls run on pool threads; the deadline has to reach them without contextvars
+    expired = Deadline()
+    expired.ends_at = time.monotonic() - 1
+    document = make_document("generic", 3, deadline=expired)
+    requests = mock_llm.counters["requests"]
+
+    document.convert_doc_to_items(batch_size=1)
+
+    assert document.items == []
+    assert document.stats["failed"] == 3
+    assert mock_llm.counters["requests"] == requests
+
+
+def test_per_row_calls_record_into_the_documents_metrics(mock_llm):
+    metrics = Metrics()
+    document = make_document("generic", 3, metrics=metrics)
+
+    document.convert_doc_to_items(batch_size=1)
+
+    assert len(document.items) == 3
+    assert metrics.summary()["llm"]["calls"] == 3
+
+
+def test_labels_outside_the_current_tags_go_to_the_llm(mock_llm):
+    # Memo and classifier both learned "Travel", which the user has since removed
+    from test_category_classifier import trained, TRAINING
+
+    tags = ["Food & Dining", "Transportation", "Shopping"]
+    memo = MerchantMemo()
+    memo.learn("MARRIOTT HOTEL", "Marriott", "Travel")
+    df = pd.DataFrame({"Date": ["01/02/2024", "01/03/2024", "01/04/2024"],
+                       "Description": ["MARRIOTT HOTEL", "DELTA AIR LINES ATL", "STARBUCKS STORE 09999"],
+                       "Amount": ["120.00", "310.00", "4.50"]})
+    document = process.Document(df, allparenttags=tags, memo=memo, classifier=trained(TRAINING), metrics=Metrics())
+    requests = mock_llm.counters["requests"]
+
+    document.convert_doc_to_items(batch_size=25)
+
+    assert mock_llm.counters["requests"] == requests + 1
+    assert len(document.items) == 3
+    assert all(item.parenttag in tags for item in document.items)
+    assert document.items[2].parenttag == "Food & Dining"
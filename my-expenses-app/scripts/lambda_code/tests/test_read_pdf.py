@@ -0,0 +1,59 @@
+import synthetic
+from readPdf import extract_text_from_pdf_bytes, iter_pdf_pages, remove_repeated_lines
+
+
+def test_page_range_workers_match_serial_extraction():
+    pdf = synthetic.statement_pdf(200, "amex", seed=6)
+    serial = list(iter_pdf_pages(pdf))
+
+    assert len(serial) > 4
+    assert list(iter_pdf_pages(pdf, workers=2, pages_per_task=2)) == serial
+    assert list(iter_pdf_pages(memoryview(pdf), max_pages=3)) == serial[:3]
+
+
+def test_extract_joins_pages_in_order():
+    pdf = synthetic.statement_pdf(120, "amex", seed=6)
+    assert extract_text_from_pdf_bytes(pdf) == "\n".join(iter_pdf_pages(pdf))
+    assert extract_text_from_pdf_bytes(pdf, max_pages=1).count("Page ") == 1
+
+
+def make_pages(count):
+    pages = []
+    for page in range(1, count + 1):
+        pages.append("\n".join([
+            "American Express  americanexpress.com",
+            f"Page {page} of {count}",
+            "Closing Date 01/31/24",
+            f"01/{page:02d}/24 NETFLIX.COM",
+            "LOS GATOS CA $15.49",
+            "NETFLIX.COM LOS GATOS CA",
+            f"01/{page + 10:02d}/24 SHELL OIL 57444 ATLANTA GA $41.20",
+            "NETFLIX.COM LOS GATOS CA",
+            f"01/{page + 20:02d}/24 KROGER #441 $22.10",
+            "Please see reverse side for important information",
+        ]))
+    return pages
+
+
+def test_repeated_headers_and_footers_are_stripped_after_the_first_page():
+    pages, stats = remove_repeated_lines(make_pages(4))
+
+    assert pages[0].splitlines()[:2] == ["American Express  americanexpress.com", "Page 1 of 4"]
+    for page in pages[1:]:
+        assert "americanexpress.com" not in page
+        assert "Page " not in page
+        assert "Please see reverse side" not in page
+    assert stats["lines_removed"] == 9
+
+
+def test_dates_and_body_lines_are_never_stripped():
+    original = make_pages(4)
+    pages, _ = remove_repeated_lines(original)
+
+    for before, after in zip(original, pages):
+        body = [line for line in before.splitlines()
+                if "americanexpress" not in line and "Page " not in line and "reverse side" not in line]
+        assert [line for line in after.splitlines() if line in body] == body
+        # The recurring merchant line sits in the page body, outside the header/footer bands
+        assert after.count("NETFLIX.COM LOS GATOS CA") == 2
+        assert "Closing Date 01/31/24" in after
@@ -0,0 +1,70 @@
+from result_cache import ResultCache
+
+import lambda_function
+
+PDF = b"%PDF-1.4 statement"
+TAGS = "Food & Dining\nTravel"
+
+
+def test_key_depends_on_content_tags_and_options():
+    options = dict(lambda_function.RESULT_CACHE_OPTIONS)
+    key = ResultCache.make_key(PDF, TAGS, options)
+
+    assert key == ResultCache.make_key(PDF, TAGS, dict(options))
+    assert key != ResultCache.make_key(PDF + b" ", TAGS, options)
+    assert key != ResultCache.make_key(PDF, TAGS + "\nShopping", options)
+    for name, changed in [("max_pages", 3), ("strip_repeated", not options["strip_repeated"]),
+                          ("prestructure", not options["prestructure"]), ("model", "other-model")]:
+        assert key != ResultCache.make_key(PDF, TAGS, {**options, name: changed}), name
+
+
+def test_hits_return_fresh_copies():
+    cache = ResultCache(max_bytes=1024 * 1024)
+    key = ResultCache.make_key(PDF, TAGS)
+    nodes = [{"name": "Expenses", "index": 0}, {"name": "Travel", "index": 1}]
+    cache.put(key, nodes, {0: [1]})
+
+    first, parent_child_map = cache.get(key)
+    first[1]["index"] = 99
+    second, _ = cache.get(key)
+
+    assert second == nodes
+    assert parent_child_map == {0: [1]}
+    assert cache.stats()["memory_hits"] == 2
+
+
+def test_lru_evicts_past_max_bytes():
+    cache = ResultCache(max_bytes=200)
+    keys = [ResultCache.make_key(PDF, str(i)) for i in range(5)]
+    for key in keys:
+        cache.put(key, [{"name": "x" * 40, "index": 0}], {})
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) is not None
+    assert cache.stats()["evictions"] > 0
+
+
+def test_key_follows_memo_and_model(tmp_path, monkeypatch):
+    import category_classifier
+    import merchant_memo
+
+    memo = merchant_memo.MerchantMemo()
+    monkeypatch.setattr(merchant_memo, "get_default_memo", lambda: memo)
+    model_path = tmp_path / "model.npz"
+    monkeypatch.setenv("CATEGORY_MODEL_PATH", str(model_path))
+    monkeypatch.setattr(category_classifier, "_DEFAULT_CLASSIFIER_LOADED", False)
+
+    def key():
+        return ResultCache.make_key(PDF, TAGS, lambda_function.result_cache_options())
+
+    before = key()
+    assert key() == before
+    memo.learn("BLUE BOTTLE COFFEE", "Blue Bottle", "Food & Dining")
+    after_memo = key()
+    assert after_memo != before
+
+    model_path.write_bytes(b"retrained")
+    assert key() != after_memo
+
+    monkeypatch.setenv("FAST_PATH_DISABLED", "1")
+    assert key() != after_memo
@@ -0,0 +1,69 @@
+import synthetic
+from statement_formats import parse_coverage, parse_statement_text, detect_text_format
+
+HEADER = ["American Express  americanexpress.com", "Account Ending 1-23456", "Page 1 of 1"]
+
+
+def test_known_layout_is_parsed_without_the_llm():
+    records = parse_statement_text(synthetic.statement_text(30, "amex", seed=5))
+
+    assert records is not None and len(records) == 30
+    assert all(record["date"] and record["amount"] > 0 and record["file_source"] == "amex" for record in records)
+
+
+def test_rows_the_pattern_misses_send_the_statement_to_the_llm():
+    # 10 rows the amex pattern matches, 5 in a two-column-date layout it doesn't
+    matched = [f"01/{day:02d}/24 STARBUCKS STORE 0{day} ATLANTA GA $4.{day:02d}" for day in range(1, 11)]
+    missed = [f"01/{day:02d}/24 01/{day + 1:02d}/24 SHELL OIL 57444 ATLANTA GA 41.{day:02d} USD" for day in range(11, 16)]
+    text = "\n".join(HEADER + matched + missed)
+
+    assert parse_coverage(text, detect_text_format(text)) == (15, 10)
+    assert parse_statement_text(text) is None
+
+
+def test_wrapped_rows_count_as_transactions():
+    rows = [f"01/{day:02d}/24 WHOLEFDS MKT 10234 ATLANTA GA $33.{day:02d}" for day in range(1, 6)]
+    wrapped = ["01/20/24 DELTA AIR LINES 0062345678901", "ATLANTA GA $412.20"]
+    text = "\n".join(HEADER + rows + wrapped)
+
+    assert parse_coverage(text, detect_text_format(text)) == (6, 5)
+    assert parse_statement_text(text) is None
+    assert parse_statement_text("\n".join(HEADER + rows)) is not None
+
+
+def test_unknown_issuer_is_left_to_the_llm():
+    assert parse_statement_text(synthetic.statement_text(10, "generic", seed=5)) is None
+
+
+def test_response_schemas_never_offer_blank_tags():
+    import process
+    from statement_formats import category_response_format, tag_list
+
+    assert tag_list("Food & Dining\n\n  \nTravel\n") == ["Food & Dining", "Travel"]
+    assert tag_list(["Food & Dining", "", "  ", None, "Travel "]) == ["Food & Dining", "Travel"]
+    for schema in (category_response_format(["Food & Dining", "", "Travel"]),
+                   process.batch_response_format("Food & Dining\n\nTravel")):
+        properties = schema["json_schema"]["schema"]["properties"]["records"]["items"]["properties"]
+        assert properties["parenttag"]["enum"] == ["Food & Dining", "Travel"]
+
+
+def test_categorize_drops_labels_outside_the_current_tags():
+    import json
+
+    from merchant_memo import MerchantMemo
+    from statement_formats import categorize
+    from test_category_classifier import TRAINING, trained
+
+    memo = MerchantMemo()
+    memo.learn("MARRIOTT HOTEL", "Marriott", "Travel")
+    asked = []
+
+    def complete(prompt, response_format):
+        asked.extend(json.loads(line)["merchant"] for line in prompt.splitlines() if line.startswith("{"))
+        return json.dumps({"records": [{"id": i, "name": "Trip", "parenttag": "Shopping"} for i in range(2)]})
+
+    results = categorize(["MARRIOTT HOTEL", "DELTA AIR LINES ATL", "STARBUCKS STORE 09999"],
+                         "Food & Dining\nTransportation\nShopping", memo, complete, classifier=trained(TRAINING))
+
+    assert asked == ["MARRIOTT HOTEL", "DELTA AIR LINES ATL"]
+    assert [tag for _, tag in results] == ["Shopping", "Shopping", "Food & Dining"]
@@ -0,0 +1,51 @@
+import synthetic
+from statement_lines import find_transaction_lines, prestructure
+
+HEADER = ["Customer Service 1-800-555-0100", "Account Ending 1-23456", "Page 1 of 1"]
+
+
+def test_compact_table_keeps_every_transaction():
+    text = synthetic.statement_text(25, "generic", seed=7)
+    result = prestructure(text)
+
+    assert result is not None
+    assert result.lines == 25
+    lines = result.text.splitlines()
+    table = lines.index("date|description|amount")
+    assert len(lines) - table - 1 == 25
+    assert result.compact_tokens < result.original_tokens
+
+
+def test_wrapped_descriptions_are_joined():
+    lines = find_transaction_lines("01/20/24 DELTA AIR LINES 0062345678901\nATLANTA GA $412.20")
+    assert lines == [{"date": "01/20/24", "description": "DELTA AIR LINES 0062345678901 ATLANTA GA",
+                      "amount": "$412.20"}]
+
+
+def test_rows_the_heuristics_miss_send_the_full_text():
+    # Amount followed by a currency code: dated and priced, but not a candidate line
+    found = [f"01/{day:02d}/24 STARBUCKS STORE 0{day} ATLANTA GA $4.{day:02d}" for day in range(1, 11)]
+    missed = [f"01/{day:02d}/24 SHELL OIL 57444 ATLANTA GA 41.{day:02d} USD" for day in range(11, 16)]
+    text = "\n".join(HEADER + found + missed)
+
+    assert len(find_transaction_lines(text)) == 10
+    assert prestructure(text) is None
+    assert prestructure("\n".join(HEADER + found)) is not None
+
+
+def test_short_statements_are_still_prestructured():
+    text = "\n".join(HEADER + ["01/05/24 UBER TRIP HELP.UBER.COM CA $12.34"])
+    result = prestructure(text)
+    assert result is not None and result.lines == 1
+
+
+def test_header_lines_stay_above_the_table():
+    # Issuer, account and address are what the model fills file_source / location from
+    text = "\n".join(["American Express", "Jane Doe  12 Peachtree St, Atlanta GA"] + HEADER +
+                     ["01/05/24 UBER TRIP HELP.UBER.COM CA $12.34", "Please see reverse side"])
+    lines = prestructure(text).text.splitlines()
+
+    table = lines.index("date|description|amount")
+    assert lines[:table] == ["Statement header:", "Issuer: amex", "American Express",
+                             "Jane Doe  12 Peachtree St, Atlanta GA", *HEADER, ""]
+    assert lines[table + 1:] == ["01/05/24|UBER TRIP HELP.UBER.COM CA|$12.34"]
@@ -0,0 +1,93 @@
+import io
+
+import pandas as pd
+import pytest
+
+import process
+from merchant_memo import MerchantMemo
+from transaction_store import TransactionStore
+from viz_stream import NodeStreamBuilder
+
+TAGS = ["Food & Dining", "Travel", "Shopping", "Entertainment"]
+
+# Fast-path (amex) export spanning two months
+AMEX_CSV = """Date,Description,Amount,Reference
+01/05/2024,STARBUCKS STORE 123,4.50,'320100000001'
+01/20/2024,DELTA AIR LINES,312.00,'320100000002'
+02/03/2024,STARBUCKS STORE 123,5.25,'320100000003'
+"""
+
+# No known headers: goes to the LLM, the date still comes from the row
+GENERIC_CSV = """Date,Description,Amount
+2024-03-02,STARBUCKS STORE 123,4.50
+2024-04-11,DELTA AIR LINES,312.00
+"""
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransactionStore(path=str(tmp_path / "transactions.sqlite3"))
+
+
+def upload(store, csv_text, batch_size=None, month="2030-01"):
+    # What app.py does with an upload: classify, build the nodes, store them under the upload month
+    document = process.Document(pd.read_csv(io.StringIO(csv_text)), allparenttags=TAGS, memo=MerchantMemo())
+    document.convert_doc_to_items(batch_size=batch_size)
+    builder = NodeStreamBuilder()
+    builder.add_items(document.items)
+    store.add_viz("u1", builder.nodes, builder.parent_child_map, month=month, source="statement.csv")
+    return document
+
+
+def test_fast_path_items_keep_their_dates(store, mock_llm):
+    document = upload(store, AMEX_CSV)
+
+    assert document.stats["format"] == "amex"
+    assert [item.date for item in document.items] == ["01/05/2024", "01/20/2024", "02/03/2024"]
+    rows = store.query("u1")
+    assert [row["date"] for row in rows] == ["2024-01-05", "2024-01-20", "2024-02-03"]
+    assert store.months("u1") == ["2024-01", "2024-02"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 25])
+def test_llm_path_items_keep_their_dates(store, mock_llm, batch_size):
+    upload(store, GENERIC_CSV, batch_size=batch_size)
+
+    assert sorted(row["date"] for row in store.query("u1")) == ["2024-03-02", "2024-04-11"]
+    assert store.months("u1") == ["2024-03", "2024-04"]
+
+
+def test_undated_items_fall_back_to_the_upload_month(store):
+    item = process.Item(name="Coffee", price=4.5, index=0, parenttag="Food & Dining")
+    builder = NodeStreamBuilder()
+    builder.add_items([item])
+    store.add_viz("u1", builder.nodes, builder.parent_child_map, month="2030-01")
+
+    assert [row["date"] for row in store.query("u1")] == [None]
+    assert store.months("u1") == ["2030-01"]
+
+
+def test_rollups_use_the_transaction_month(store, mock_llm):
+    upload(store, AMEX_CSV)
+    upload(store, GENERIC_CSV)
+
+    rollups = store.rollups("u1")
+    assert {rollup["month"] for rollup in rollups} == {"2024-01", "2024-02", "2024-03", "2024-04"}
+    by_month = {}
+    for rollup in rollups:
+        by_month[rollup["month"]] = by_month.get(rollup["month"], 0) + rollup["total"]
+    assert by_month == {"2024-01": 316.5, "2024-02": 5.25, "2024-03": 4.5, "2024-04": 312.0}
+    assert [rollup["month"] for rollup in store.rollups("u1", month_from="2024-02", month_to="2024-03")] == \
+        ["2024-02", "2024-03"]
+
+
+def test_upload_key_stores_an_upload_once(store):
+    item = process.Item(name="Coffee", price=4.5, index=0, parenttag="Food & Dining")
+    builder = NodeStreamBuilder()
+    builder.add_items([item])
+    first = store.add_viz("u1", builder.nodes, builder.parent_child_map, month="2030-01", upload_key="job-1")
+    again = store.add_viz("u1", builder.nodes, builder.parent_child_map, month="2030-01", upload_key="job-1")
+
+    assert again == {**first, "duplicate": True}
+    assert len(store.query("u1")) == 1
+    assert [(rollup["total"], rollup["count"]) for rollup in store.rollups("u1")] == [(4.5, 1)]
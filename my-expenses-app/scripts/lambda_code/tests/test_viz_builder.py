@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+import process_amz
+from viz_builder import TransactionColumns, append_viz, build_viz, columns_from_viz
+from viz_stream import NodeStreamBuilder
+
+ROWS = [("Uber", 12.5, "Transportation", "01/05/24"), ("Starbucks", 4.25, "Food & Dining", "01/06/24"),
+        ("Shell", 40.0, "Transportation", "01/07/24"), ("Kroger", 61.1, "Food & Dining", "01/08/24"),
+        ("Delta", 412.2, "Travel", "01/09/24")]
+
+
+def reference_viz(rows):
+    # The layout convert_data_to_viz produced before the columnar builder
+    nodes, parent_child_map, category_index = [{"name": "Expenses", "index": 0}], {}, {}
+    for name, cost, parenttag, date in rows:
+        if parenttag not in category_index:
+            category_index[parenttag] = len(nodes)
+            nodes.append({"name": parenttag, "index": len(nodes)})
+            parent_child_map[category_index[parenttag]] = []
+        parent_child_map[category_index[parenttag]].append(len(nodes))
+        nodes.append({"name": name, "cost": cost, "index": len(nodes), "date": date})
+    return nodes, parent_child_map
+
+
+def make_columns(rows=ROWS):
+    columns = TransactionColumns(detail_fields=("date",))
+    for name, cost, parenttag, date in rows:
+        columns.append(name, cost, parenttag, date=date)
+    return columns
+
+
+def test_build_matches_the_node_by_node_layout():
+    output, parent_child_map = build_viz(make_columns())
+    assert (output["nodes"], parent_child_map) == reference_viz(ROWS)
+
+
+def test_build_from_slot_items():
+    items = [process_amz.Item(name=name, price=cost, date=date, index=i, parenttag=parenttag)
+             for i, (name, cost, parenttag, date) in enumerate(ROWS)]
+    output, _ = build_viz(TransactionColumns.from_items(items, detail_fields=("date",)))
+
+    assert not hasattr(items[0], "__dict__")
+    assert output["nodes"] == reference_viz(ROWS)[0]
+
+
+def test_empty_columns_give_just_the_root():
+    assert build_viz(TransactionColumns()) == ({"nodes": [{"name": "Expenses", "index": 0}]}, {})
+
+
+def test_columns_round_trip_through_a_viz():
+    output, parent_child_map = build_viz(make_columns())
+    columns = columns_from_viz(output["nodes"], {str(key): value for key, value in parent_child_map.items()})
+
+    # Grouped by category, row order kept within each
+    assert columns.names == ["Uber", "Shell", "Starbucks", "Kroger", "Delta"]
+    assert columns.details == {"date": ["01/05/24", "01/07/24", "01/06/24", "01/08/24", "01/09/24"]}
+    assert columns.category_totals() == pytest.approx({"Transportation": 52.5, "Food & Dining": 65.35,
+                                                       "Travel": 412.2})
+
+
+def test_append_reuses_categories_and_keeps_indices():
+    output, parent_child_map = build_viz(make_columns(ROWS[:3]))
+    nodes = output["nodes"]
+    existing = {node["index"]: node["name"] for node in nodes}
+
+    stats = append_viz(nodes, parent_child_map, make_columns(ROWS[3:]))
+
+    assert stats == {"transactions_added": 2, "categories_added": 1, "categories_reused": 1}
+    assert {index: nodes[index]["name"] for index in existing} == existing
+    assert [node["index"] for node in nodes] == list(range(len(nodes)))
+    assert [nodes[child]["name"] for child in parent_child_map[3]] == ["Starbucks", "Kroger"]
+    assert nodes[3]["cost"] == pytest.approx(65.35)
+    assert nodes[0]["cost"] == pytest.approx(sum(cost for _, cost, _, _ in ROWS))
+
+
+def test_append_to_nodes_that_are_not_stored_at_their_index():
+    output, parent_child_map = build_viz(make_columns(ROWS[:3]))
+    nodes = output["nodes"]
+    # Same first and last positions, middle nodes swapped (e.g. a merged or re-sorted result)
+    nodes[3], nodes[4] = nodes[4], nodes[3]
+
+    append_viz(nodes, parent_child_map, make_columns(ROWS[3:]))
+
+    by_index = {node["index"]: node for node in nodes}
+    assert len(by_index) == len(nodes)
+    food = next(key for key in parent_child_map if by_index[key]["name"] == "Food & Dining")
+    assert [by_index[child]["name"] for child in parent_child_map[food]] == ["Starbucks", "Kroger"]
+    assert by_index[food]["cost"] == pytest.approx(65.35)
+
+
+def test_streamed_chunks_match_the_one_shot_layout():
+    items = [SimpleNamespace(name=name, cost=cost, parenttag=parenttag, date=date) for name, cost, parenttag, date in ROWS]
+    builder = NodeStreamBuilder()
+    first = builder.add_items(items[:2])
+    second = builder.add_items(items[2:])
+
+    nodes, parent_child_map = reference_viz(ROWS)
+    assert [(node["name"], node["index"], node.get("date")) for node in builder.nodes] == \
+        [(node["name"], node["index"], node.get("date")) for node in nodes]
+    assert builder.parent_child_map == parent_child_map
+    # Categories are announced once, on first sight
+    assert [record["name"] for record in first + second if record["type"] == "category"] == \
+        ["Transportation", "Food & Dining", "Travel"]
+    assert {record["index"]: record["parent"] for record in second if record["type"] == "transaction"} == \
+        {5: 1, 6: 3, 8: 7}
+    summary = builder.summary()
+    assert summary["root"]["cost"] == pytest.approx(sum(row[1] for row in ROWS))
+    assert summary["category_totals"] == {1: pytest.approx(52.5), 3: pytest.approx(65.35), 7: pytest.approx(412.2)}
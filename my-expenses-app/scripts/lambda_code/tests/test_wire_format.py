@@ -0,0 +1,74 @@
+import gzip
+import json
+
+import pytest
+
+import wire_format
+from wire_format import columnar_body, from_columnar, negotiate_compression, negotiate_wire_format, to_columnar
+
+NODES = [
+    {"name": "Expenses", "index": 0, "cost": 321.75},
+    {"name": "Food & Dining", "index": 1, "cost": 9.75},
+    {"name": "Coffee", "index": 2, "cost": 4.5, "date": "2024-01-05"},
+    {"name": "Coffee", "index": 3, "cost": 5.25, "date": "2024-02-03", "location": "NYC"},
+    {"name": "Travel", "index": 4, "cost": 312.0},
+    {"name": "Flight", "index": 5, "cost": 312.0, "date": "2024-01-20"},
+]
+PARENT_CHILD_MAP = {0: [1, 4], 1: [2, 3], 4: [5]}
+
+
+def body(stats):
+    return {"output": [dict(node) for node in NODES], "parent_child_map": dict(PARENT_CHILD_MAP),
+            "count": 1, **({"stats": stats} if stats is not None else {})}
+
+
+def test_columnar_round_trip():
+    nodes, parent_child_map = from_columnar(to_columnar(NODES, PARENT_CHILD_MAP))
+
+    expected = [dict(node) for node in NODES]
+    for node in expected[1:]:
+        if node["index"] not in (1, 4):
+            node.setdefault("date", None)
+            node.setdefault("location", None)
+    assert nodes == expected
+    assert parent_child_map == {1: [2, 3], 4: [5]}
+
+
+@pytest.mark.parametrize("stats", [{"pdfs": 1, "errors": []}, {}, None, {"pdfs": 1, "wire": {"stale": True}}])
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_columnar_body(stats, compression):
+    source = body(stats)
+    payload, wire = columnar_body(source, compression)
+
+    raw = gzip.decompress(payload) if compression else payload
+    decoded = json.loads(raw)
+    assert decoded["stats"]["wire"] == wire
+    assert {key: value for key, value in decoded["stats"].items() if key != "wire"} == \
+        {key: value for key, value in (stats or {}).items() if key != "wire"}
+    assert decoded["count"] == 1 and "output" not in decoded
+    assert from_columnar(decoded["columnar"])[1] == {1: [2, 3], 4: [5]}
+
+    # Sizes describe the body without the wire block
+    without_wire = raw.replace(b'"wire":' + json.dumps(wire, separators=(",", ":")).encode(), b"")
+    without_wire = without_wire.replace(b",}", b"}")
+    assert wire["json_bytes"] == len(without_wire)
+    assert wire["encoding"] == (compression or "identity")
+    if stats is not None:
+        assert source["stats"]["wire"] == wire
+
+
+def test_columnar_body_without_orjson(monkeypatch):
+    monkeypatch.setattr(wire_format, "orjson", None)
+    payload, wire = columnar_body(body({"pdfs": 1}))
+    assert wire["encoder"] == "json"
+    assert json.loads(payload)["stats"] == {"pdfs": 1, "wire": wire}
+
+
+def test_negotiation():
+    assert negotiate_wire_format("columnar") == "columnar"
+    assert negotiate_wire_format(None, wire_format.COLUMNAR_CONTENT_TYPE) == "columnar"
+    assert negotiate_wire_format("nodes", wire_format.COLUMNAR_CONTENT_TYPE) is None
+    with pytest.raises(ValueError):
+        negotiate_wire_format("xml")
+    assert negotiate_compression(None, "br, gzip") == "gzip"
+    assert negotiate_compression("0", "gzip") is None
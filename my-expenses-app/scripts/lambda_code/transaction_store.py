@@ -0,0 +1,300 @@
+"""
+Persistent, indexed store for processed transactions (the nodes /
+parent_child_map output of convert_data_to_viz), partitioned by user and
+month. Uploads are bulk-inserted in one transaction; reads pull just the
+requested user / month / category / date slice through the indexes and
+rebuild the visualization for it.
+
+Per user x month x category rollups (total, count, min, max) are kept up to
+date in the same transaction as each upload, so dashboards read totals
+without touching the transactions; each user's version changes with every
+upload and serves as the cache validator.
+
+    store = TransactionStore()
+    store.add_viz("alice", nodes, parent_child_map, month="2024-03")
+    output, parent_child_map = store.query_viz("alice", month_from="2024-01", month_to="2024-03")
+    rollups = store.rollups("alice", month_from="2024-01")
+
+Configuration (environment):
+    TRANSACTION_DB_PATH   SQLite file (default transactions.sqlite3 next to the app)
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from viz_builder import DETAIL_FIELDS, TransactionColumns, build_viz, columns_from_viz
+
+TRANSACTION_DB_PATH = os.getenv('TRANSACTION_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                    "..", "transactions.sqlite3"))
+
+DEFAULT_USER = "default"
+# Node detail fields kept per transaction row (the raw description only feeds classifier training)
+STORED_DETAIL_FIELDS = ("date", "location", "file_source")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id         INTEGER PRIMARY KEY,
+    user_id    TEXT NOT NULL,
+    source     TEXT,
+    rows       INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    upload_key TEXT
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id          INTEGER PRIMARY KEY,
+    upload_id   INTEGER NOT NULL REFERENCES uploads (id),
+    user_id     TEXT NOT NULL,
+    month       TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    date        TEXT,
+    name        TEXT,
+    cost        REAL NOT NULL,
+    location    TEXT,
+    file_source TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_user_month_category ON transactions (user_id, month, category);
+CREATE INDEX IF NOT EXISTS transactions_user_date ON transactions (user_id, date);
+CREATE INDEX IF NOT EXISTS transactions_user_category_date ON transactions (user_id, category, date);
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id  TEXT NOT NULL,
+    month    TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total    REAL NOT NULL,
+    count    INTEGER NOT NULL,
+    min_cost REAL NOT NULL,
+    max_cost REAL NOT NULL,
+    PRIMARY KEY (user_id, month, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id    TEXT PRIMARY KEY,
+    version    INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Upload aggregates folded into the stored rollups
+UPSERT_ROLLUP = """
+INSERT INTO rollups (user_id, month, category, total, count, min_cost, max_cost) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, month, category) DO UPDATE SET
+    total = total + excluded.total,
+    count = count + excluded.count,
+    min_cost = MIN(min_cost, excluded.min_cost),
+    max_cost = MAX(max_cost, excluded.max_cost)
+"""
+
+# Rollups for transactions stored before the rollup table existed
+BACKFILL_ROLLUPS = """
+INSERT INTO rollups (user_id, month, category, total, count, min_cost, max_cost)
+SELECT user_id, month, category, SUM(cost), COUNT(*), MIN(cost), MAX(cost)
+FROM transactions GROUP BY user_id, month, category
+"""
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+_US_DATE_RE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})$")
+_ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+
+
+def normalize_date(value) -> Optional[str]:
+    """ISO YYYY-MM-DD for MM/DD/YY, MM/DD/YYYY or ISO input; None if it isn't a full date."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    match = _ISO_DATE_RE.match(text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+    else:
+        match = _US_DATE_RE.match(text)
+        if not match:
+            return None
+        month, day, year = (int(part) for part in match.groups())
+        if year < 100:
+            year += 2000
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def check_month(month: Optional[str]) -> Optional[str]:
+    if month is not None and not _MONTH_RE.match(month):
+        raise ValueError(f"Month must look like YYYY-MM, got {month!r}")
+    return month
+
+
+class TransactionStore:
+    """SQLite transaction table; one connection per thread, WAL so reads don't block uploads."""
+
+    def __init__(self, path: str = TRANSACTION_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Stores created before uploads had an idempotency key
+            if "upload_key" not in {row["name"] for row in conn.execute("PRAGMA table_info(uploads)")}:
+                conn.execute("ALTER TABLE uploads ADD COLUMN upload_key TEXT")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uploads_key ON uploads (upload_key)")
+            if conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None:
+                conn.execute(BACKFILL_ROLLUPS)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_columns(self, user_id: str, columns: TransactionColumns, month: Optional[str] = None,
+                    source: Optional[str] = None, upload_key: Optional[str] = None) -> dict:
+        """
+        Bulk-insert one upload and fold it into the user's rollups. A
+        transaction's month comes from its own date when it has one, else
+        `month` (the upload's month, default: this month).
+
+        upload_key (e.g. a job id) makes the write idempotent: an upload
+        already stored under that key is returned as is (duplicate=True)
+        and nothing is inserted again.
+        """
+        fallback_month = check_month(month) or time.strftime("%Y-%m")
+        dates = columns.details.get("date") or [None] * len(columns)
+        locations = columns.details.get("location") or [None] * len(columns)
+        file_sources = columns.details.get("file_source") or [None] * len(columns)
+        categories = columns.categories
+        # (month, category) -> [total, count, min, max] for this upload
+        aggregates: Dict[Tuple[str, str], list] = {}
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if upload_key is not None:
+                existing = conn.execute("SELECT id, rows FROM uploads WHERE upload_key = ?", (upload_key,)).fetchone()
+                if existing is not None:
+                    conn.execute("COMMIT")
+                    return {"upload_id": existing["id"], "rows": existing["rows"], "duplicate": True}
+            upload_id = conn.execute(
+                "INSERT INTO uploads (user_id, source, rows, created_at, upload_key) VALUES (?, ?, ?, ?, ?)",
+                (user_id, source, len(columns), time.time(), upload_key),
+            ).lastrowid
+
+            def rows():
+                for name, cost, category_id, raw_date, location, file_source in zip(
+                        columns.names, columns.costs, columns.category_ids, dates, locations, file_sources):
+                    iso = normalize_date(raw_date)
+                    month_key, category = iso[:7] if iso else fallback_month, categories[category_id]
+                    aggregate = aggregates.get((month_key, category))
+                    if aggregate is None:
+                        aggregates[(month_key, category)] = [cost, 1, cost, cost]
+                    else:
+                        aggregate[0] += cost
+                        aggregate[1] += 1
+                        aggregate[2] = min(aggregate[2], cost)
+                        aggregate[3] = max(aggregate[3], cost)
+                    yield (upload_id, user_id, month_key, category, iso or raw_date, name, cost, location,
+                           file_source)
+
+            conn.executemany(
+                "INSERT INTO transactions (upload_id, user_id, month, category, date, name, cost, location, "
+                "file_source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows(),
+            )
+            conn.executemany(UPSERT_ROLLUP, [(user_id, month_key, category, *aggregate)
+                                             for (month_key, category), aggregate in aggregates.items()])
+            conn.execute(
+                "INSERT INTO user_versions (user_id, version, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                (user_id, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {"upload_id": upload_id, "rows": len(columns)}
+
+    def add_viz(self, user_id: str, nodes: Sequence[dict], parent_child_map: Dict, month: Optional[str] = None,
+                source: Optional[str] = None, upload_key: Optional[str] = None) -> dict:
+        """Bulk-insert the transactions of a nodes / parent_child_map result."""
+        return self.add_columns(user_id, columns_from_viz(nodes, parent_child_map), month=month, source=source,
+                                upload_key=upload_key)
+
+    def query(self, user_id: str, month_from: Optional[str] = None, month_to: Optional[str] = None,
+              category: Optional[str] = None, date_from: Optional[str] = None,
+              date_to: Optional[str] = None) -> List[sqlite3.Row]:
+        """Transactions of one user in a month and/or date range (inclusive), in upload order."""
+        clauses, params = ["user_id = ?"], [user_id]
+        if month_from is not None:
+            clauses.append("month >= ?")
+            params.append(check_month(month_from))
+        if month_to is not None:
+            clauses.append("month <= ?")
+            params.append(check_month(month_to))
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if date_from is not None:
+            clauses.append("date >= ?")
+            params.append(normalize_date(date_from) or date_from)
+        if date_to is not None:
+            clauses.append("date <= ?")
+            params.append(normalize_date(date_to) or date_to)
+        return self._connect().execute(
+            f"SELECT category, date, name, cost, location, file_source FROM transactions "
+            f"WHERE {' AND '.join(clauses)} ORDER BY id",
+            params,
+        ).fetchall()
+
+    def query_viz(self, user_id: str, **filters) -> Tuple[dict, Dict[int, List[int]]]:
+        """query() rebuilt as ({"nodes": [...]}, parent_child_map), same layout as convert_data_to_viz."""
+        rows = self.query(user_id, **filters)
+        detail_fields = [field for field in DETAIL_FIELDS
+                         if field in STORED_DETAIL_FIELDS and any(row[field] is not None for row in rows)]
+        columns = TransactionColumns(detail_fields)
+        for row in rows:
+            columns.append(row["name"], row["cost"], row["category"], **{field: row[field] for field in detail_fields})
+        return build_viz(columns)
+
+    def months(self, user_id: str) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT DISTINCT month FROM rollups WHERE user_id = ? ORDER BY month", (user_id,)
+        ).fetchall()
+        return [row["month"] for row in rows]
+
+    def version(self, user_id: str) -> str:
+        """Changes with every upload of this user ("0" before the first); usable as an ETag."""
+        row = self._connect().execute(
+            "SELECT version, updated_at FROM user_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return f"{row['version']}.{int(row['updated_at'] * 1000)}" if row is not None else "0"
+
+    def rollups(self, user_id: str, month_from: Optional[str] = None, month_to: Optional[str] = None,
+                category: Optional[str] = None) -> List[dict]:
+        """Per month x category total / count / min / max of one user, by month then category."""
+        clauses, params = ["user_id = ?"], [user_id]
+        if month_from is not None:
+            clauses.append("month >= ?")
+            params.append(check_month(month_from))
+        if month_to is not None:
+            clauses.append("month <= ?")
+            params.append(check_month(month_to))
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        rows = self._connect().execute(
+            f"SELECT month, category, total, count, min_cost, max_cost FROM rollups "
+            f"WHERE {' AND '.join(clauses)} ORDER BY month, category",
+            params,
+        ).fetchall()
+        return [{"month": row["month"], "category": row["category"], "total": round(row["total"], 2),
+                 "count": row["count"], "min": row["min_cost"], "max": row["max_cost"]} for row in rows]
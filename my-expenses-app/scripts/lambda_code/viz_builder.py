@@ -0,0 +1,234 @@
+"""
+Columnar transaction store and node / parent_child_map builder.
+Long histories (50k+ transactions) are kept as flat columns - costs and
+category ids in typed arrays, categories interned once - instead of one
+object per transaction, and the visualization is built straight from the
+columns.
+
+Node layout matches Document.convert_data_to_viz: root at 0, then each
+category node just before its first transaction, transactions in order.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from lazy_imports import lazy_import
+
+# Loaded on first build (requests answered from the cache or rejected never need it)
+np = lazy_import("numpy")
+
+
+# description is the raw statement / CSV merchant text (what the classifier sees at predict time)
+DETAIL_FIELDS = ("date", "location", "file_source", "description")
+
+
+class TransactionColumns:
+    """
+    Append-only columnar store.
+
+    Args:
+        detail_fields: Optional per-transaction string columns copied into
+            transaction nodes (process_amz uses all of DETAIL_FIELDS, CSV
+            uploads date/description)
+    """
+
+    def __init__(self, detail_fields: Sequence[str] = DETAIL_FIELDS):
+        self.names: List[str] = []
+        self.costs = array("d")
+        self.category_ids = array("i")
+        self.categories: List[str] = []
+        self.category_lookup: Dict[str, int] = {}
+        self.details: Dict[str, List[Optional[str]]] = {field: [] for field in detail_fields}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def category_id(self, parenttag: str) -> int:
+        category_id = self.category_lookup.get(parenttag)
+        if category_id is None:
+            category_id = self.category_lookup[parenttag] = len(self.categories)
+            self.categories.append(parenttag)
+        return category_id
+
+    def append(self, name: str, cost: float, parenttag: str, **details) -> None:
+        self.names.append(name)
+        self.costs.append(float(cost))
+        self.category_ids.append(self.category_id(parenttag))
+        for field, column in self.details.items():
+            column.append(details.get(field))
+
+    def extend_items(self, items: Iterable) -> None:
+        """Append Item-like objects (name, cost, parenttag and any detail fields)."""
+        detail_columns = list(self.details.items())
+        lookup = self.category_lookup
+        for item in items:
+            self.names.append(item.name)
+            self.costs.append(float(item.cost))
+            category_id = lookup.get(item.parenttag)
+            self.category_ids.append(category_id if category_id is not None else self.category_id(item.parenttag))
+            for field, column in detail_columns:
+                column.append(getattr(item, field, None))
+
+    @classmethod
+    def from_items(cls, items: Iterable, detail_fields: Sequence[str] = DETAIL_FIELDS) -> "TransactionColumns":
+        columns = cls(detail_fields)
+        columns.extend_items(items)
+        return columns
+
+    def category_totals(self) -> Dict[str, float]:
+        """Summed cost per category name."""
+        sums = np.bincount(np.frombuffer(self.category_ids, dtype=np.int32),
+                           weights=np.frombuffer(self.costs, dtype=np.float64), minlength=len(self.categories))
+        return dict(zip(self.categories, sums.tolist()))
+
+
+def build_viz(columns: TransactionColumns, root_name: str = "Expenses") -> Tuple[dict, Dict[int, List[int]]]:
+    """
+    Build ({"nodes": [...]}, parent_child_map) from the columns.
+
+    Node indices are computed vectorized: a transaction's index is its row
+    position plus one (root) plus the number of categories first seen at or
+    before it.
+    """
+    n = len(columns)
+    nodes: List[Optional[dict]] = [None] * (n + len(columns.categories) + 1)
+    nodes[0] = {"name": root_name, "index": 0}
+    if n == 0:
+        return {"nodes": nodes[:1]}, {}
+
+    category_ids = np.frombuffer(columns.category_ids, dtype=np.int32)
+    first_seen = np.zeros(n, dtype=bool)
+    used_categories, first_rows = np.unique(category_ids, return_index=True)
+    first_seen[first_rows] = True
+    transaction_index = np.arange(1, n + 1) + np.cumsum(first_seen)
+
+    category_index = np.zeros(len(columns.categories), dtype=np.int64)
+    category_index[used_categories] = transaction_index[first_rows] - 1
+
+    # Children grouped by category, row order kept (stable sort)
+    order = np.argsort(category_ids, kind="stable")
+    sorted_ids = category_ids[order]
+    bounds = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1], True])
+    parent_child_map: Dict[int, List[int]] = {}
+    for start, end in sorted(zip(bounds[:-1], bounds[1:]), key=lambda b: category_index[sorted_ids[b[0]]]):
+        parent = int(category_index[sorted_ids[start]])
+        parent_child_map[parent] = transaction_index[order[start:end]].tolist()
+
+    for category_id in used_categories.tolist():
+        index = int(category_index[category_id])
+        nodes[index] = {"name": columns.categories[category_id], "index": index}
+
+    names = columns.names
+    costs = columns.costs.tolist()
+    detail_items = list(columns.details.items())
+    for row, index in enumerate(transaction_index.tolist()):
+        node = {"name": names[row], "cost": costs[row], "index": index}
+        for field, column in detail_items:
+            node[field] = column[row]
+        nodes[index] = node
+
+    return {"nodes": nodes}, parent_child_map
+
+
+def columns_from_viz(nodes: Sequence[dict], parent_child_map: Dict,
+                     detail_fields: Optional[Sequence[str]] = None) -> TransactionColumns:
+    """
+    Transactions of an existing visualization back as columns (category =
+    parent node name). detail_fields defaults to the DETAIL_FIELDS present
+    on the nodes.
+    """
+    by_index = {int(node["index"]): node for node in nodes}
+    if detail_fields is None:
+        detail_fields = [field for field in DETAIL_FIELDS if any(field in node for node in nodes)]
+    columns = TransactionColumns(detail_fields)
+    for parent, children in parent_child_map.items():
+        category = by_index[int(parent)]["name"]
+        for child in children:
+            node = by_index[int(child)]
+            columns.append(node["name"], node.get("cost", 0), category,
+                           **{field: node.get(field) for field in detail_fields})
+    return columns
+
+
+def _node_lookup(nodes: List[dict]):
+    """
+    (index -> node function, next free index). Nodes stored at their own
+    index (builder output) are looked up in the list itself, otherwise by a
+    dict; either way this is one pass over the nodes.
+    """
+    if all(int(node["index"]) == position for position, node in enumerate(nodes)):
+        return nodes.__getitem__, len(nodes)
+    by_index = {int(node["index"]): node for node in nodes}
+    return by_index.__getitem__, max(by_index) + 1
+
+
+def append_viz(nodes: List[dict], parent_child_map: Dict, columns: TransactionColumns) -> dict:
+    """
+    Append new transactions to an existing node list / parent_child_map in place.
+
+    Existing category nodes are reused by name and new categories and
+    transactions get the next free indices, so every existing index stays
+    valid. Root and category "cost" totals are updated incrementally (a
+    total missing on an existing node is initialized once from its children).
+    Cost is proportional to the new data plus the number of categories.
+
+    Args:
+        nodes: Existing nodes (root at index 0), modified in place
+        parent_child_map: Existing map (int or JSON string keys), modified in place
+        columns: New transactions
+
+    Returns:
+        Stats dict (transactions_added, categories_added, categories_reused)
+    """
+    if not nodes:
+        nodes.append({"name": "Expenses", "index": 0})
+    node_at, next_index = _node_lookup(nodes)
+    root = node_at(0)
+
+    # Category name -> (node, children list); categories are few, so this scan is cheap
+    categories = {}
+    for key, children in parent_child_map.items():
+        if int(key) != 0:
+            categories[node_at(int(key))["name"]] = (node_at(int(key)), children)
+
+    def ensure_total(node, children):
+        if "cost" not in node:
+            node["cost"] = sum(node_at(int(child)).get("cost", 0) for child in children)
+
+    if "cost" not in root:
+        for node, children in categories.values():
+            ensure_total(node, children)
+        root["cost"] = sum(node.get("cost", 0) for node, _ in categories.values())
+
+    stats = {"transactions_added": len(columns), "categories_added": 0, "categories_reused": 0}
+    touched = set()
+    costs = columns.costs.tolist()
+    category_ids = columns.category_ids.tolist()
+    detail_items = list(columns.details.items())
+
+    for row in range(len(columns)):
+        name = columns.categories[category_ids[row]]
+        if name not in categories:
+            category_node = {"name": name, "index": next_index, "cost": 0.0}
+            nodes.append(category_node)
+            parent_child_map[next_index] = []
+            categories[name] = (category_node, parent_child_map[next_index])
+            next_index += 1
+            stats["categories_added"] += 1
+            touched.add(name)
+        elif name not in touched:
+            ensure_total(*categories[name])
+            stats["categories_reused"] += 1
+            touched.add(name)
+
+        category_node, children = categories[name]
+        node = {"name": columns.names[row], "cost": costs[row], "index": next_index}
+        for field, column in detail_items:
+            node[field] = column[row]
+        nodes.append(node)
+        children.append(next_index)
+        category_node["cost"] += costs[row]
+        root["cost"] += costs[row]
+        next_index += 1
+
+    return stats
@@ -0,0 +1,111 @@
+"""
+Streaming (NDJSON / SSE) records for upload responses.
+Category and transaction nodes are emitted with their final indices as soon
+as each PDF or CSV chunk finishes, followed by one summary record carrying
+the root node, parent_child_map, stats and errors.
+
+Record shapes:
+    {"type": "category", "index": 1, "name": "Food & Dining"}
+    {"type": "transaction", "index": 2, "parent": 1, "name": ..., "cost": ..., ...}
+    {"type": "error", "source": 3, "message": "..."}
+    {"type": "summary", "root": {...}, "parent_child_map": {...}, "category_totals": {...},
+     "stats": {...}, "errors": [...]}
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional
+
+from batch_merge import BatchMerger
+from viz_builder import TransactionColumns, build_viz
+
+STREAM_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def negotiate_stream_mode(flag: Optional[str] = None, accept: Optional[str] = None) -> Optional[str]:
+    """
+    Pick a streaming mode from an explicit flag ("ndjson"/"sse") or an Accept header.
+    Returns None for the default all-at-once JSON body.
+    """
+    if flag:
+        flag = str(flag).lower()
+        if flag in STREAM_CONTENT_TYPES:
+            return flag
+        if flag in ("1", "true"):
+            return "ndjson"
+    if accept:
+        for mode, content_type in STREAM_CONTENT_TYPES.items():
+            if content_type in accept:
+                return mode
+    return None
+
+
+def format_record(record: dict, mode: str) -> str:
+    """Serialize one record as an NDJSON line or an SSE event."""
+    payload = json.dumps(record)
+    if mode == "sse":
+        return f"event: {record.get('type', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def node_records(nodes: Iterable[dict], parent_child_map: Dict[int, List[int]]) -> List[dict]:
+    """
+    Records for already-indexed nodes (e.g. one merged PDF): category nodes
+    first-seen in parent_child_map become "category", their children "transaction".
+    Category costs are still growing while a batch streams, so they are left
+    out here; the summary carries the final category_totals.
+    """
+    parent_of = {child: int(parent) for parent, children in parent_child_map.items() for child in children}
+    records = []
+    for node in nodes:
+        if node["index"] == 0:
+            continue
+        if node["index"] in parent_of:
+            records.append({"type": "transaction", "parent": parent_of[node["index"]], **node})
+        elif int(node["index"]) in parent_child_map or str(node["index"]) in parent_child_map:
+            records.append({"type": "category", **{k: v for k, v in node.items() if k != "cost"}})
+    return records
+
+
+class NodeStreamBuilder:
+    """
+    Streams a multi-chunk upload through the same BatchMerger the Lambda
+    batch path uses: each chunk of items becomes its own small graph
+    (build_viz) and is merged in, so node indices, category reuse and
+    totals follow the one implementation.
+    """
+
+    def __init__(self, root_name: str = "Expenses"):
+        self.merger = BatchMerger(root_name)
+
+    @property
+    def nodes(self) -> List[dict]:
+        return self.merger.nodes
+
+    @property
+    def parent_child_map(self) -> Dict[int, List[int]]:
+        return self.merger.parent_child_map
+
+    def add_items(self, items: Iterable) -> List[dict]:
+        """Merge Item-like objects (name, cost, parenttag, optional DETAIL_FIELDS); returns their records."""
+        viz, parent_child_map = build_viz(TransactionColumns.from_items(items))
+        return node_records(*self.merger.add(viz["nodes"], parent_child_map))
+
+    def root(self) -> dict:
+        return self.merger.root
+
+    def summary(self, stats: Optional[dict] = None, errors: Optional[List[str]] = None) -> dict:
+        return {
+            "type": "summary",
+            "root": self.root(),
+            "parent_child_map": self.parent_child_map,
+            "category_totals": self.merger.category_totals(),
+            "stats": {
+                "total_nodes": len(self.nodes),
+                "total_categories": len(self.parent_child_map),
+                **(stats or {}),
+            },
+            "errors": errors or [],
+        }
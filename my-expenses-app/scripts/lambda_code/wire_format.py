@@ -0,0 +1,199 @@
+"""
+Compact columnar response format for lambda_handler (opt-in with
+{"format": "columnar"} or an Accept header naming COLUMNAR_CONTENT_TYPE).
+Instead of one dict per node, transactions are parallel arrays with the
+category as a position in a category dictionary, so keys aren't repeated
+per transaction. Optionally gzip-compressed ({"compress": "gzip"} or
+Accept-Encoding: gzip), and encoded with orjson when it is installed.
+
+    {"format": "columnar", "version": 1,
+     "root": {"name": "Expenses", "index": 0, "cost": 123.4},
+     "categories": {"index": [1, 5], "name": ["Food & Dining", "Travel"], "cost": [...]},
+     "transactions": {"index": [2, 3, 6], "category": [0, 0, 1], "name": [...], "cost": [...],
+                      "date": [...], "location": [...], "file_source": [...]},
+     "other": [...]}
+
+A category's children are its transactions in array order, so
+from_columnar() gives back the same nodes and parent_child_map.
+"""
+
+import json
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COLUMNAR_CONTENT_TYPE = "application/vnd.expenses.columnar+json"
+COLUMNAR_VERSION = 1
+
+# Keys every transaction column set has; anything else on a node becomes its own column
+BASE_FIELDS = ("index", "name", "cost")
+# Column holding the category position (a node field of that name can't be carried)
+RESERVED_FIELDS = BASE_FIELDS + ("category",)
+
+
+def negotiate_wire_format(flag: Optional[str] = None, accept: Optional[str] = None) -> Optional[str]:
+    """"columnar" from an explicit flag or an Accept header; None for the default node list."""
+    if flag:
+        flag = str(flag).lower()
+        if flag == "columnar":
+            return flag
+        if flag != "nodes":
+            raise ValueError(f"Unknown response format {flag!r} (expected 'nodes' or 'columnar')")
+        return None
+    if accept and COLUMNAR_CONTENT_TYPE in accept:
+        return "columnar"
+    return None
+
+
+def negotiate_compression(flag: Any = None, accept_encoding: Optional[str] = None) -> Optional[str]:
+    """"gzip" if the request asks for it (flag wins over Accept-Encoding), else None."""
+    if flag is not None and flag != "":
+        return "gzip" if str(flag).lower() in ("gzip", "1", "true") else None
+    if accept_encoding and "gzip" in accept_encoding.lower():
+        return "gzip"
+    return None
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes, via orjson when available (int dict keys allowed either way)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Something orjson won't take (e.g. an int too large for 64 bits); json handles it
+            pass
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def to_columnar(nodes: Sequence[dict], parent_child_map: Dict) -> dict:
+    """Columnar form of a nodes / parent_child_map result (see module docstring)."""
+    by_index = {int(node["index"]): node for node in nodes}
+    root = by_index.get(0, {"name": "Expenses", "index": 0})
+
+    categories: Dict[str, list] = {"index": [], "name": []}
+    category_costs: List[Optional[float]] = []
+    transactions: Dict[str, list] = {"index": [], "category": [], "name": [], "cost": []}
+    placed = {0}
+
+    for parent, children in parent_child_map.items():
+        parent = int(parent)
+        if parent == 0:
+            continue
+        category = by_index[parent]
+        position = len(categories["index"])
+        categories["index"].append(parent)
+        categories["name"].append(category["name"])
+        category_costs.append(category.get("cost"))
+        placed.add(parent)
+
+        for child in children:
+            node = by_index[int(child)]
+            row = len(transactions["index"])
+            placed.add(node["index"])
+            transactions["index"].append(node["index"])
+            transactions["category"].append(position)
+            transactions["name"].append(node.get("name"))
+            transactions["cost"].append(node.get("cost"))
+            for field, value in node.items():
+                if field in RESERVED_FIELDS:
+                    continue
+                column = transactions.get(field)
+                if column is None:
+                    # First node with this field; earlier rows didn't have it
+                    column = transactions[field] = [None] * row
+                column.append(value)
+            for field, column in transactions.items():
+                if len(column) == row:
+                    column.append(None)
+
+    if any(cost is not None for cost in category_costs):
+        categories["cost"] = category_costs
+
+    return {
+        "format": "columnar",
+        "version": COLUMNAR_VERSION,
+        "root": root,
+        "categories": categories,
+        "transactions": transactions,
+        # Nodes outside the category tree, as-is (normally none)
+        "other": [node for node in nodes if int(node["index"]) not in placed],
+    }
+
+
+def from_columnar(payload: dict) -> Tuple[List[dict], Dict[int, List[int]]]:
+    """Nodes (sorted by index) and parent_child_map back from to_columnar() output."""
+    categories, transactions = payload["categories"], payload["transactions"]
+    nodes = [dict(payload["root"])]
+    parent_child_map: Dict[int, List[int]] = {}
+
+    category_costs = categories.get("cost")
+    for position, (index, name) in enumerate(zip(categories["index"], categories["name"])):
+        node = {"name": name, "index": index}
+        if category_costs is not None and category_costs[position] is not None:
+            node["cost"] = category_costs[position]
+        nodes.append(node)
+        parent_child_map[index] = []
+
+    extra_fields = [(field, column) for field, column in transactions.items() if field not in RESERVED_FIELDS]
+    for row, index in enumerate(transactions["index"]):
+        node = {"name": transactions["name"][row], "cost": transactions["cost"][row], "index": index}
+        for field, column in extra_fields:
+            node[field] = column[row]
+        nodes.append(node)
+        parent_child_map[categories["index"][transactions["category"][row]]].append(index)
+
+    nodes.extend(dict(node) for node in payload.get("other", []))
+    nodes.sort(key=lambda node: node["index"])
+    return nodes, parent_child_map
+
+
+def _member(key: Any, value: Any) -> bytes:
+    """One '"key":value' object member."""
+    return dumps(str(key)) + b":" + dumps(value)
+
+
+def columnar_body(body: dict, compression: Optional[str] = None) -> Tuple[bytes, dict]:
+    """
+    Encode a handler response body with "output" / "parent_child_map"
+    replaced by "columnar", optionally gzipped.
+
+    Returns:
+        Tuple of (encoded body, wire stats). The stats are also added to
+        body["stats"]["wire"]; their sizes are for the body without that block.
+    """
+    started = time.perf_counter()
+    stats = body.get("stats") or {}
+    compact = {key: value for key, value in body.items() if key not in ("output", "parent_child_map", "stats")}
+    compact["columnar"] = to_columnar(body.get("output") or [], body.get("parent_child_map") or {})
+    # The object is written member by member with stats last and left open, so the
+    # wire block (which measures everything before it) can be appended without
+    # encoding the body again
+    stats_members = [_member(key, value) for key, value in stats.items() if key != "wire"]
+    head = b"{" + b"".join(_member(key, value) + b"," for key, value in compact.items())
+    head += b'"stats":{' + b",".join(stats_members)
+    separator = b"," if stats_members else b""
+
+    wire = {"format": "columnar", "encoder": "orjson" if orjson is not None else "json",
+            "encoding": compression or "identity", "json_bytes": len(head) + 2}
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        chunks = [compressor.compress(head), compressor.flush(zlib.Z_SYNC_FLUSH)]
+        wire["bytes"] = sum(len(chunk) for chunk in chunks)
+    else:
+        wire["bytes"] = wire["json_bytes"]
+    wire["encode_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    tail = separator + b'"wire":' + dumps(wire) + b"}}"
+    if compression == "gzip":
+        chunks += [compressor.compress(tail), compressor.flush()]
+        payload = b"".join(chunks)
+    else:
+        payload = head + tail
+    if "stats" in body:
+        body["stats"]["wire"] = wire
+    return payload, wire